@@ -1,747 +1,2251 @@
-import cmd
-import time
-import datetime
-import textwrap
-import pickle
-import os
-import sys
-import argparse
-from thread import start_new_thread
-try:
-    import pyreadline
-except:
-    print ("Warning: Auto-completion won't work on Windows without the "
-           "pyreadline module")
-
-
-class TaskCLI(cmd.Cmd):
-    """CLI that can be used to carry out simple operations."""
-    def __init__(self):
-        # Initiate the base class.
-        cmd.Cmd.__init__(self)
-        # Overwrite the prompt with a custom version.
-        self._set_new_prompt(text="")
-
-        self._tasks = {}
-        self._current_task = None
-        self.messages = []
-        self.date = datetime.datetime.fromtimestamp(
-                                              time.time()).strftime("%d-%m-%Y")
-
-        # Wrapper for formatting long strings
-        self._wrapper = self._get_wrapper()
-
-        # Get the logfile.
-        self._logfile = self._get_logfile()
-        self._log("Started TaskCLI")
-
-        # Create the object that contains the shortcuts.
-        self._shortcut = Shortcut()
-
-    def reset(self):
-        # Save off the BaseCLI and subsequently all child objects.
-        pickle.dump(self, open("%s.p" % self.date, "wb"))
-        
-        # Reset the class values now they've been saved off
-        self._current_task = None
-        self._tasks = {}
-        self.messages = []
-        self._set_new_prompt(text="")
-        self.date = datetime.datetime.fromtimestamp(
-                                              time.time()).strftime("%d-%m-%Y")
-        self.__setstate__(self.__dict__)
-        self._log("Reset TaskCLI")
-
-    def __getstate__(self):
-        self._log("Saving TaskCLI data")
-        del self.__dict__["stdout"]
-        del self.__dict__["stdin"]
-        del self.__dict__["_wrapper"]
-        del self.__dict__["_logfile"]
-        del self.__dict__["_shortcut"]
-        return self.__dict__
-
-    def __setstate__(self, d):
-        self.__dict__ = d
-        self.__dict__["stdout"] = sys.stdout
-        self.__dict__["stdin"] = sys.stdin
-        self.__dict__["_wrapper"] = self._get_wrapper()
-        self.__dict__["_logfile"] = self._get_logfile()
-        self.__dict__["_shortcut"] = Shortcut()
-        self._log("Restarting TaskCLI")
-
-    def do_M(self, line):
-        """do_M
-
-        Purpose: Logs a line of text to the log file.
-
-        Params:  line - The line of text to be logged.
-
-        Returns: Nothing.
-        """
-        self.messages.append(self._log(line))
-
-    def help_M(self):
-        description = ("Logs a line of text to the output file.")
-        arguments = {"line" : "The line to be logged to file"}
-        self._help_text(description=description,
-                        arguments=arguments)
-
-    def do_SC(self, text):
-        """do_SC
-
-        Purpose: Takes a line of text and passes it to the Shortcut class. If
-                 the text matches a shortcut in the class it will be executed.
-
-        Returns: Nothing
-        """
-        try:
-            print self._shortcut.run_cmd(text)
-            self._log("SC: %s" % text)
-        except:
-            pass
-
-    def help_SC(self):
-        description = ("Pass text to SC to execute a shortcut")
-        arguments = {"text" : "The text to be passed to SC"}
-        self._help_text(description=description,
-                        arguments=arguments)
-
-    def do_addtask(self, task):
-        """do_addtask
-
-        Purpose: Creates a new Task that time can be tracked against and
-                 notes added to.
-
-        Params:  task - The name of the Task.
-
-        Returns: Nothing.
-        """
-        if "-" in task:
-            self._to_screen("Task names must not contain '-'")
-            return
-
-        try:
-            task_name = "-".join([self._current_task.name, task])
-        except:
-            task_name = task
-
-        if task_name in self._tasks:
-            self._to_screen("Task already exists, please choose another name."
-                            "\nCurrent tasks are:\n  %s" %
-                            "\n  ".join(self._tasks))
-            return
-        else:
-            new_task = Task(name=task_name,
-                            parent=self._current_task)
-            self._tasks[task_name] = new_task
-            self._to_screen("Created new task of name: %s" % task_name)
-            self._log("Added a new task: %s" % task_name)
-
-    def help_addtask(self):
-        description = ("Creates a new task. Once the task is started "
-                       "notes can be made against it and the time "
-                       "spent on the task is tracked. Tasks themselves "
-                       "can have subtasks.")
-        arguments = {"task" : "The name of the task, must be unique."}
-        self._help_text(description=description,
-                        arguments=arguments)
-
-    def do_starttask(self, task):
-        """do_starttask
-
-        Purpose: Calls start on the Task and enters the task's CLI.
-
-        Params:  task - The task that we want to start
-
-        Returns: Noting.
-        """
-        try:
-            task = self._tasks[task]
-        except:
-            self._to_screen("No Task exists of that name. Current tasks are:"
-                            "\n  %s" % "\n  ".join(self._tasks))
-            return
-
-        # Check that the only running tasks are parents of this task.
-        if self._current_task != task.parent:
-            self._to_screen("Unable to start this task Either another task is "
-                            "already running, this task has a parent task "
-                            "which hasn't been started yet or this task is "
-                            "already running.")
-        else:
-            task.start()
-            self._set_new_prompt(text=task.name)
-            self._current_task = task
-            self._log("Started Task: %s" % self._current_task.name)
-
-    def help_starttask(self):
-        description = ("Starts an existing task. Once the task is "
-                       "started notes can be made against it and the "
-                       "time spent on the task is tracked.")
-        arguments = {"task" : "The name of the task to start."}
-        self._help_text(description=description,
-                        arguments=arguments)
-
-    def complete_starttask(self, text, line, begidx, endidx):
-        """complete_starttask
-
-        Purpose: Provides autocomplete functionality for the starttask
-                 command.
-
-        Return:  Nothing
-        """
-        if not text:
-            completions = self._tasks.keys()
-        else:
-            completions = [t for t in self._tasks if
-                           t.startswith(text)]
-        return completions
-
-    def do_stoptask(self, line):
-        """do_stoptask
-
-        Purpose: Stop the current running task.
-
-        Returns: Nothing
-        """
-        try:
-            self._current_task.stop()
-            self._log("Stopped Task: %s" % self._current_task.name)
-        except:
-            self._to_screen("No tasks currently running.")
-            return
-
-        self._current_task = self._current_task.parent
-        try:
-            self._set_new_prompt(text=self._current_task.name)
-        except:
-            self._set_new_prompt(text="")
-
-    def help_stoptask(self):
-        description = ("Stop's the current running task. If the task had a "
-                       "parent it drops back down to the parent.")
-        arguments = {}
-        self._help_text(description=description,
-                        arguments=arguments)
-
-    def emptyline(self):
-        pass
-
-    def do_EOF(self, line):
-        self.do_exit(line)
-
-    def do_exit(self, line):
-        """do_exit
-
-        Purpose: Called to exit the Base CLI and pickle the current tasks so
-                 that we don't lose the data.
-
-        Returns: Nothing
-        """
-        # Stop all running tasks and return the CLI to the start before saving.
-        for task in self.get_tasks(status="Running"):
-            task.stop()
-        self._current_task = None
-        self._set_new_prompt(text="")
-
-        self._log("Exiting TaskCLI")
-        self._log("\n" + self.do_times("", user_called=False))
-
-        # Use the date as the filename.
-        filename = "%s.p" % self.date
-
-        # Save off the BaseCLI and subsequently all child objects.
-        pickle.dump(self, open(filename, "wb"))
-
-        print "Exiting"
-        return True
-
-    def help_exit(self):
-        """help_exit
-
-        Pupose: Prints the help text for do_exit when help exit is
-                called.
-        """
-        description = ("This exits the CLI and saves off any data in a python "
-                       "picklr file.")
-        arguments = {}
-        self._help_text(description=description,
-                        arguments=arguments)
-
-    def do_times(self, line, user_called=True):
-        """do_times
-
-        Purpose: Prints the times for all tasks below this object.
-
-        Returns: The details printed to screen.
-        """
-        task_times = {}
-        print_out = ""
-
-        # Get they times for all sub tasks.
-        for task in self._tasks.values():
-            task_times[task.name] = self._format_timers(task)
-
-        for task, details in sorted(task_times.items(),
-                                    key=lambda x: x[1]):
-            for detail in details:
-                print_out += detail + "\n"
-            print_out += "\n"
-
-        if user_called:
-            print print_out
-        else:
-            return print_out
-
-    def help_times(self):
-        description = "Prints the time spent on tasks."
-        arguments = {}
-        self._help_text(arguments=arguments,
-                        description=description)
-
-    def do_tasks(self, line):
-        """do_tasks
-
-        Purpose: Prints a list of all the current tasks.
-        """
-        for task in self._tasks.values():
-            print task.name
-
-    def help_tasks(self):
-        description = "Prints a list of all tasks."
-        arguments = {}
-        self._help_text(arguments=arguments,
-                        description=description)
-
-    def help_help(self):
-        description = ("Returns instructions on how to use a command. Can be "
-                       "called with 'help' <command> or '?' <command>.")
-        arguments = {"command": "The command you require help with"}
-        self._help_text(arguments=arguments,
-                        description=description)
-
-    def _format_timers(self, task):
-        """_format_timers
-        """
-        title    = "Task: %s" % task.name
-        headers  = "DATE\t\t START\t STOP\t TOTAL\t STATUS"
-        template = "%s\t %s\t %s\t %s\t %s"
-        footer   = "TOTAL:\t\t \t \t %s\t %s"
-        task_times = []
-        task_times.append(title)
-        task_times.append(headers)
-        total_status = task.status
-        total_time = 0
-        for timer in task.timers:
-            date, start = timer.start_time()
-            dummy, stop = timer.stop_time()
-            time_secs   = timer.total_time().total_seconds()
-            time_str    = format_seconds(time_secs)
-            status      = timer.status
-
-            line = template % (date, start, stop, time_str, status)
-            task_times.append(line)
-
-            if time_secs:
-                total_time += time_secs
-
-        final_line = footer % (format_seconds(total_time), total_status)
-        task_times.append(final_line)
-
-        return task_times
-
-    def _set_new_prompt(self, text=None):
-        """ _set_new_prompt
-
-        Purpose: Adds text to the pronpt that is displated to the user.
-
-        Params:  text - The text to add to the prompt template.
-
-        Returns: Nothing.
-        """
-        prompt_template = "SL %s#:"
-        if text:
-            self.prompt = prompt_template % text
-        else:
-            self.prompt = prompt_template % ""
-
-    def _help_text(self, arguments={}, description=""):
-        """_help_text
-
-        Purpose: prints all help text in a generic format
-
-        Params:  arguments - a Dictionary with the arguments as key and
-                             a description of the argument as an entry.
-                 description - a description of the function.
-
-        Returns: None
-        """
-        print "\n".join(self._wrapper.wrap(description))
-        if arguments:
-            print ""
-            print "Arguments:"
-        for argument in arguments:
-            text = " <%s> - %s" % (argument, arguments[argument])
-            joiner = "\n      " + " " * len(argument)
-            print joiner.join(self._wrapper.wrap(text))
-
-    def _get_wrapper(self):
-        return textwrap.TextWrapper(width=50)
-
-    def _to_screen(self, message):
-        for line in self._get_wrapper().wrap(message):
-            print line
-
-    def get_tasks(self,
-                  status=None,
-                  parent=None):
-        filters = []
-
-        if status:
-            filters.append(lambda x: x.status == status)
-
-        if parent:
-            if parent == "None":
-                filters.append(lambda x: x.parent == None)
-            else:
-                filters.append(lambda x: x.parent == parent)
-
-        return self._apply_filters(self._tasks.values(), filters)
-
-    def _apply_filters(self, list_to_be_filtered, list_of_filters):
-        if not list_of_filters:
-            return list_to_be_filtered
-        else:
-            return [elem for elem in list_to_be_filtered if False not in
-                       [test(elem) for test in list_of_filters]]
-
-    def _get_logfile(self):
-        filename = "cli_logs-%s.txt" % self.date
-        return open(filename, "a")
-
-    def _log(self, message):
-        timestamp = datetime.datetime.fromtimestamp(
-            time.time()).strftime("%H:%M:%S")
-        task_name = " " if not self._current_task else self._current_task.name
-        line = (timestamp, task_name, message)
-        self._logfile.write("\n[%s] [%s] %s" % line)
-        return line
-
-
-class Task():
-    """The Task CLI used when Tasks are created."""
-    def __init__(self, name, parent):
-        self._name   = name
-        self._timers = []
-        self._timer  = None
-        self._parent = parent
-        self._status = "Stopped"
-
-    def start(self):
-        """Called to start the task. Kicks off a Timer."""
-        if not self._timer:
-            self._timer = Timer()
-            self._timers.append(self._timer)
-            self._status = "Running"
-        else:
-            print "Warning: Task %s already started!" % self._name
-
-    def stop(self):
-        """Called to stop the Task and to stop the Timer and archive it."""
-        try:
-            self._timer.stop()
-            self._timer = None
-            self._status = "Stopped"
-        except:
-            print "Warning: Task %s was not timing!" % self._name
-
-    @property
-    def name(self):
-        """Getter for the Tasks name."""
-        return self._name
-
-    @property
-    def parent(self):
-        """Getter for the Tasks parent."""
-        return self._parent
-
-    @property
-    def status(self):
-        """Returns the status of the task, either "Running" or "Stopped"."""
-        return self._status
-
-    @property
-    def timers(self):
-        """Returns all the tasks Timers."""
-        return self._timers
-
-
-class Timer():
-    """Class for timing things."""
-    def __init__(self):
-        self._start_time = None
-        self._stop_time = None
-        self._status = None
-        self.start()
-
-    def start(self):
-        """Starts the timer."""
-        self._start_time = datetime.datetime.fromtimestamp(time.time())
-        self._status = "Running"
-
-    def stop(self):
-        """Stops the timer."""
-        self._stop_time = datetime.datetime.fromtimestamp(time.time())
-        self._status = "Stopped"
-
-    def start_time(self):
-        """ Returns the start time.
-
-        Returns: as a tuple:
-            date - date as a string: Mon DD-MM-YYYY
-            time - time as a string: HH:MM
-        """
-        return self._start_time.strftime("%a %d-%m-%Y"), \
-               self._start_time.strftime("%H:%M")
-
-    def stop_time(self):
-        """ Returns the stop time.
-
-        Returns: as a tuple:
-            date - date as a string: Mon DD-MM-YYYY
-            time - time as a string: HH:MM
-        """
-        try:
-            return self._stop_time.strftime("%a %d-%m-%Y"), \
-                   self._stop_time.strftime("%H:%M")
-        except:
-            return None, None
-
-    def total_time(self):
-        """ Returns the difference between start and stop time.
-
-        Returns: a datetime.timedelta object
-        """
-        try:
-            return self._stop_time - self._start_time
-        except:
-            return datetime.datetime.fromtimestamp(time.time()) - \
-                   self._start_time
-
-    @property
-    def status(self):
-        """ Returns: The current status: "Stopped" OR "Running" """
-        return self._status
-
-
-class Shortcut():
-    def __init__(self):
-        self._const = {
-            "ssh":       (self._ssh, "tool for sshing"),
-            "unit_test": (self._unit_test, "unit testing utility")
-        }
-
-    def run_cmd(self, text):
-        cmd, args = self._parse_input(text)
-
-        try:
-            func = self._const[cmd][0]
-            return func(args)
-        except:
-            return ("Shortcut '%s' does not exist, shortcuts:\n%s" % (cmd,
-                    self._summary()))
-
-    def _ssh(self, args):
-        print "ssh, %s" % args
-
-    def _unit_test(self, args):
-        return args
-
-    def _summary(self):
-        summary = ""
-        for sc in self._const:
-            summary += " %s:\t%s\n" % (sc, self._const[sc][1])
-        return summary
-
-    def _parse_input(self, text):
-        return text.split()[0], text.split()[1:]
-
-def format_seconds(seconds):
-    """format_seconds
-
-    Converts X number of seconds to a string of the format HhMMm (e.g 2h32m).
-
-    Params:  seconds - The number of seconds.
-
-    Returns: string of the formatted seconds.
-    """
-    hours = int(seconds)/(60*60)
-    mins  = (int(seconds)/60)%60
-    return "%dh%02dm" % (hours, mins)
-
-def get_sub_tasks(cli, task):
-    """get_sub_tasks
-
-    Gets the sub_tasks of a given task.
-
-    Params:  cli  - The TaskCLI object that contains the Task.
-             task - The Task object.
-
-    Returns: A list of child Tasks.
-    """
-    sub_tasks = cli.get_tasks(parent=task)
-    for sub_task in sub_tasks:
-        sub_tasks.extend(get_sub_tasks(cli, sub_task))
-    return sub_tasks
-
-def get_args():
-    parser = argparse.ArgumentParser(description="TaskCLI")
-    parser.add_argument('mode', metavar='<mode>', type=str,
-        help="Either 'CLI' (to start tool) or 'UNIT' (to run unit tests).")
-
-    args = parser.parse_args()
-
-    if args.mode in ["UNIT", "CLI"]:
-        pass
-    else:
-        parser.print_usage()
-        quit()
-
-    return args
-
-def restart_at_midnight(cli):
-    """Restarts the CLI at midnight"""
-    sleep_time = (datetime.datetime.now().replace(hour=23,
-                                                  minute=59,
-                                                  second=59,
-                                                  microsecond=999) -
-                      datetime.datetime.now()).total_seconds()
-    time.sleep(sleep_time)
-    cli.reset()
-    start_new_thread(restart_at_midnight, (cli,))
-
-def start_cli(cli, msg="Welcome to TaskCLI"):
-    start_new_thread(restart_at_midnight, (cli,))
-    cli.cmdloop(msg)
-
-def simulate_cmd(cli, cmd):
-    l = cli.precmd(cmd)
-    r = cli.onecmd(l)
-    cli.postcmd(r, l)
-
-def get_cli():
-    filename = datetime.datetime.fromtimestamp(
-        time.time()).strftime("%d-%m-%Y.p")
-    user_input = None
-    if os.path.isfile(filename):
-        while 1:
-            user_input = raw_input("Found previous data, load it? Y/N")
-            if user_input in ["Y", "N"]:
-                break
-    if user_input == "Y":
-        msg = "Welcome to the TaskCLI, Loaded previous data."
-        cli = pickle.load(open(filename, "rb"))
-    else:
-        msg = "Welcome to TaskCLI, no data to load."
-        cli = TaskCLI()
-    return cli, msg
-
-def run_unit_tests(cli=None):
-    if not cli:
-        print "Started Unit Tests\n"
-
-        """ Test Shortcut """
-        print " Testing Shortcut..."
-        sc = Shortcut()
-        # Test we pass arguments to a function
-        result = sc.run_cmd("unit_test abc 123")
-        assert result == ["abc", "123"]
-        # Test we handle duff shortcuts
-        result = sc.run_cmd("giberish sdf dg sdg ")
-        assert type(result) is str
-        print " ...Shortcut Passed.\n"
-
-        """ Test Timer """
-        print " Testing Timer..."
-        t = Timer()
-        # Check the timer is automatically started.
-        assert t.status == "Running"
-        t.stop()
-        assert t.status == "Stopped"
-        # Check the start and stop times returned.
-        assert type(t.start_time()) is tuple
-        assert type(t.start_time()[0]) is str and type(t.start_time()[1]) is str
-        assert t.start_time() == t.stop_time()
-        # Check the total seconds is a small number.
-        seconds = t.total_time().total_seconds()
-        assert seconds >= 0 and seconds <= 1
-        print " ...Timer Passed.\n"
-
-        """ Test Task """
-        print " Testing Task..."
-        # Test creation and initiation.
-        parent  = Task(name="parent", parent=None)
-        child1  = Task(name="child1", parent=parent)
-        assert (child1.name == "child1" and child1.parent == parent and
-                child1.status == "Stopped" and child1.timers == [])
-        # Check start and stop behaviour is sensible.
-        child1.stop()
-        assert (child1.status == "Stopped" and child1.timers == [])
-        for ii in range(2):
-            child1.start()
-            assert (child1.status == "Running" and len(child1.timers) == 1 and
-                    type(child1.timers[0]) is type(Timer()))
-        child1.stop()
-        assert (child1.status == "Stopped" and len(child1.timers) == 1 and
-                    type(child1.timers[0]) is type(Timer()))
-        print " ...Task Passed.\n"
-
-        """ Test TaskCLI """
-        print " Testing TaskCLI..."
-        cli = TaskCLI()
-    else:
-        print " Testing TaskCLI..."
-
-    cli.help_help()
-    cli.do_SC("dummy")
-    cli.do_M("This is the first message.")
-    cli.do_M("This is the last message.")
-    cli.do_addtask("parent_task1")
-    cli.do_addtask("parent_task2")
-    cli.do_addtask("-")
-    cli.do_starttask("parent_task1")
-    cli.do_addtask("child_task1")
-    cli.do_addtask("child_task2")
-    cli.do_starttask("parent_task1-child_task1")
-    cli.do_addtask("child_subtask")
-    cli.do_starttask("parent_task1-child_task1-child_subtask")
-    cli.do_stoptask("")
-    cli.do_stoptask("")
-    cli.do_starttask("parent_task1-child_task2")
-    cli.do_stoptask("")
-    cli.do_addtask("child_task3")
-    cli.do_starttask("parent_task1-child_task3")
-    cli.do_stoptask("")
-    cli.do_stoptask("")
-    cli.do_starttask("parent_task2")
-    cli.do_stoptask("")
-    cli.do_starttask("parent_task1")
-    cli.do_stoptask("")
-    cli.do_tasks("")
-    cli.do_times("")
-    cli.do_exit("")
-    print " ...TaskCLI Passed.\n"
-    print "All Tests Passed."
-
-if __name__ == '__main__':
-
-    args = get_args()
-
-    if args.mode == "CLI":
-        cli, msg = get_cli()
-        start_cli(cli=cli, msg=msg)
-    elif args.mode == "UNIT":
-        run_unit_tests()
-    else:
-        AssertionError("TaskCLI failed to start.")
+import cmd
+import time
+# When the module was imported, for timing how long startup takes.
+IMPORTED = time.time()
+import datetime
+import textwrap
+import pickle
+import os
+import shutil
+import sys
+import types
+import argparse
+import threading
+from array import array
+from thread import start_new_thread
+import metrics
+import rollups
+import storage
+from storage import open_storage, migrate_pickles, SQLiteStorage
+from catalog import Catalog
+from summary import summarize, write_summary, read_summary, summary_totals
+from cache import SnapshotCache
+from reports import build_report, normalise_date, summarize_day
+from rollups import rollup, hour_edges, split_hours, BUCKETS
+from export import export_records, import_records, write_records, \
+                   read_records, format_from_filename
+from utils import LogWriter, get_logger
+from messages import MessageLog
+from intervals import IntervalIndex, find_timers, to_timestamp
+from search import SearchIndex, RESULTS_PER_PAGE
+from state import DayState, changes
+from checkpoint import Checkpointer, CHECKPOINT_SECONDS
+from sessions import session_directory
+
+log = get_logger(name=__name__)
+
+# Characters in the longest bar printed by histogram.
+HISTOGRAM_WIDTH = 40
+
+# Archived days loaded by the at command, directory -> SnapshotCache.
+snapshots = {}
+
+
+class TaskCLI(cmd.Cmd):
+    """CLI that can be used to carry out simple operations."""
+    def __init__(self, directory=""):
+        # Initiate the base class.
+        cmd.Cmd.__init__(self)
+        # Overwrite the prompt with a custom version.
+        self._set_new_prompt(text="")
+        # Where the days are kept, empty for the working directory, see
+        # sessions.py.
+        self._directory = directory
+
+        self._tasks = {}
+        # Index of parent task name -> child Tasks, and the top level Tasks.
+        self._children = {}
+        self._roots = []
+        # Index of the stopped timers, see at().
+        self._intervals = IntervalIndex()
+        self._current_task = None
+        self.date = datetime.datetime.fromtimestamp(
+                                              time.time()).strftime("%d-%m-%Y")
+        self.messages = MessageLog(self.date, self._directory)
+
+        # Sequence number of the last command stored.
+        self._seq = 0
+        # Set while replaying the journal, see replay().
+        self._replaying = False
+        self._clock = None
+        # Set while running a batch of commands, see run_batch().
+        self._batch = False
+        # When the command being run was started, see precmd().
+        self._command_started = None
+        # Full-text index of every day's messages and tasks, see search().
+        self._search = SearchIndex(directory=self._directory)
+        # Held while a command runs, so reset() can't interleave with one.
+        self._command_lock = threading.RLock()
+        # Writes checkpoints in the background, see start_checkpoints().
+        self._checkpointer = None
+
+        # Wrapper for formatting long strings
+        self._wrapper = self._get_wrapper()
+
+        # Get the logfile.
+        self._logfile = self._get_logfile()
+        self._log("Started TaskCLI")
+
+        # Create the object that contains the shortcuts.
+        self._shortcut = Shortcut()
+
+        # Where the day's data is kept, see storage.py.
+        self._storage = open_storage(self.date, self._directory)
+
+        # The latest DayState, for other threads to read, see _publish().
+        self._version = 0
+        self.state = None
+        self._published = threading.Condition()
+        self._publish()
+        # The DayState as it was when the day was last saved in full.
+        self._saved_state = self.state
+
+    def reset(self):
+        # Called from another thread, so wait for any command to finish.
+        with self._command_lock:
+            # Save off the BaseCLI and subsequently all child objects.
+            self._log("Saving TaskCLI data")
+            self._save()
+            self._storage.close()
+            self._close_logfile()
+            self._search.archive(self.state)
+
+            # Reset the class values now they've been saved off
+            self._current_task = None
+            self._tasks = {}
+            self._children = {}
+            self._roots = []
+            self._intervals = IntervalIndex()
+            self._seq = 0
+            self._set_new_prompt(text="")
+            self.date = datetime.datetime.fromtimestamp(
+                                              time.time()).strftime("%d-%m-%Y")
+            self.messages = MessageLog(self.date, self._directory)
+            self.__setstate__(self.__dict__)
+            self._log("Reset TaskCLI")
+
+    def __getstate__(self):
+        # Not logged here, as days are also pickled when they're compacted
+        # or imported into, see _save().
+        # Copy so that saving doesn't strip the live object.
+        state = self.__dict__.copy()
+        del state["stdout"]
+        del state["stdin"]
+        del state["_wrapper"]
+        del state["_logfile"]
+        del state["_shortcut"]
+        del state["_storage"]
+        del state["_replaying"]
+        del state["_batch"]
+        del state["_clock"]
+        del state["_command_started"]
+        del state["_version"]
+        del state["state"]
+        del state["_published"]
+        del state["_saved_state"]
+        del state["_command_lock"]
+        del state["_checkpointer"]
+        del state["_search"]
+        return state
+
+    def __setstate__(self, d):
+        self.__dict__ = d
+        self.__dict__["stdout"] = sys.stdout
+        self.__dict__["stdin"] = sys.stdin
+        self.__dict__["_wrapper"] = self._get_wrapper()
+        # Opened on first use so that loading an old day doesn't touch it.
+        self.__dict__["_logfile"] = None
+        self.__dict__["_shortcut"] = Shortcut()
+        # Snapshots from before days could be kept outside the working
+        # directory.
+        self.__dict__.setdefault("_directory", "")
+        self.__dict__["_storage"] = open_storage(self.date, self._directory)
+        self.__dict__["_replaying"] = False
+        self.__dict__["_batch"] = False
+        self.__dict__["_clock"] = None
+        self.__dict__["_command_started"] = None
+        # Kept across reset() so that versions only ever go up.
+        self.__dict__.setdefault("_version", 0)
+        self.__dict__["state"] = None
+        self.__dict__.setdefault("_published", threading.Condition())
+        # Kept across reset() so that it carries on checkpointing.
+        self.__dict__.setdefault("_command_lock", threading.RLock())
+        self.__dict__.setdefault("_checkpointer", None)
+        self.__dict__.setdefault("_search",
+                                 SearchIndex(directory=self._directory))
+        # Snapshots from before the journal existed.
+        self.__dict__.setdefault("_seq", 0)
+        # Snapshots from before tasks were indexed by parent.
+        if "_children" not in d:
+            self._index_tasks()
+        # Snapshots from before timers were indexed by time.
+        if "_intervals" not in d:
+            self._index_intervals()
+        # Snapshots from before tasks kept running totals.
+        if [t for t in self._tasks.values() if not hasattr(t, "_own_total")]:
+            self._total_tasks()
+        # Snapshots from before messages were kept in a MessageLog.
+        if isinstance(self.messages, list):
+            messages = self.messages
+            self.messages = MessageLog(self.date, self._directory)
+            self.messages.extend(messages)
+        self._publish()
+        # Either just loaded or a new day, so nothing has changed since.
+        self.__dict__["_saved_state"] = self.state
+
+    def replay(self, records=None):
+        """replay
+
+        Purpose: Re-runs the journalled commands that were made after the
+                 last snapshot was taken, rebuilding the state as it was.
+
+        Params:  records - The (seq, timestamp, command, argument) records to
+                           replay, defaults to those pending in storage.
+
+        Returns: Nothing.
+        """
+        if records is None:
+            records = self._storage.pending(self._seq)
+
+        self._replaying = True
+        try:
+            for seq, timestamp, command, argument in records:
+                if seq <= self._seq:
+                    # Already included in the snapshot.
+                    continue
+                self._clock = timestamp
+                getattr(self, "do_" + command)(argument)
+                self._seq = seq
+        finally:
+            self._clock = None
+            self._replaying = False
+            self._publish()
+
+    def run_batch(self, lines):
+        """run_batch
+
+        Purpose: Runs commands non-interactively. There is no prompt,
+                 nothing is printed by the commands unless it was asked
+                 for (e.g. by times) and nothing is logged. Storing the
+                 commands is left until the end, when the whole day is
+                 saved in one go, unless the batch exits first.
+
+        Params:  lines - The commands to run, one per line. Blank lines and
+                         lines starting with # are skipped.
+
+        Returns: The number of commands run.
+        """
+        count = 0
+        stop = False
+        self._batch = True
+        try:
+            for line in lines:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                line = self.precmd(line)
+                stop = self.postcmd(self.onecmd(line), line)
+                count += 1
+                if stop:
+                    break
+        finally:
+            self._batch = False
+            if not stop:
+                # Exiting saves for itself.
+                self._save()
+            self._publish()
+        return count
+
+    def onecmd(self, line):
+        with self._command_lock:
+            return cmd.Cmd.onecmd(self, line)
+
+    def precmd(self, line):
+        if metrics.ENABLED:
+            self._command_started = time.time()
+        return line
+
+    def postcmd(self, stop, line):
+        if self._command_started is not None:
+            command = self.parseline(line)[0]
+            if not command:
+                command = "emptyline"
+            elif not hasattr(self, "do_" + command):
+                # Don't make a new series for every typo.
+                command = "unknown"
+            metrics.command_seconds.observe(
+                time.time() - self._command_started, command)
+            self._command_started = None
+        return stop
+
+    def do_M(self, line):
+        """do_M
+
+        Purpose: Logs a line of text to the log file.
+
+        Params:  line - The line of text to be logged.
+
+        Returns: Nothing.
+        """
+        self.messages.append(self._log(line, timestamp=self._now()))
+        self._record("M", line, self._current_task)
+
+    def help_M(self):
+        description = ("Logs a line of text to the output file.")
+        arguments = {"line" : "The line to be logged to file"}
+        self._help_text(description=description,
+                        arguments=arguments)
+
+    def do_SC(self, text):
+        """do_SC
+
+        Purpose: Takes a line of text and passes it to the Shortcut class. If
+                 the text matches a shortcut in the class it will be executed.
+
+        Returns: Nothing
+        """
+        try:
+            print self._shortcut.run_cmd(text)
+            self._log("SC: %s" % text)
+        except:
+            pass
+
+    def help_SC(self):
+        description = ("Pass text to SC to execute a shortcut")
+        arguments = {"text" : "The text to be passed to SC"}
+        self._help_text(description=description,
+                        arguments=arguments)
+
+    def do_addtask(self, task):
+        """do_addtask
+
+        Purpose: Creates a new Task that time can be tracked against and
+                 notes added to.
+
+        Params:  task - The name of the Task.
+
+        Returns: Nothing.
+        """
+        if "-" in task:
+            self._to_screen("Task names must not contain '-'")
+            return
+
+        try:
+            task_name = "-".join([self._current_task.name, task])
+        except:
+            task_name = task
+
+        if task_name in self._tasks:
+            self._to_screen("Task already exists, please choose another name."
+                            "\nCurrent tasks are:\n  %s" %
+                            "\n  ".join(self._tasks))
+            return
+        else:
+            new_task = self._add_task(task_name, self._current_task)
+            self._to_screen("Created new task of name: %s" % task_name)
+            self._log("Added a new task: %s" % task_name)
+            self._record("addtask", task, new_task)
+
+    def help_addtask(self):
+        description = ("Creates a new task. Once the task is started "
+                       "notes can be made against it and the time "
+                       "spent on the task is tracked. Tasks themselves "
+                       "can have subtasks.")
+        arguments = {"task" : "The name of the task, must be unique."}
+        self._help_text(description=description,
+                        arguments=arguments)
+
+    def do_starttask(self, task):
+        """do_starttask
+
+        Purpose: Calls start on the Task and enters the task's CLI.
+
+        Params:  task - The task that we want to start
+
+        Returns: Noting.
+        """
+        try:
+            task = self._tasks[task]
+        except:
+            self._to_screen("No Task exists of that name. Current tasks are:"
+                            "\n  %s" % "\n  ".join(self._tasks))
+            return
+
+        # Check that the only running tasks are parents of this task.
+        if self._current_task != task.parent:
+            self._to_screen("Unable to start this task Either another task is "
+                            "already running, this task has a parent task "
+                            "which hasn't been started yet or this task is "
+                            "already running.")
+        else:
+            task.start(timestamp=self._now())
+            self._set_new_prompt(text=task.name)
+            self._current_task = task
+            self._log("Started Task: %s" % self._current_task.name)
+            self._record("starttask", task.name, task)
+
+    def help_starttask(self):
+        description = ("Starts an existing task. Once the task is "
+                       "started notes can be made against it and the "
+                       "time spent on the task is tracked.")
+        arguments = {"task" : "The name of the task to start."}
+        self._help_text(description=description,
+                        arguments=arguments)
+
+    def complete_starttask(self, text, line, begidx, endidx):
+        """complete_starttask
+
+        Purpose: Provides autocomplete functionality for the starttask
+                 command.
+
+        Return:  Nothing
+        """
+        if not text:
+            completions = self._tasks.keys()
+        else:
+            completions = [t for t in self._tasks if
+                           t.startswith(text)]
+        return completions
+
+    def do_stoptask(self, line):
+        """do_stoptask
+
+        Purpose: Stop the current running task.
+
+        Returns: Nothing
+        """
+        stopped = self._current_task
+        try:
+            self._intervals.add(stopped.name,
+                                *stopped.stop(timestamp=self._now()))
+            self._log("Stopped Task: %s" % stopped.name)
+        except:
+            self._to_screen("No tasks currently running.")
+            return
+
+        self._current_task = stopped.parent
+        try:
+            self._set_new_prompt(text=self._current_task.name)
+        except:
+            self._set_new_prompt(text="")
+        self._record("stoptask", stopped.name, stopped)
+
+    def help_stoptask(self):
+        description = ("Stop's the current running task. If the task had a "
+                       "parent it drops back down to the parent.")
+        arguments = {}
+        self._help_text(description=description,
+                        arguments=arguments)
+
+    def emptyline(self):
+        pass
+
+    def do_EOF(self, line):
+        self.do_exit(line)
+
+    def do_exit(self, line):
+        """do_exit
+
+        Purpose: Called to exit the Base CLI and pickle the current tasks so
+                 that we don't lose the data.
+
+        Returns: Nothing
+        """
+        if self._checkpointer:
+            self._checkpointer.stop()
+            self._checkpointer = None
+
+        # Stop all running tasks and return the CLI to the start before saving.
+        for task in self.get_tasks(status="Running"):
+            self._intervals.add(task.name, *task.stop())
+        self._current_task = None
+        self._set_new_prompt(text="")
+        self._publish()
+
+        self._log("Exiting TaskCLI")
+        self._log("\n" + self.do_times("totals", user_called=False))
+
+        # Save off the BaseCLI and subsequently all child objects.
+        self._log("Saving TaskCLI data")
+        self._save()
+        self._storage.close()
+        self._close_logfile()
+
+        print "Exiting"
+        return True
+
+    def help_exit(self):
+        """help_exit
+
+        Pupose: Prints the help text for do_exit when help exit is
+                called.
+        """
+        description = ("This exits the CLI and saves off any data in a python "
+                       "picklr file.")
+        arguments = {}
+        self._help_text(description=description,
+                        arguments=arguments)
+
+    def do_times(self, line, user_called=True):
+        """do_times
+
+        Purpose: Prints the times for all tasks below this object.
+
+        Params:  line - "totals" to only print the total time for each task
+                        rather than every timer.
+
+        Returns: The details printed to screen.
+        """
+        if line.strip() == "totals":
+            print_out = self._format_totals()
+            if user_called:
+                print print_out
+                return
+            else:
+                return print_out
+
+        task_times = {}
+        print_out = ""
+
+        # Get they times for all sub tasks.
+        for task in self._tasks.values():
+            task_times[task.name] = self._format_timers(task)
+
+        for task, details in sorted(task_times.items(),
+                                    key=lambda x: x[1]):
+            for detail in details:
+                print_out += detail + "\n"
+            print_out += "\n"
+
+        if user_called:
+            print print_out
+        else:
+            return print_out
+
+    def help_times(self):
+        description = "Prints the time spent on tasks."
+        arguments = {"totals": "Optional, only print each task's totals"}
+        self._help_text(arguments=arguments,
+                        description=description)
+
+    def do_tasks(self, line):
+        """do_tasks
+
+        Purpose: Prints a list of all the current tasks.
+        """
+        for task in self._tasks.values():
+            print task.name
+
+    def help_tasks(self):
+        description = "Prints a list of all tasks."
+        arguments = {}
+        self._help_text(arguments=arguments,
+                        description=description)
+
+    def do_report(self, line):
+        """do_report
+
+        Purpose: Prints the time spent on each task over a range of archived
+                 days.
+
+        Params:  line - The first and last days to include, as
+                        "DD-MM-YYYY DD-MM-YYYY".
+
+        Returns: Nothing.
+        """
+        try:
+            start, end = line.split()
+            report = build_report(start, end, directory=self._directory)
+        except ValueError:
+            self._to_screen("Please give the first and last days as "
+                            "DD-MM-YYYY DD-MM-YYYY.")
+            return
+
+        if not report:
+            self._to_screen("No tasks were archived between those days.")
+            return
+
+        template = "%s\t %s\t %s"
+        print template % ("TOTAL", "DAYS", "TASK")
+        for name, seconds, days in report:
+            print template % (format_seconds(seconds), days, name)
+
+    def help_report(self):
+        description = ("Prints the total time spent on each task over a "
+                       "range of archived days.")
+        arguments = {"from": "The first day, as DD-MM-YYYY",
+                     "to":   "The last day, as DD-MM-YYYY"}
+        self._help_text(arguments=arguments,
+                        description=description)
+
+    def do_stats(self, line):
+        """do_stats
+
+        Purpose: Prints how long commands, web requests and storage have
+                 taken.
+
+        Returns: Nothing.
+        """
+        rows = metrics.summary()
+        if not rows:
+            self._to_screen("Nothing has been recorded yet.")
+            return
+
+        template = "%-8s %-10s %-10s %s"
+        print template % ("COUNT", "MEAN", "MAX", "NAME")
+        for name, label, count, mean, peak in rows:
+            if name.endswith("_bytes"):
+                mean, peak = "%dB" % mean, "%dB" % peak
+            else:
+                mean, peak = "%.2fms" % (mean * 1000), "%.2fms" % (peak * 1000)
+            print template % (count, mean, peak, "%s{%s}" % (
+                name.replace("taskcli_", ""), label))
+
+    def help_stats(self):
+        description = ("Prints the number of times each command, web page "
+                       "and storage operation has been run and how long "
+                       "they took.")
+        arguments = {}
+        self._help_text(arguments=arguments,
+                        description=description)
+
+    def do_histogram(self, line):
+        """do_histogram
+
+        Purpose: Prints how much time was spent in each hour, day or week
+                 of today or a range of days, as a bar chart.
+
+        Params:  line - "[hour|day|week] [from=DD-MM-YYYY] [to=DD-MM-YYYY]
+                        [task=<prefix>]", by hour and for today unless
+                        given.
+
+        Returns: Nothing.
+        """
+        words = line.split()
+        bucket = words.pop(0) if words and "=" not in words[0] else "hour"
+        try:
+            options = self._parse_options(words, ["from", "to", "task"])
+            start = normalise_date(options.get("from", self.date))
+            end = normalise_date(options.get("to", self.date))
+            totals = rollup(start, end, bucket, options.get("task"),
+                            live=self.state, directory=self._directory)
+        except ValueError as e:
+            self._to_screen(str(e))
+            return
+
+        if not totals:
+            self._to_screen("No time was spent on tasks then.")
+            return
+        longest = max(seconds for label, seconds in totals)
+        for label, seconds in totals:
+            print "%-16s %6s %s" % (label, format_seconds(seconds),
+                                    "#" * int(round(HISTOGRAM_WIDTH *
+                                                    seconds / longest)))
+
+    def help_histogram(self):
+        description = ("Prints a bar chart of the time spent on tasks in "
+                       "each hour, day or week, for today or between two "
+                       "days.")
+        arguments = {"bucket": "Optional, one of %s, hour by default" %
+                               ", ".join(BUCKETS),
+                     "from":   "Optional, from=DD-MM-YYYY for the first day",
+                     "to":     "Optional, to=DD-MM-YYYY for the last day",
+                     "task":   "Optional, task=<prefix> for the tasks"}
+        self._help_text(arguments=arguments,
+                        description=description)
+
+    def do_at(self, line):
+        """do_at
+
+        Purpose: Prints the tasks that were running at a time, or at any
+                 point between two times.
+
+        Params:  line - "[DD-MM-YYYY] HH:MM[:SS] [HH:MM[:SS]]", the day
+                        being today unless given.
+
+        Returns: Nothing.
+        """
+        words = line.split()
+        date = self.date
+        if words and words[0].count("-") == 2:
+            date = words.pop(0)
+        try:
+            if len(words) not in (1, 2):
+                raise ValueError("Please give a time, or two.")
+            date = normalise_date(date)
+            times = [to_timestamp(date, word) for word in words]
+            if len(times) == 2 and times[1] < times[0]:
+                raise ValueError("The second time must be after the first.")
+        except ValueError as e:
+            self._to_screen(str(e))
+            return
+
+        if date == self.date:
+            state = self.state
+        else:
+            try:
+                cache = snapshots.setdefault(
+                    self._directory, SnapshotCache(directory=self._directory))
+                state = cache.get(date).state
+            except (IOError, OSError):
+                self._to_screen("Nothing was stored for %s." % date)
+                return
+
+        timers = find_timers(state, *times)
+        if not timers:
+            self._to_screen("No tasks were running then.")
+            return
+        template = "%s\t %s\t %s"
+        print template % ("START", "STOP", "TASK")
+        for name, start, stop in timers:
+            print template % (format_clock(start),
+                              format_clock(stop) if stop else "Running", name)
+
+    def help_at(self):
+        description = ("Prints the tasks that were running at a time, or "
+                       "at any point between two times.")
+        arguments = {"day":  "Optional, the day as DD-MM-YYYY, today if not "
+                             "given",
+                     "time": "The time, as HH:MM or HH:MM:SS, or two of them "
+                             "for a range"}
+        self._help_text(arguments=arguments,
+                        description=description)
+
+    def do_search(self, line):
+        """do_search
+
+        Purpose: Prints the messages and tasks, from any day, containing
+                 every word searched for, best matches first.
+
+        Params:  line - The words to search for, optionally followed by
+                        page=<number> for later pages.
+
+        Returns: Nothing.
+        """
+        words = line.split()
+        try:
+            options = self._parse_options(
+                [word for word in words if word.startswith("page=")],
+                ["page"])
+            page = int(options.get("page", 1))
+            if page < 1:
+                raise ValueError("Pages are numbered from 1.")
+        except ValueError as e:
+            self._to_screen(str(e))
+            return
+
+        self._search.catch_up(self.date)
+        self._search.sync(self.state)
+        results, total = self._search.search(
+            " ".join(word for word in words if not word.startswith("page=")),
+            page)
+        if not results:
+            self._to_screen("Nothing found." if not total else
+                            "There are only %d results." % total)
+            return
+        first = (page - 1) * RESULTS_PER_PAGE + 1
+        print "Results %d to %d of %d" % (first, first + len(results) - 1,
+                                          total)
+        for day, time_, task, message in results:
+            if message is None:
+                print "%s %-8s [%s] (task)" % (day, "", task)
+            else:
+                print "%s %s [%s] %s" % (day, time_, task, message)
+
+    def help_search(self):
+        description = ("Searches every day's messages and task names for "
+                       "those containing all of the words given.")
+        arguments = {"words": "The words to search for",
+                     "page":  "Optional, page=<number> for later pages"}
+        self._help_text(arguments=arguments,
+                        description=description)
+
+    def do_export(self, line):
+        """do_export
+
+        Purpose: Writes every timer and message across the archived days,
+                 and today, to a CSV or JSON lines file. Days are read one
+                 at a time.
+
+        Params:  line - "<file> [from=DD-MM-YYYY] [to=DD-MM-YYYY]
+                        [task=<prefix>]", the format coming from the file's
+                        extension, .csv or .jsonl.
+
+        Returns: Nothing.
+        """
+        try:
+            filename, options = self._parse_file_options(line,
+                                                         ["from", "to", "task"])
+            start = options.get("from") and normalise_date(options["from"])
+            end = options.get("to") and normalise_date(options["to"])
+        except ValueError as e:
+            self._to_screen(str(e))
+            return
+
+        records = export_records(start, end, options.get("task"), live=self,
+                                 directory=self._directory)
+        try:
+            with open(filename, "wb") as output:
+                count = write_records(records, output,
+                                      format_from_filename(filename))
+        except IOError as e:
+            self._to_screen("Unable to export: %s" % e)
+            return
+        self._to_screen("Exported %d timers and messages to %s" %
+                        (count, filename))
+
+    def help_export(self):
+        description = ("Exports every timer and message to a .csv or .jsonl "
+                       "file, optionally only those between two days or for "
+                       "tasks starting with a prefix.")
+        arguments = {"file": "The file to write",
+                     "from": "Optional, from=DD-MM-YYYY for the first day",
+                     "to":   "Optional, to=DD-MM-YYYY for the last day",
+                     "task": "Optional, task=<prefix> for the tasks"}
+        self._help_text(arguments=arguments,
+                        description=description)
+
+    def do_import(self, line):
+        """do_import
+
+        Purpose: Merges the timers and messages in a file written by export
+                 into the days they belong to. Anything already there is
+                 skipped, as are timers that were still running.
+
+        Params:  line - The file to import, .csv or .jsonl.
+
+        Returns: Nothing.
+        """
+        try:
+            filename, options = self._parse_file_options(line, [])
+            with open(filename, "rb") as source:
+                timers, messages = import_records(
+                    read_records(source, format_from_filename(filename)),
+                    live=self, directory=self._directory)
+        except (ValueError, KeyError, IOError) as e:
+            self._to_screen("Unable to import: %s" % e)
+            return
+        self._to_screen("Imported %d timers and %d messages" %
+                        (timers, messages))
+
+    def help_import(self):
+        description = ("Imports the timers and messages from a file made by "
+                       "export, skipping any already there.")
+        arguments = {"file": "The .csv or .jsonl file to read"}
+        self._help_text(arguments=arguments,
+                        description=description)
+
+    def help_help(self):
+        description = ("Returns instructions on how to use a command. Can be "
+                       "called with 'help' <command> or '?' <command>.")
+        arguments = {"command": "The command you require help with"}
+        self._help_text(arguments=arguments,
+                        description=description)
+
+    def _format_timers(self, task):
+        """_format_timers
+        """
+        title    = "Task: %s" % task.name
+        headers  = "DATE\t\t START\t STOP\t TOTAL\t STATUS"
+        template = "%s\t %s\t %s\t %s\t %s"
+        footer   = "TOTAL:\t\t \t \t %s\t %s"
+        task_times = []
+        task_times.append(title)
+        task_times.append(headers)
+        total_status = task.status
+        for timer in task.timers:
+            date, start = timer.start_time()
+            dummy, stop = timer.stop_time()
+            time_secs   = timer.total_time().total_seconds()
+            time_str    = format_seconds(time_secs)
+            status      = timer.status
+
+            line = template % (date, start, stop, time_str, status)
+            task_times.append(line)
+
+        final_line = footer % (format_seconds(task.own_seconds()),
+                               total_status)
+        task_times.append(final_line)
+
+        return task_times
+
+    def _format_totals(self):
+        """_format_totals
+
+        Purpose: Formats the running totals of every task, one line each,
+                 without going through the individual timers.
+
+        Returns: The formatted totals as a string.
+        """
+        headers  = "TOTAL	 SUBTREE	 STATUS	 TASK"
+        template = "%s\t %s\t\t %s\t %s"
+        now = time.time()
+        lines = [headers]
+        for name in sorted(self._tasks):
+            task = self._tasks[name]
+            lines.append(template % (format_seconds(task.own_seconds(now)),
+                                     format_seconds(task.subtree_seconds(now)),
+                                     task.status,
+                                     task.name))
+        return "\n".join(lines) + "\n"
+
+    def _total_tasks(self):
+        """Works out every task's running totals from its timers."""
+        for task in self._tasks.values():
+            task._own_total = task._timers.total_seconds(stopped_only=True)
+            task._subtree_total = 0
+            task._running = []
+        for task in self._tasks.values():
+            ancestor = task
+            while ancestor:
+                ancestor._subtree_total += task._own_total
+                if task.status == "Running":
+                    ancestor._running.append(task)
+                ancestor = ancestor.parent
+
+    def _set_new_prompt(self, text=None):
+        """ _set_new_prompt
+
+        Purpose: Adds text to the pronpt that is displated to the user.
+
+        Params:  text - The text to add to the prompt template.
+
+        Returns: Nothing.
+        """
+        prompt_template = "SL %s#:"
+        if text:
+            self.prompt = prompt_template % text
+        else:
+            self.prompt = prompt_template % ""
+
+    def _help_text(self, arguments={}, description=""):
+        """_help_text
+
+        Purpose: prints all help text in a generic format
+
+        Params:  arguments - a Dictionary with the arguments as key and
+                             a description of the argument as an entry.
+                 description - a description of the function.
+
+        Returns: None
+        """
+        print "\n".join(self._wrapper.wrap(description))
+        if arguments:
+            print ""
+            print "Arguments:"
+        for argument in arguments:
+            text = " <%s> - %s" % (argument, arguments[argument])
+            joiner = "\n      " + " " * len(argument)
+            print joiner.join(self._wrapper.wrap(text))
+
+    def _get_wrapper(self):
+        return textwrap.TextWrapper(width=50)
+
+    def _to_screen(self, message):
+        if self._replaying or self._batch:
+            return
+        for line in self._get_wrapper().wrap(message):
+            print line
+
+    def get_tasks(self,
+                  status=None,
+                  parent=None):
+        filters = []
+
+        if status:
+            filters.append(lambda x: x.status == status)
+
+        # Use the parent index rather than checking every task.
+        if parent:
+            if parent == "None":
+                tasks = self._roots
+            else:
+                tasks = self._children.get(parent.name, [])
+        else:
+            tasks = self._tasks.values()
+
+        return list(self._apply_filters(tasks, filters))
+
+    def get_task(self, name):
+        """Returns the Task of the given name, or None if there isn't one."""
+        return self._tasks.get(name)
+
+    def merge_timers(self, timers):
+        """merge_timers
+
+        Purpose: Adds stopped timers to the day, creating the tasks (and
+                 their parents) they belong to if need be. Timers the task
+                 already has, going by their start times, are skipped and
+                 so are running timers.
+
+        Params:  timers - (task name, start, stop) tuples.
+
+        Returns: The number of timers added.
+        """
+        by_task = {}
+        for name, start, stop in timers:
+            if stop is not None:
+                by_task.setdefault(name, {})[start] = stop
+
+        added = 0
+        for name, new in by_task.items():
+            task = None
+            parts = name.split("-")
+            for depth in xrange(1, len(parts) + 1):
+                path = "-".join(parts[:depth])
+                task = self.get_task(path) or self._add_task(path, task)
+
+            intervals = [task._timers.interval(ii) for ii in
+                         xrange(len(task._timers))]
+            running = intervals.pop() if task._timers.running else None
+            known = set(start for start, stop in intervals)
+            if running:
+                known.add(running[0])
+            new = [(start, stop) for start, stop in new.items() if start not
+                   in known]
+            if not new:
+                continue
+            store = TimerStore()
+            for start, stop in sorted(intervals + new):
+                store.append(start, stop)
+            if running:
+                store.append(*running)
+            task._timers = store
+            added += len(new)
+
+        if added:
+            self._total_tasks()
+            self._index_intervals()
+        return added
+
+    def apply_checkpoint(self, data):
+        """apply_checkpoint
+
+        Purpose: Brings a day loaded from storage up to date with the
+                 checkpoint written since it was saved.
+
+        Params:  data - The checkpoint, see PickleStorage.checkpoint().
+
+        Returns: Nothing.
+        """
+        # Task names include their parents' so sorting puts parents first.
+        for name, parent, status, timers in sorted(
+                data["tasks"], key=lambda x: x[0].count("-")):
+            task = (self._tasks.get(name) or
+                    self._add_task(name, self._tasks.get(parent)))
+            task._timers = timers.copy()
+            task._status = status
+        self._total_tasks()
+        self._index_intervals()
+
+        # Messages logged after the checkpoint's base that are already here.
+        logged = len(self.messages) - data["messages_from"]
+        self.messages.extend(data["messages"][logged:])
+        self._seq = data["seq"]
+        self._current_task = self._tasks.get(data["current"])
+        self._set_new_prompt(text=data["current"])
+        self._publish()
+
+    def start_checkpoints(self, interval=CHECKPOINT_SECONDS):
+        """Starts checkpointing the day every interval seconds in the
+        background, see checkpoint.py. Returns the Checkpointer."""
+        if self._checkpointer is None and interval > 0:
+            self._checkpointer = Checkpointer(self, interval)
+            self._checkpointer.start()
+        return self._checkpointer
+
+    def _add_task(self, name, parent):
+        """Creates a Task and adds it to the index."""
+        task = Task(name=name, parent=parent)
+        self._tasks[name] = task
+        if parent:
+            self._children.setdefault(parent.name, []).append(task)
+        else:
+            self._roots.append(task)
+        return task
+
+    def _parse_file_options(self, line, names):
+        """Splits "<file> name=value ..." arguments, raising ValueError if
+        they aren't valid."""
+        words = line.split()
+        if not words:
+            raise ValueError("Please give a file.")
+        if not format_from_filename(words[0]):
+            raise ValueError("The file must end .csv or .jsonl.")
+        return words[0], self._parse_options(words[1:], names)
+
+    def _parse_options(self, words, names):
+        """Gets a dict of "name=value" arguments, raising ValueError if
+        they aren't valid."""
+        options = {}
+        for word in words:
+            name, dummy, value = word.partition("=")
+            if name not in names or not value:
+                raise ValueError("Unknown option: %s" % word)
+            options[name] = value
+        return options
+
+    def _index_tasks(self):
+        """Builds the parent -> children index from scratch."""
+        self._children = {}
+        self._roots = []
+        for task in sorted(self._tasks.values(), key=lambda x: x.name):
+            if task.parent:
+                self._children.setdefault(task.parent.name, []).append(task)
+            else:
+                self._roots.append(task)
+
+    def _index_intervals(self):
+        """Builds the index of stopped timers from scratch."""
+        self._intervals = IntervalIndex()
+        for task in self._tasks.values():
+            for index in xrange(len(task._timers)):
+                start, stop = task._timers.interval(index)
+                if stop is not None:
+                    self._intervals.add(task.name, start, stop)
+
+    def _apply_filters(self, list_to_be_filtered, list_of_filters):
+        if not list_of_filters:
+            return list_to_be_filtered
+        else:
+            return [elem for elem in list_to_be_filtered if False not in
+                       [test(elem) for test in list_of_filters]]
+
+    def _get_logfile(self):
+        filename = os.path.join(self._directory,
+                                "cli_logs-%s.txt" % self.date)
+        return LogWriter(filename)
+
+    def _log(self, message, timestamp=None):
+        timestamp = time.strftime("%H:%M:%S",
+                                  time.localtime(timestamp or time.time()))
+        task_name = " " if not self._current_task else self._current_task.name
+        line = (timestamp, task_name, message)
+        # Replayed commands were already logged the first time round.
+        if not self._replaying and not self._batch:
+            if self._logfile is None:
+                self._logfile = self._get_logfile()
+            self._logfile.write("\n[%s] [%s] %s" % line)
+        return line
+
+    def _close_logfile(self):
+        """Writes out anything still queued for the logfile and closes it."""
+        if self._logfile is not None:
+            self._logfile.close()
+            self._logfile = None
+
+    def _now(self):
+        """Returns the time a command is run at, or was run at if replaying."""
+        return self._clock or time.time()
+
+    def _record(self, command, argument, task=None):
+        """_record
+
+        Purpose: Stores a successfully run command so that it isn't lost if
+                 the CLI dies before the day is next saved in full.
+
+        Params:  command  - The command name, e.g. "addtask".
+                 argument - The argument passed to the command.
+                 task     - The Task the command acted on.
+
+        Returns: Nothing.
+        """
+        if self._replaying:
+            return
+        self._seq += 1
+        if self._batch:
+            # The whole day is saved once the batch is done.
+            return
+        self._storage.record(self, self._seq, self._now(), command, argument,
+                             task)
+        self._publish([task] if task else [])
+        if self._storage.compaction_due():
+            if self._checkpointer:
+                # Rather than hold up the command with a full save.
+                self._storage.trim()
+            else:
+                self._save()
+
+    def _publish(self, changed=None):
+        """_publish
+
+        Purpose: Makes the current state of the day available to other
+                 threads as a new DayState. Only the CLI's own thread
+                 should call this.
+
+        Params:  changed - The Tasks changed since the last DayState was
+                           published, or None to build it from scratch.
+
+        Returns: Nothing.
+        """
+        self._version += 1
+        if changed is None or self.state is None:
+            state = DayState.build(self, self._version)
+        else:
+            state = self.state.update(self, self._version, changed)
+        # A single assignment, so readers get either the old or new state.
+        with self._published:
+            self.state = state
+            self._published.notify_all()
+
+    def wait_for_state(self, version, timeout=None):
+        """wait_for_state
+
+        Purpose: Waits for a DayState newer than the given version to be
+                 published. Can be called from any thread.
+
+        Params:  version - The version of the DayState already seen.
+                 timeout - The most seconds to wait, None to wait forever.
+
+        Returns: The latest DayState, which is only newer if one was
+                 published before the timeout.
+        """
+        with self._published:
+            if self.state.version <= version:
+                self._published.wait(timeout)
+            return self.state
+
+    def _save(self):
+        """_save
+
+        Purpose: Saves the whole day to storage, writes the day's summary
+                 sidecar and updates the day's entry in the catalog.
+
+        Returns: Nothing.
+        """
+        self._storage.save(self)
+        self._publish()
+        self._saved_state = self.state
+
+        summary = summarize(self)
+        write_summary(summary, self._directory)
+        entries, seconds = summary_totals(summary)
+        Catalog(directory=self._directory).update(self.date, entries, seconds)
+
+
+class Task():
+    """The Task CLI used when Tasks are created."""
+    def __init__(self, name, parent):
+        self._name   = name
+        self._timers = TimerStore()
+        self._parent = parent
+        self._status = "Stopped"
+        # Seconds spent on stopped timers, by this task alone and by this
+        # task plus all of its sub tasks.
+        self._own_total     = 0
+        self._subtree_total = 0
+        # Running tasks in this task's subtree (including itself).
+        self._running = []
+
+    def __setstate__(self, d):
+        self.__dict__ = d
+        # Snapshots from before timers were stored in a TimerStore.
+        if isinstance(self._timers, list):
+            store = TimerStore()
+            for timer in self._timers:
+                store.append(*timer._store.interval(timer._index))
+            self._timers = store
+            del self.__dict__["_timer"]
+
+    def start(self, timestamp=None):
+        """Called to start the task. Kicks off a Timer."""
+        if not self._timers.running:
+            self._timers.start(timestamp=timestamp)
+            self._status = "Running"
+            for task in self._ancestry():
+                task._running.append(self)
+        else:
+            print "Warning: Task %s already started!" % self._name
+
+    def stop(self, timestamp=None):
+        """Called to stop the Task and to stop the Timer and archive it.
+        Returns the (start, stop) of the Timer."""
+        if self._timers.running:
+            seconds = self._timers.stop(timestamp=timestamp)
+            self._status = "Stopped"
+            self._own_total += seconds
+            for task in self._ancestry():
+                task._subtree_total += seconds
+                task._running.remove(self)
+            return self._timers.interval(len(self._timers) - 1)
+        else:
+            print "Warning: Task %s was not timing!" % self._name
+
+    def own_seconds(self, now=None):
+        """Returns the seconds spent on this task, excluding sub tasks."""
+        seconds = self._own_total
+        if self._timers.running:
+            seconds += self._timers.running_seconds(now)
+        return seconds
+
+    def subtree_seconds(self, now=None):
+        """Returns the seconds spent on this task and all its sub tasks."""
+        seconds = self._subtree_total
+        for task in self._running:
+            seconds += task._timers.running_seconds(now)
+        return seconds
+
+    def _ancestry(self):
+        """Yields this task followed by each of its parents in turn."""
+        task = self
+        while task:
+            yield task
+            task = task.parent
+
+    @property
+    def name(self):
+        """Getter for the Tasks name."""
+        return self._name
+
+    @property
+    def parent(self):
+        """Getter for the Tasks parent."""
+        return self._parent
+
+    @property
+    def status(self):
+        """Returns the status of the task, either "Running" or "Stopped"."""
+        return self._status
+
+    @property
+    def timers(self):
+        """Returns all the tasks Timers."""
+        return list(self._timers)
+
+
+class TimerStore(object):
+    """Holds a Task's timers as parallel arrays of start and stop times.
+
+    Times are stored as seconds since the epoch. Every timer except the
+    last has a stop time, so when a timer is running there is one more
+    start than there are stops.
+
+    When unpickled the times are left packed until they are first used,
+    so loading a day doesn't pay for the timers of tasks nobody looks at.
+    """
+    __slots__ = ("_starts", "_stops", "_packed")
+
+    def __init__(self):
+        self._starts = array("d")
+        self._stops  = array("d")
+        self._packed = None
+
+    def __getstate__(self):
+        if self._packed is not None:
+            return self._packed
+        return self._starts.tostring(), self._stops.tostring()
+
+    def __setstate__(self, state):
+        self._packed = state
+
+    def __getattr__(self, name):
+        # Only called for unset slots, i.e. times still packed.
+        if name in ("_starts", "_stops"):
+            packed = self._packed
+            if packed is not None:
+                self._unpack(packed)
+            # Another thread may have unpacked them in the meantime.
+            return object.__getattribute__(self, name)
+        raise AttributeError(name)
+
+    def _unpack(self, packed):
+        starts = array("d")
+        stops  = array("d")
+        starts.fromstring(packed[0])
+        stops.fromstring(packed[1])
+        self._starts, self._stops = starts, stops
+        self._packed = None
+
+    def copy(self):
+        """Returns a copy of the store that won't change along with it."""
+        store = TimerStore()
+        if self._packed is not None:
+            # Packed times are strings, so can be shared.
+            del store._starts, store._stops
+            store._packed = self._packed
+        else:
+            store._starts = self._starts[:]
+            store._stops  = self._stops[:]
+        return store
+
+    def start(self, timestamp=None):
+        """Starts a new timer and returns its index."""
+        self._starts.append(timestamp or time.time())
+        return len(self._starts) - 1
+
+    def stop(self, timestamp=None):
+        """Stops the running timer and returns how long it ran for."""
+        self._stops.append(timestamp or time.time())
+        return self._stops[-1] - self._starts[len(self._stops) - 1]
+
+    def append(self, start, stop=None):
+        """Adds an existing timer, which is left running if stop is None."""
+        self._starts.append(start)
+        if stop is not None:
+            self._stops.append(stop)
+
+    def interval(self, index):
+        """Returns the (start, stop) of a timer, stop is None if running."""
+        if index < len(self._stops):
+            return self._starts[index], self._stops[index]
+        return self._starts[index], None
+
+    def total_seconds(self, now=None, stopped_only=False):
+        """Returns the total time of all the timers in seconds."""
+        stopped = len(self._stops)
+        total = sum(self._stops) - sum(self._starts[:stopped])
+        if not stopped_only:
+            total += self.running_seconds(now)
+        return total
+
+    def running_seconds(self, now=None):
+        """Returns how long the running timer has run for, if there is one."""
+        if not self.running:
+            return 0
+        return (now or time.time()) - self._starts[-1]
+
+    @property
+    def running(self):
+        return len(self._starts) > len(self._stops)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self._starts)
+        if not 0 <= index < len(self._starts):
+            raise IndexError("timer index out of range")
+        return Timer(store=self, index=index)
+
+    def __iter__(self):
+        for index in xrange(len(self._starts)):
+            yield Timer(store=self, index=index)
+
+
+class Timer(object):
+    """Class for timing things.
+
+    A Timer is a view of one entry in a TimerStore. Creating one without a
+    store starts a new timer in a store of its own.
+    """
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, timestamp=None, store=None, index=None):
+        if store is None:
+            store = TimerStore()
+            index = store.start(timestamp=timestamp)
+        self._store = store
+        self._index = index
+
+    def __getstate__(self):
+        return self._store, self._index
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # A Timer from before TimerStore, Task.__setstate__ moves it
+            # into its Task's store.
+            self._store = TimerStore()
+            self._index = 0
+            self._store.append(_to_epoch(state["_start_time"]),
+                               _to_epoch(state["_stop_time"]))
+        else:
+            self._store, self._index = state
+
+    def stop(self, timestamp=None):
+        """Stops the timer, now unless a timestamp is given."""
+        if self.status == "Running":
+            self._store.stop(timestamp=timestamp)
+
+    def start_time(self):
+        """ Returns the start time.
+
+        Returns: as a tuple:
+            date - date as a string: Mon DD-MM-YYYY
+            time - time as a string: HH:MM
+        """
+        start = datetime.datetime.fromtimestamp(self._interval()[0])
+        return start.strftime("%a %d-%m-%Y"), start.strftime("%H:%M")
+
+    def stop_time(self):
+        """ Returns the stop time.
+
+        Returns: as a tuple:
+            date - date as a string: Mon DD-MM-YYYY
+            time - time as a string: HH:MM
+        """
+        stop = self._interval()[1]
+        if stop is None:
+            return None, None
+        stop = datetime.datetime.fromtimestamp(stop)
+        return stop.strftime("%a %d-%m-%Y"), stop.strftime("%H:%M")
+
+    def total_time(self):
+        """ Returns the difference between start and stop time.
+
+        Returns: a datetime.timedelta object
+        """
+        start, stop = self._interval()
+        return datetime.timedelta(seconds=(stop or time.time()) - start)
+
+    @property
+    def status(self):
+        """ Returns: The current status: "Stopped" OR "Running" """
+        if self._interval()[1] is None:
+            return "Running"
+        return "Stopped"
+
+    def _interval(self):
+        return self._store.interval(self._index)
+
+
+class Shortcut():
+    def __init__(self):
+        self._const = {
+            "ssh":       (self._ssh, "tool for sshing"),
+            "unit_test": (self._unit_test, "unit testing utility")
+        }
+
+    def run_cmd(self, text):
+        cmd, args = self._parse_input(text)
+
+        try:
+            func = self._const[cmd][0]
+            return func(args)
+        except:
+            return ("Shortcut '%s' does not exist, shortcuts:\n%s" % (cmd,
+                    self._summary()))
+
+    def _ssh(self, args):
+        print "ssh, %s" % args
+
+    def _unit_test(self, args):
+        return args
+
+    def _summary(self):
+        summary = ""
+        for sc in self._const:
+            summary += " %s:\t%s\n" % (sc, self._const[sc][1])
+        return summary
+
+    def _parse_input(self, text):
+        return text.split()[0], text.split()[1:]
+
+def _to_epoch(when):
+    """Converts a datetime (or None) to seconds since the epoch."""
+    if when is None:
+        return None
+    return time.mktime(when.timetuple()) + when.microsecond / 1e6
+
+def format_seconds(seconds):
+    """format_seconds
+
+    Converts X number of seconds to a string of the format HhMMm (e.g 2h32m).
+
+    Params:  seconds - The number of seconds.
+
+    Returns: string of the formatted seconds.
+    """
+    hours = int(seconds)/(60*60)
+    mins  = (int(seconds)/60)%60
+    return "%dh%02dm" % (hours, mins)
+
+def format_clock(timestamp):
+    """Converts seconds since the epoch to the local time as HH:MM:SS."""
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
+
+def get_sub_tasks(cli, task):
+    """get_sub_tasks
+
+    Gets the sub_tasks of a given task.
+
+    Params:  cli  - The TaskCLI object that contains the Task.
+             task - The Task object.
+
+    Returns: A list of child Tasks.
+    """
+    sub_tasks = []
+    to_visit = [task]
+    while to_visit:
+        children = cli.get_tasks(parent=to_visit.pop())
+        sub_tasks.extend(children)
+        to_visit.extend(children)
+    return sub_tasks
+
+def get_args():
+    parser = argparse.ArgumentParser(description="TaskCLI")
+    parser.add_argument('mode', metavar='<mode>', type=str,
+        help="Either 'CLI' (to start tool), 'BATCH' (to run the commands in "
+             "<file>), 'UNIT' (to run unit tests) or 'MIGRATE' (to import "
+             "the .p snapshots into the SQLite database).")
+    parser.add_argument('file', metavar='<file>', nargs='?', default='-',
+        help="the commands to run in BATCH mode, one per line, defaults "
+             "to stdin")
+    parser.add_argument('--storage', choices=storage.BACKENDS,
+        default=storage.BACKEND, help="where to keep the tasks")
+    add_resume_args(parser)
+    add_session_args(parser)
+    add_checkpoint_args(parser)
+    add_metrics_args(parser)
+
+    args = parser.parse_args()
+
+    if args.mode in ["UNIT", "CLI", "BATCH", "MIGRATE"]:
+        pass
+    else:
+        parser.print_usage()
+        quit()
+
+    return args
+
+def add_resume_args(parser):
+    """Adds the --resume and --fresh arguments, which answer the question
+    get_cli() would otherwise ask. args.resume is left None if neither is
+    given."""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--resume', dest='resume', action='store_true',
+        default=None, help="carry on from anything stored for today")
+    group.add_argument('--fresh', dest='resume', action='store_false',
+        help="start afresh, discarding anything stored for today")
+
+def add_session_args(parser):
+    """Adds the --session argument, the named session to keep the tasks in
+    rather than the working directory."""
+    parser.add_argument('--session', metavar='NAME', default=None,
+        help="keep the tasks in the named session's directory, see "
+             "sessions.py")
+
+def add_checkpoint_args(parser):
+    """Adds the --checkpoint argument, how often the day is checkpointed."""
+    parser.add_argument('--checkpoint', metavar='SECONDS', type=float,
+        default=CHECKPOINT_SECONDS,
+        help="seconds between checkpoints of the day, 0 to turn them off")
+
+def add_metrics_args(parser):
+    """Adds the --no-metrics argument, which turns off recording of how long
+    things take."""
+    parser.add_argument('--no-metrics', dest='metrics', action='store_false',
+        help="don't record how long commands and requests take")
+
+def log_startup(cli):
+    """Logs how long it has taken to get started since the module was
+    imported, to keep an eye on the cost of restarting."""
+    seconds = time.time() - IMPORTED
+    log.info("startup: ready in %.3f seconds", seconds)
+    cli._log("Startup took %.3f seconds" % seconds)
+    return seconds
+
+def restart_at_midnight(cli):
+    """Restarts the CLI at midnight"""
+    sleep_time = (datetime.datetime.now().replace(hour=23,
+                                                  minute=59,
+                                                  second=59,
+                                                  microsecond=999) -
+                      datetime.datetime.now()).total_seconds()
+    time.sleep(sleep_time)
+    cli.reset()
+    start_new_thread(restart_at_midnight, (cli,))
+
+def host_cli(cli, checkpoint=CHECKPOINT_SECONDS):
+    """Starts what a long running TaskCLI needs in the background, restarting
+    it at midnight and checkpointing its day."""
+    start_new_thread(restart_at_midnight, (cli,))
+    cli.start_checkpoints(checkpoint)
+
+def start_cli(cli, msg="Welcome to TaskCLI", checkpoint=CHECKPOINT_SECONDS):
+    # Only needed for auto-completion, so not imported until it's used.
+    try:
+        import pyreadline
+    except:
+        if os.name == "nt":
+            print ("Warning: Auto-completion won't work on Windows without "
+                   "the pyreadline module")
+    host_cli(cli, checkpoint)
+    cli.cmdloop(msg)
+
+def simulate_cmd(cli, cmd):
+    l = cli.precmd(cmd)
+    r = cli.onecmd(l)
+    cli.postcmd(r, l)
+
+def get_cli(resume=None, directory=""):
+    """get_cli
+
+    Gets the TaskCLI for today, either carrying on from what has already
+    been stored for today or starting afresh.
+
+    Params:  resume    - True to carry on, False to start afresh or None to
+                         ask if anything has been stored.
+             directory - Where the days are kept, defaults to the working
+                         directory.
+
+    Returns: A tuple of (TaskCLI, welcome message).
+    """
+    date = datetime.datetime.fromtimestamp(time.time()).strftime("%d-%m-%Y")
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    day = open_storage(date, directory)
+    user_input = None
+    if resume is not None:
+        user_input = "Y" if resume else "N"
+    elif day.exists():
+        while 1:
+            user_input = raw_input("Found previous data, load it? Y/N")
+            if user_input in ["Y", "N"]:
+                break
+    if user_input == "Y":
+        msg = "Welcome to the TaskCLI, Loaded previous data."
+        cli = day.load()
+        if cli:
+            cli._log("Restarting TaskCLI")
+        else:
+            cli = TaskCLI(directory)
+        # Pick up anything done after the snapshot was taken.
+        cli.replay()
+    else:
+        msg = "Welcome to TaskCLI, no data to load."
+        cli = TaskCLI(directory)
+        # Starting afresh, so anything stored for today no longer applies.
+        cli._storage.discard()
+    day.close()
+    return cli, msg
+
+def restore_cli(date, tasks, timers, messages, seq=0, current=None,
+                directory=""):
+    """restore_cli
+
+    Builds a TaskCLI from the rows kept by a storage backend.
+
+    Params:  date      - The day, as DD-MM-YYYY.
+             tasks     - (name, parent name) tuples, parents before
+                         children.
+             timers    - (task name, start, stop) tuples, stop is None if
+                         the timer is running.
+             messages  - (time, task name, message) tuples.
+             seq       - The sequence number of the last command stored.
+             current   - The name of the current task, if there is one.
+             directory - Where the day is kept, defaults to the working
+                         directory.
+
+    Returns: The TaskCLI.
+    """
+    by_name = {}
+    for name, parent in tasks:
+        by_name[name] = Task(name=name, parent=by_name.get(parent))
+    for name, start, stop in timers:
+        by_name[name]._timers.append(start, stop)
+    for task in by_name.values():
+        if task._timers.running:
+            task._status = "Running"
+
+    # Create the instance without __init__, as unpickling does.
+    cli = types.InstanceType(TaskCLI)
+    cmd.Cmd.__init__(cli)
+    state = cli.__dict__
+    state["date"] = date
+    state["_directory"] = directory
+    state["_tasks"] = by_name
+    state["_current_task"] = by_name.get(current)
+    state["messages"] = MessageLog(date, directory)
+    state["messages"].extend(messages)
+    state["_seq"] = seq
+    cli.__setstate__(state)
+    cli._total_tasks()
+    cli._set_new_prompt(text=current)
+    cli._publish()
+    return cli
+
+def run_unit_tests(cli=None):
+    standalone = cli is None
+    if standalone:
+        print "Started Unit Tests\n"
+
+        """ Test Shortcut """
+        print " Testing Shortcut..."
+        sc = Shortcut()
+        # Test we pass arguments to a function
+        result = sc.run_cmd("unit_test abc 123")
+        assert result == ["abc", "123"]
+        # Test we handle duff shortcuts
+        result = sc.run_cmd("giberish sdf dg sdg ")
+        assert type(result) is str
+        print " ...Shortcut Passed.\n"
+
+        """ Test Timer """
+        print " Testing Timer..."
+        t = Timer()
+        # Check the timer is automatically started.
+        assert t.status == "Running"
+        t.stop()
+        assert t.status == "Stopped"
+        # Check the start and stop times returned.
+        assert type(t.start_time()) is tuple
+        assert type(t.start_time()[0]) is str and type(t.start_time()[1]) is str
+        assert t.start_time() == t.stop_time()
+        # Check the total seconds is a small number.
+        seconds = t.total_time().total_seconds()
+        assert seconds >= 0 and seconds <= 1
+        print " ...Timer Passed.\n"
+
+        """ Test Task """
+        print " Testing Task..."
+        # Test creation and initiation.
+        parent  = Task(name="parent", parent=None)
+        child1  = Task(name="child1", parent=parent)
+        assert (child1.name == "child1" and child1.parent == parent and
+                child1.status == "Stopped" and child1.timers == [])
+        # Check start and stop behaviour is sensible.
+        child1.stop()
+        assert (child1.status == "Stopped" and child1.timers == [])
+        for ii in range(2):
+            child1.start()
+            assert (child1.status == "Running" and len(child1.timers) == 1 and
+                    type(child1.timers[0]) is type(Timer()))
+        child1.stop()
+        assert (child1.status == "Stopped" and len(child1.timers) == 1 and
+                    type(child1.timers[0]) is type(Timer()))
+        # Check the running totals roll up to the parent.
+        root = Task(name="root", parent=None)
+        leaf = Task(name="leaf", parent=root)
+        root.start(timestamp=100.0)
+        leaf.start(timestamp=110.0)
+        assert root.subtree_seconds(now=120.0) == 30.0
+        leaf.stop(timestamp=130.0)
+        assert (leaf.own_seconds() == 20.0 and
+                root.own_seconds(now=140.0) == 40.0 and
+                root.subtree_seconds(now=140.0) == 60.0)
+        root.stop(timestamp=150.0)
+        assert root.own_seconds() == 50.0 and root.subtree_seconds() == 70.0
+        print " ...Task Passed.\n"
+
+        """ Test TimerStore """
+        print " Testing TimerStore..."
+        store = TimerStore()
+        store.append(100.0, 160.0)
+        store.append(200.0, 230.0)
+        store.start(timestamp=300.0)
+        assert store.running and len(store) == 3
+        assert [t.status for t in store] == ["Stopped", "Stopped", "Running"]
+        assert store.total_seconds(now=310.0) == 100.0
+        # Check it survives pickling.
+        store = pickle.loads(pickle.dumps(store, pickle.HIGHEST_PROTOCOL))
+        # Check the times are only unpacked when used.
+        assert store._packed is not None and store.copy()._packed is not None
+        assert (store.total_seconds(now=310.0) == 100.0 and
+                store[-1].status == "Running")
+        print " ...TimerStore Passed.\n"
+
+        """ Test LogWriter """
+        print " Testing LogWriter..."
+        filename = "unit_test_log.txt"
+        writer = LogWriter(filename, max_bytes=10, backups=3)
+        lines = ["line %d\n" % ii for ii in range(3)]
+        for line in lines:
+            writer.write(line)
+        writer.close()
+        # Check everything was written, rotating once past 10 bytes.
+        files = [filename + suffix for suffix in [".3", ".2", ".1", ""]
+                 if os.path.isfile(filename + suffix)]
+        assert os.path.isfile(filename + ".1")
+        assert "".join([open(f).read() for f in files]) == "".join(lines)
+        for f in files:
+            os.remove(f)
+        print " ...LogWriter Passed.\n"
+
+        """ Test MessageLog """
+        print " Testing MessageLog..."
+        date = "01-01-2015"
+        messages = MessageLog(date)
+        messages.TAIL_SIZE = 4
+        for ii in range(10):
+            messages.append(("00:00:%02d" % ii, "task%d" % (ii % 2), str(ii)))
+        # Check the older messages were spilled but can still be read.
+        assert len(messages._tail) <= 4 and len(messages) == 10
+        assert [m[2] for m in messages] == [str(ii) for ii in range(10)]
+        assert messages[1] == ("00:00:01", "task1", "1")
+        # Check paging through one task's messages.
+        page, cursor = messages.page(limit=3, tasks=["task0"])
+        assert [m[2] for m in page] == ["8", "6", "4"]
+        page, cursor = messages.page(before=cursor, limit=3, tasks=["task0"])
+        assert [m[2] for m in page] == ["2", "0"] and cursor is None
+        page, cursor = messages.page(limit=4)
+        assert [m[2] for m in page] == ["9", "8", "7", "6"] and cursor == 6
+        os.remove("%s.messages" % date)
+        # Check loading a day's messages doesn't write them out again.
+        messages = MessageLog(date)
+        messages.TAIL_SIZE = 4
+        messages.extend(("00:00:%02d" % ii, "task", str(ii))
+                        for ii in range(10))
+        assert (not os.path.isfile("%s.messages" % date) and
+                [m[2] for m in messages] == [str(ii) for ii in range(10)])
+        print " ...MessageLog Passed.\n"
+
+        """ Test metrics """
+        print " Testing metrics..."
+        histogram = metrics.Histogram("unit_test_seconds", "Unit test.",
+                                      "name", buckets=(1, 2))
+        for value in [0.5, 1.5, 3]:
+            histogram.observe(value, "test")
+        assert histogram.series() == [("test", [1, 2], 3, 5.0, 3)]
+        print " ...metrics Passed.\n"
+
+        """ Test Catalog """
+        print " Testing Catalog..."
+        filename = "unit_test_catalog.json"
+        with open(filename, "w") as f:
+            f.write("{}")
+        catalog = Catalog(filename)
+        for date in ["02-01-2015", "31-12-2014", "10-01-2015"]:
+            catalog.update(date, 1, 60)
+        # Check days come back most recent first.
+        assert [day[0] for day in catalog.page(1, 2)] == ["10-01-2015",
+                                                          "02-01-2015"]
+        assert Catalog(filename).page(2, 2) == [("31-12-2014", 1, 60)]
+        assert (catalog.page(0, 2) == catalog.page(-1, 2) ==
+                catalog.page(3, 2) == [])
+        os.remove(filename)
+        print " ...Catalog Passed.\n"
+
+        """ Test SQLiteStorage """
+        print " Testing SQLiteStorage..."
+        filename = "unit_test.db"
+        sql_cli = TaskCLI()
+        sql_cli._storage = SQLiteStorage(sql_cli.date, filename=filename)
+        for line in ["addtask parent", "starttask parent", "addtask child",
+                     "starttask parent-child", "M A message.", "stoptask"]:
+            simulate_cmd(sql_cli, line)
+        # Check each command was written as it happened.
+        db = SQLiteStorage(sql_cli.date, filename=filename)
+        loaded = db.load()
+        assert (sorted(loaded._tasks) == ["parent", "parent-child"] and
+                list(loaded.messages) == list(sql_cli.messages) and
+                loaded._current_task.name == "parent" and
+                loaded.get_task("parent").status == "Running" and
+                len(loaded.get_task("parent-child").timers) == 1)
+        # Check saving the whole day replaces what was there.
+        sql_cli.do_stoptask("")
+        db.save(sql_cli)
+        assert db.load().get_task("parent").status == "Stopped"
+        sql_cli._storage.close()
+        # Check a batch is only stored once it has finished.
+        batch_cli = TaskCLI()
+        batch_cli._storage = SQLiteStorage(batch_cli.date, filename=filename)
+        count = batch_cli.run_batch(["addtask batch", "", "# A comment.",
+                                     "starttask batch", "M Batched."])
+        loaded = db.load()
+        assert (count == 3 and batch_cli._seq == 3 and
+                loaded.get_task("batch").status == "Running" and
+                list(loaded.messages)[-1][2] == "Batched.")
+        batch_cli._storage.close()
+        db.close()
+        for suffix in ["", "-wal", "-shm"]:
+            if os.path.isfile(filename + suffix):
+                os.remove(filename + suffix)
+        print " ...SQLiteStorage Passed.\n"
+
+        """ Test starting afresh """
+        print " Testing starting afresh..."
+        backend = storage.BACKEND
+        try:
+            # Both backends must throw away the old day, not just what was
+            # done since it was saved.
+            for name in storage.BACKENDS:
+                storage.BACKEND = name
+                directory = "unit_test_fresh_%s" % name
+                old, msg = get_cli(resume=False, directory=directory)
+                for line in ["addtask old1", "addtask old2", "M old message"]:
+                    simulate_cmd(old, line)
+                old._save()
+                old._storage.close()
+                old._close_logfile()
+                fresh, msg = get_cli(resume=False, directory=directory)
+                simulate_cmd(fresh, "addtask a")
+                simulate_cmd(fresh, "M fresh message")
+                # Crash, leaving only what the fresh start has stored.
+                fresh._storage.close()
+                fresh._close_logfile()
+                resumed, msg = get_cli(resume=True, directory=directory)
+                assert (sorted(resumed._tasks) == ["a"] and
+                        [message[2] for message in resumed.messages] ==
+                        ["fresh message"])
+                resumed._storage.close()
+                resumed._close_logfile()
+        finally:
+            storage.BACKEND = backend
+            for name in storage.BACKENDS:
+                shutil.rmtree("unit_test_fresh_%s" % name, ignore_errors=True)
+        print " ...starting afresh Passed.\n"
+
+        """ Test TaskCLI """
+        print " Testing TaskCLI..."
+        cli = TaskCLI()
+        cli._storage.discard()
+    else:
+        print " Testing TaskCLI..."
+
+    cli.help_help()
+    cli.do_SC("dummy")
+    cli.do_M("This is the first message.")
+    cli.do_M("This is the last message.")
+    cli.do_addtask("parent_task1")
+    cli.do_addtask("parent_task2")
+    cli.do_addtask("-")
+    cli.do_starttask("parent_task1")
+    cli.do_addtask("child_task1")
+    cli.do_addtask("child_task2")
+    cli.do_starttask("parent_task1-child_task1")
+    cli.do_addtask("child_subtask")
+    cli.do_starttask("parent_task1-child_task1-child_subtask")
+    cli.do_stoptask("")
+    cli.do_stoptask("")
+    cli.do_starttask("parent_task1-child_task2")
+    cli.do_stoptask("")
+    cli.do_addtask("child_task3")
+    cli.do_starttask("parent_task1-child_task3")
+    cli.do_stoptask("")
+    cli.do_stoptask("")
+    cli.do_starttask("parent_task2")
+    cli.do_stoptask("")
+    cli.do_starttask("parent_task1")
+    cli.do_stoptask("")
+    cli.do_tasks("")
+    cli.do_times("")
+    sub_tasks = get_sub_tasks(cli, cli.get_task("parent_task1"))
+    assert sorted([t.name for t in sub_tasks]) == [
+        "parent_task1-child_task1", "parent_task1-child_task1-child_subtask",
+        "parent_task1-child_task2", "parent_task1-child_task3"]
+    # Check a published state is left alone by later commands.
+    state = cli.state
+    cli.do_M("A message after the state.")
+    cli.do_addtask("parent_task3")
+    assert (cli.state.version > state.version and
+            state.get_task("parent_task3") is None and
+            len(state.messages) == len(cli.messages) - 1 and
+            cli.state.get_task("parent_task3") is not None and
+            cli.state.get_task("parent_task1") is
+            state.get_task("parent_task1"))
+    assert (sorted([t.name for t in get_sub_tasks(state,
+                    state.get_task("parent_task1"))]) ==
+            sorted([t.name for t in sub_tasks]))
+    # Check the events between states include a task started and stopped.
+    cli.do_starttask("parent_task3")
+    cli.do_stoptask("")
+    assert ([event for event, data in changes(state, cli.state)] ==
+            ["started", "stopped", "message"])
+    roots = [t.name for t in cli.get_tasks(parent="None")]
+    assert "parent_task1" in roots and "parent_task2" in roots
+    # Check the index survives pickling.
+    restored = pickle.loads(pickle.dumps(cli))
+    assert (sorted(restored._children) == sorted(cli._children) and
+            len(get_sub_tasks(restored, restored.get_task("parent_task1"))) ==
+            len(sub_tasks))
+    restored._storage.close()
+    if standalone:
+        # Check that replaying the journal rebuilds the same state.
+        replayed = TaskCLI()
+        replayed.replay()
+        assert sorted(replayed._tasks) == sorted(cli._tasks)
+        for name, task in cli._tasks.items():
+            assert len(replayed._tasks[name].timers) == len(task.timers)
+        assert list(replayed.messages) == list(cli.messages)
+        replayed._storage.close()
+        # Check that a checkpoint brings the saved day up to date too.
+        checkpointer = Checkpointer(cli)
+        assert checkpointer.checkpoint() and not checkpointer.checkpoint()
+        # And one chained on to it, holding just the message logged since.
+        simulate_cmd(cli, "M checkpointed")
+        assert checkpointer.checkpoint()
+        checkpoints = list(cli._storage._read_checkpoints())
+        assert (len(checkpoints) == 2 and
+                checkpoints[1]["base_seq"] == checkpoints[0]["seq"] and
+                not checkpoints[1]["tasks"] and
+                [m[2] for m in checkpoints[1]["messages"]] ==
+                ["checkpointed"])
+        restored = cli._storage.load()
+        assert (restored._seq == cli._seq and
+                list(restored.messages) == list(cli.messages))
+        for name, task in cli._tasks.items():
+            timers = restored._tasks[name]._timers
+            assert ([timers.interval(ii) for ii in xrange(len(timers))] ==
+                    [task._timers.interval(ii) for ii in
+                     xrange(len(task._timers))] and
+                    restored._tasks[name].status == task.status)
+        restored._storage.close()
+    cli.do_exit("")
+    assert Catalog().get(cli.date) is not None
+    # Check exporting and then importing a task's timers.
+    filename = "unit_test_export.csv"
+    cli.do_export("%s task=parent_task1" % filename)
+    with open(filename, "rb") as source:
+        records = list(read_records(source, "csv"))
+    os.remove(filename)
+    timers = [(r["task"], r["start"], r["stop"]) for r in records if
+              r["type"] == "timer"]
+    assert (len(timers) == 6 and
+            timers[0] == ("parent_task1",) + cli.get_task(
+                "parent_task1")._timers.interval(0))
+    fresh = restore_cli(cli.date, [], [], [])
+    assert fresh.merge_timers(timers) == 6 and fresh.merge_timers(timers) == 0
+    assert (sorted(fresh._tasks) ==
+            sorted([name for name in cli._tasks if
+                    name.startswith("parent_task1")]) and
+            abs(fresh.get_task("parent_task1").own_seconds() -
+                cli.get_task("parent_task1").own_seconds()) < 1e-6)
+    fresh._storage.close()
+    assert import_records(iter(records)) == (0, 0)
+    # Check importing into another day leaves nothing open for it, and that
+    # a bad day is refused rather than used as a filename.
+    threads = threading.active_count()
+    directory = "unit_test_import"
+    past = [dict(record, day="01-01-2001") for record in records]
+    os.mkdir(directory)
+    try:
+        assert (import_records(iter(past), directory=directory)[0] == 6 and
+                threading.active_count() == threads and
+                os.path.isfile(os.path.join(directory, "01-01-2001.p")) and
+                not os.path.isfile(os.path.join(directory,
+                                                "cli_logs-01-01-2001.txt")))
+        try:
+            import_records(iter([dict(records[0], day="../unit_test")]),
+                           directory=directory)
+            assert False
+        except ValueError:
+            assert not os.path.isfile("unit_test.p")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    # Check the summary sidecar matches the day.
+    summary = read_summary(cli.date)
+    parent = summary["tasks"]["parent_task1"]
+    assert (summary["messages"] == len(cli.messages) and
+            "parent_task1" in summary["roots"] and
+            parent["subtree"] >= parent["own"] and
+            summary_totals(summary) == Catalog().get(cli.date))
+    # Check timers are split across the hours they were running in.
+    edges = hour_edges(cli.date)
+    assert (split_hours([(edges[1] - 10, edges[2] + 20)], edges) ==
+            [10, edges[2] - edges[1], 20] + [0] * 21)
+    assert abs(sum(sum(hours) for hours in summary["hours"].values()) -
+               sum(task["own"] for task in summary["tasks"].values())) < 0.1
+    cli.do_histogram("day task=parent_task1")
+    # Check the archived days' hours kept in memory are bounded.
+    assert (rollup(cli.date, cli.date) and
+            ("", cli.date) in rollups._cache)
+    days = rollups.ROLLUP_CACHE_DAYS
+    rollups.ROLLUP_CACHE_DAYS = 0
+    rollups._cache.clear()
+    try:
+        assert rollup(cli.date, cli.date)
+        assert not rollups._cache
+    finally:
+        rollups.ROLLUP_CACHE_DAYS = days
+    # Check the index finds the timers running at a time or in a range.
+    index = IntervalIndex()
+    for name, start, stop in [("a", 0.0, 10.0), ("b", 5.0, 6.0),
+                              ("c", 8.0, 20.0)]:
+        index.add(name, start, stop)
+    assert ([name for name, start, stop in index.at(5)] == ["a", "b"] and
+            [name for name, start, stop in index.overlapping(9, 30)] ==
+            ["a", "c"] and index.at(20) == [])
+    assert (len(cli.state.intervals) ==
+            sum(len(task._timers) for task in cli._tasks.values()))
+    # Check a published state doesn't see timers stopped after it.
+    state = cli.state
+    cli._intervals.add("unit_test_late", 0.0, 1.0)
+    assert len(state.intervals) == len(cli._intervals) - 1
+    cli._index_intervals()
+    cli.do_at("%s 00:00 23:59:59" % cli.date)
+    # Check searching finds messages, best first, and task names, and that
+    # the index survives being archived.
+    index = SearchIndex("unit_test.index")
+    index.sync(cli.state)
+    results, total = index.search("LAST message")
+    assert (total == 1 and
+            results[0][3] == "This is the last message." and
+            index.search("parent_task1")[0][0][2] == "parent_task1")
+    index.archive(cli.state)
+    assert (os.listdir("unit_test.index") == ["%s.segment" % cli.date] and
+            SearchIndex("unit_test.index").search("last message")[1] == total)
+    shutil.rmtree("unit_test.index")
+    cli.do_search("message page=1")
+    # Check the day is only loaded once from its snapshot.
+    snapshots = SnapshotCache()
+    for ii in range(2):
+        assert sorted(snapshots.get(cli.date)._tasks) == sorted(cli._tasks)
+    assert snapshots.hits == 1 and snapshots.misses == 1
+    report = build_report(cli.date, cli.date, processes=1)
+    assert "parent_task1" in [name for name, seconds, days in report]
+    # Check a day is summarized from its snapshot without a TaskCLI.
+    threads = threading.active_count()
+    assert (summarize_day(cli.date) ==
+            (cli.date, dict((task.name, task.own_seconds()) for task in
+                            cli._tasks.values())) and
+            threading.active_count() == threads)
+    cli.do_report("%s %s" % (cli.date, cli.date))
+    # Check a session keeps its days in its own directory.
+    for name in ["", "..", "a/b"]:
+        try:
+            session_directory(name)
+            assert False
+        except ValueError:
+            pass
+    directory = session_directory("unit_test")
+    session, msg = get_cli(resume=False, directory=directory)
+    simulate_cmd(session, "addtask unit_test_session")
+    session.do_exit("")
+    day = open_storage(cli.date, directory)
+    assert (sorted(day.load()._tasks) == ["unit_test_session"] and
+            Catalog(directory=directory).get(cli.date) is not None and
+            "unit_test_session" not in read_summary(cli.date)["tasks"] and
+            build_report(cli.date, cli.date, directory=directory)[0][0] ==
+            "unit_test_session")
+    day.close()
+    shutil.rmtree(directory)
+    if not os.listdir(os.path.dirname(directory)):
+        os.rmdir(os.path.dirname(directory))
+    print " ...TaskCLI Passed.\n"
+    print "All Tests Passed."
+
+def main():
+    args = get_args()
+    storage.BACKEND = args.storage
+    metrics.ENABLED = args.metrics
+
+    try:
+        directory = session_directory(args.session) if args.session else ""
+    except ValueError as e:
+        print e
+        return
+
+    if args.mode == "CLI":
+        cli, msg = get_cli(resume=args.resume, directory=directory)
+        log_startup(cli)
+        start_cli(cli=cli, msg=msg, checkpoint=args.checkpoint)
+    elif args.mode == "BATCH":
+        # There's nobody to ask, so carry on from today unless told not to.
+        cli, msg = get_cli(resume=args.resume is not False,
+                           directory=directory)
+        commands = sys.stdin if args.file == "-" else open(args.file)
+        start = time.time()
+        try:
+            count = cli.run_batch(commands)
+        finally:
+            commands.close()
+        cli._storage.close()
+        cli._close_logfile()
+        print "Ran %d commands in %.3f seconds" % (count, time.time() - start)
+    elif args.mode == "UNIT":
+        run_unit_tests()
+    elif args.mode == "MIGRATE":
+        print "Imported %d days into %s" % (
+            migrate_pickles(directory),
+            os.path.join(directory, storage.SQLITE_FILENAME))
+    else:
+        AssertionError("TaskCLI failed to start.")
+
+if __name__ == '__main__':
+    # Run from the imported module rather than __main__ so that snapshots
+    # refer to TaskCLI.TaskCLI and can be loaded by TaskCLIApp too.
+    import TaskCLI
+    # Time startup from when this, the first, import began.
+    TaskCLI.IMPORTED = IMPORTED
+    TaskCLI.main()
@@ -1,253 +1,843 @@
-from flask import Flask, render_template, url_for, request
-from TaskCLI import get_cli, format_seconds, get_sub_tasks, run_unit_tests, \
-                    start_cli
-from collections import namedtuple
-import thread
-import traceback
-import utils
-import os
-import argparse
-import time
-import logging
-import re
-import pickle
-import math
-
-log = utils.get_logger(name=__name__)
-CLI_NUM = 0
-app = Flask(__name__)
-
-r_file = re.compile("(?P<day>[0-3][0-9])-(?P<month>[0-1][0-9])-"
-                    "(?P<year>[1-2][0-9]{3}).p")
-
-MESSAGE_HEADERS  = ("Time", "Task", "Message")
-TASK_HEADERS     = ("Task", "Date", "Start", "Stop", "Total", "Status") 
-ITEMS_PER_PAGE   = 15
-
-@app.route("/")
-def home_page():
-    urls = get_urls()
-    log.debug("Found following URLS: %s", "\n".join([url[1] for url in urls]))
-    return render_template("home.html", urls=urls)
-
-@app.route("/example")
-def example():
-    return render_template("example.html")
-
-@app.route("/messages")
-def messages():
-    log.debug("Loading /messages")
-    if cli.messages:
-        return render_template("messages.html", messages=cli.messages, 
-            message_headers=MESSAGE_HEADERS)
-    else:
-        return render_template("empty.html", text="No message to display.")
-
-@app.route("/historical_tasks")
-def historical_tasks():
-    page = int(request.args.get("page")) if request.args.get("page") else 1 
-    tasks = []
-    for f in os.listdir("."):
-        r = r_file.match(f)
-        if r:
-            d = r.groupdict()
-            tasks.append((d["day"], d["month"], d["year"]))
-    if len(tasks) == 0:
-        return render_template("empty.html", text="No historical tasks")
-
-    tasks = sorted(tasks, key=lambda x: (x[2] * 365 + x[1] * 31 + x[0]))
-    tasks.reverse()
-
-    prev_page, pages, next_page = get_pages(requested_page=page, 
-        items_per_page=ITEMS_PER_PAGE, num_items=len(tasks), num_options=5)
-
-    return render_template("historical_tasks.html", 
-        tasks=tasks[(page -1) * ITEMS_PER_PAGE: page * ITEMS_PER_PAGE], 
-        prev_page=prev_page, pages=pages, current_page=page, 
-        next_page=next_page)
-
-
-@app.route("/tasks/")
-def tasks():
-    cli_name = request.args.get("cli_name")
-    task_name = request.args.get("task_name")
-    # Show the current cli by default but allow historical views
-    if cli_name is not None and cli_name != "None":
-        task_cli = pickle.load(open(cli_name + ".p", "rb"))
-    else:
-        task_cli = cli   
-
-    log.debug("Loading /tasks") 
-    entry   = namedtuple("Entry", TASK_HEADERS)
-    tasks = task_cli.get_tasks(parent="None")
-    if not tasks:
-        return render_template("empty.html", text="No tasks to display.")
-
-    if task_name:
-        for task in tasks:
-            if task.name == task_name:
-                task = task
-                break
-        else:
-            return render_template("empty.html", text="Task does not exist.")  
-    else:
-        # If not specified default to first task in list.
-        task = tasks[0]
-    log.debug("Displaying task: %s", task.name)
-
-    # Get associated sub tasks.
-    sub_tasks = get_sub_tasks(cli, task)
-    log.debug("Found subtasks: %s", ", ".join([t.name for t in sub_tasks]))
-    sub_tasks.append(task)
-    sub_tasks.sort(key=lambda task: task.name)
-
-    entries = []
-    total_time = 0
-    for sub_task in sub_tasks:
-        for timer in sub_task.timers:
-
-            date, start = timer.start_time()
-            dummy, stop = timer.stop_time()
-            time_secs   = timer.total_time().total_seconds()
-            time_str    = format_seconds(time_secs)
-            status      = timer.status
-
-            entries.append(entry(Task=sub_task.name.lstrip(
-                                                    task.name).lstrip("-"),
-                                 Date=date,
-                                 Start=start,
-                                 Stop=stop,
-                                 Total=time_str,
-                                 Status=status))
-
-            if sub_task.name == task.name:
-                if time_secs:
-                    total_time += time_secs
-
-    # Add a summary to the end.
-    entries.append(entry(Task="Summary",
-                         Date="",
-                         Start="",
-                         Stop="",
-                         Total=format_seconds(total_time),
-                         Status=task.status))
-
-    log.debug("%s entry(s) for task", len(entries))
-
-    messages = [message for message in cli.messages if message[1] in 
-                [task.name for sub_task in sub_tasks]]
-
-    return render_template("tasks.html",
-                           current_task=task,
-                           tasks=tasks,
-                           messages=messages,
-                           entries=entries,
-                           task_headers=TASK_HEADERS,
-                           message_headers=MESSAGE_HEADERS,
-                           cli_name=cli_name)
-
-def get_urls():
-    links = []
-    for rule in app.url_map.iter_rules():
-        try: 
-            links.append((rule.endpoint, url_for(rule.endpoint)))
-        except Exception:
-            log.debug(traceback.format_exc())
-
-    return links
-
-def get_pages(requested_page, items_per_page, num_items, num_options):
-    first_page = requested_page - (num_options/2)
-    total_pages =  int(math.ceil(num_items / float(items_per_page))) 
-    
-    if first_page < 1:
-        first_page = 1
-    if first_page == requested_page:
-        prev = requested_page
-    else:
-        prev = requested_page - 1 
-
-    last_page = first_page + num_options
-
-    if last_page > total_pages:
-        first_page += total_pages - last_page
-        if first_page < 1:
-            first_page = 1
-        last_page = total_pages
-    if last_page == requested_page:
-        next = requested_page
-    else:
-        next = requested_page + 1
-
-    return prev, range(first_page, last_page + 1), next
-
-def get_args():
-    parser = argparse.ArgumentParser(description="TaskCLI WebServer")
-    parser.add_argument('mode', metavar='<mode>', type=str, 
-        help="Either - 'DEV' (to run as a development server), 'LIVE' (to run "
-             "the Live server), 'UNIT' (to run unit tests).")
-    parser.add_argument('--noreload', action='store_true',
-        help="stop the development server from autoreloading")
-    
-    args = parser.parse_args()
-
-    if args.mode in ["UNIT", "DEV", "LIVE"]:
-        pass
-    else:
-        parser.print_usage()
-        quit()
-
-    return args
-
-def start_unit_tests(cli):
-    print "Setting Up Unit Test Enviroment"
-    thread.start_new_thread(cli.cmdloop, ("UNIT TEST",))
-    run_unit_tests(cli)
-    time.sleep(5)
-
-    tc = app.test_client()
-    print " Unit Test Enviroment setup complete. Running Tests."
-
-    print "Test Get '/'"
-    tc.get("/")
-
-    print "Test Get '/messages'"
-    tc.get("/messages")
-
-    print "Test Get '/tasks'"
-    tc.get("/tasks")
-
-    print "Tests Passed."
-    quit()
-
-def start_live_server(cli, msg):
-    logging.getLogger('werkzeug').setLevel(logging.ERROR)
-    thread.start_new_thread(start_cli, (cli, msg))
-    app.run()
-
-def start_dev_server(cli, use_reloader=True):
-    # If we're not careful here the Werkzeug reloader will created multiple
-    # instances of the TaskCLI object resulting in some funky behaviour. More
-    # details here: http://stackoverflow.com/questions/11571656
-    if use_reloader and not os.environ.get("WERKZEUG_RUN_MAIN"):
-        log.info('startup: pid %d is the werkzeug reloader', os.getpid())
-    else:
-        log.info('startup: pid %d is the active werkzeug', os.getpid())
-        thread.start_new_thread(start_cli, (cli, msg + " DEVELOPMENT"))
-
-    app.run(debug=True, use_reloader=use_reloader)
-
-
-if __name__ == "__main__":
-
-    args = get_args()
-    cli, msg = get_cli()
-
-    if args.mode == "UNIT":
-        start_unit_tests(cli)
-    elif args.mode == "DEV":
-        start_dev_server(cli, use_reloader=(not args.noreload))
-    elif args.mode == "LIVE":
-        start_live_server(cli, msg)
-    else:
-        AssertionError("Webserver failed to start.")
+from flask import Flask, render_template, url_for, request, jsonify, \
+                  Response, g, abort
+from TaskCLI import get_cli, format_seconds, get_sub_tasks, run_unit_tests, \
+                    start_cli, add_resume_args, add_metrics_args, \
+                    add_checkpoint_args, add_session_args, log_startup
+from cache import SnapshotCache, RenderCache
+from catalog import Catalog, r_file
+from reports import build_report, normalise_date
+from rollups import heatmap, rollup, BUCKETS, WEEKDAYS
+from state import changes
+from intervals import find_timers
+from search import RESULTS_PER_PAGE
+from sessions import SessionRegistry, session_directory
+from collections import namedtuple
+import thread
+import traceback
+import utils
+import storage
+import metrics
+import os
+import argparse
+import time
+import datetime
+import logging
+import math
+import json
+import hmac
+import shutil
+
+log = utils.get_logger(name=__name__)
+app = Flask(__name__)
+
+# The default session, served without a /s/<session> prefix, is the cli 
+# this process was started with.
+catalog = Catalog()
+snapshots = SnapshotCache()
+renders = RenderCache()
+# The named sessions, served under /s/<session>.
+sessions = SessionRegistry()
+# Needed, as an X-TaskCLI-Token header, to create sessions or run commands
+# in them from another machine, see check_access(). Set by --token.
+access_token = None
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+
+MESSAGE_HEADERS  = ("Time", "Task", "Message")
+TASK_HEADERS     = ("Task", "Date", "Start", "Stop", "Total", "Status") 
+REPORT_HEADERS   = ("Task", "Days", "Total")
+SEARCH_HEADERS   = ("Day", "Time", "Task", "Message")
+Entry            = namedtuple("Entry", TASK_HEADERS)
+ITEMS_PER_PAGE   = 15
+MESSAGES_PER_PAGE = 50
+REPORT_DAYS      = 30
+# How long clients may cache what the API returns for archived days.
+API_CACHE_SECONDS = 365 * 24 * 60 * 60
+# Part of the live day's ETags, as versions restart with the server.
+API_EPOCH        = "%x" % int(time.time())
+# Seconds between the running totals sent to /events.
+TICK_SECONDS     = 5
+
+@app.before_request
+def start_timing():
+    if metrics.ENABLED:
+        g.started = time.time()
+
+@app.after_request
+def record_timing(response):
+    started = g.pop("started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.request_seconds.observe(time.time() - started, route)
+        # Streamed responses, e.g. /events, have no length.
+        length = response.calculate_content_length()
+        if length is not None:
+            metrics.response_bytes.observe(length, route)
+    return response
+
+def session_route(rule, **options):
+    """Registers a view for the default session at rule and for the named 
+    sessions at /s/<session> + rule. The view is run with g.cli, g.catalog 
+    and g.snapshots set to those of the session, see load_session()."""
+    def decorator(view):
+        # The named sessions' rule goes first, so that url_for() only 
+        # builds it when given a session.
+        app.add_url_rule("/s/<session>" + rule, view_func=view, **options)
+        app.add_url_rule(rule, view_func=view, **options)
+        return view
+    return decorator
+
+@app.url_value_preprocessor
+def load_session(endpoint, values):
+    name = values.pop("session", None) if values else None
+    g.session = name
+    if name is None:
+        g.cli, g.catalog, g.snapshots = cli, catalog, snapshots
+        g.prefix = ""
+        return
+    session = sessions.get(name)
+    if session is None:
+        abort(404)
+    g.cli, g.catalog, g.snapshots = (session.cli, session.catalog, 
+                                     session.snapshots)
+    g.prefix = "/s/%s" % name
+
+@app.url_defaults
+def add_session(endpoint, values):
+    # Links from a session's pages stay in the session.
+    session = g.get("session")
+    if (session and "session" not in values and 
+            app.url_map.is_endpoint_expecting(endpoint, "session")):
+        values["session"] = session
+
+@app.route("/metrics")
+def metrics_page():
+    return Response(metrics.render(), 
+                    mimetype="text/plain; version=0.0.4")
+
+@session_route("/")
+def home_page():
+    urls = get_urls()
+    log.debug("Found following URLS: %s", "\n".join([url[1] for url in urls]))
+    return render_template("home.html", urls=urls)
+
+@app.route("/example")
+def example():
+    return render_template("example.html")
+
+@session_route("/messages")
+def messages():
+    log.debug("Loading /messages")
+    before = request.args.get("before", type=int)
+    page, cursor = g.cli.state.messages.page(before=before, 
+        limit=MESSAGES_PER_PAGE)
+    if page:
+        return render_template("messages.html", messages=page, 
+            message_headers=MESSAGE_HEADERS,
+            **get_message_pager("messages", before, cursor))
+    else:
+        return render_template("empty.html", text="No message to display.")
+
+@session_route("/historical_tasks")
+def historical_tasks():
+    page = int(request.args.get("page")) if request.args.get("page") else 1 
+    g.catalog.refresh()
+    if len(g.catalog) == 0:
+        return render_template("empty.html", text="No historical tasks")
+
+    prev_page, pages, next_page = get_pages(requested_page=page, 
+        items_per_page=ITEMS_PER_PAGE, num_items=len(g.catalog), 
+        num_options=5)
+
+    tasks = [(date, entries, format_seconds(seconds)) for date, entries, 
+             seconds in g.catalog.page(page, ITEMS_PER_PAGE)]
+
+    return render_template("historical_tasks.html", 
+        tasks=tasks, prev_page=prev_page, pages=pages, current_page=page, 
+        next_page=next_page, cache_stats=g.snapshots.stats(),
+        render_stats=renders.stats())
+
+
+@session_route("/reports")
+def reports():
+    today = datetime.date.today()
+    start = request.args.get("from") or (
+        today - datetime.timedelta(days=REPORT_DAYS)).strftime("%d-%m-%Y")
+    end = request.args.get("to") or today.strftime("%d-%m-%Y")
+
+    log.debug("Loading /reports from %s to %s", start, end)
+    try:
+        report = build_report(start, end, directory=g.cli._directory)
+    except ValueError:
+        return render_template("empty.html", 
+            text="Dates must be given as DD-MM-YYYY.")
+    if not report:
+        return render_template("empty.html", 
+            text="No tasks were archived between %s and %s." % (start, end))
+
+    rows = [(name, days, format_seconds(seconds)) for name, seconds, days in
+            report]
+    return render_template("reports.html", rows=rows, start=start, end=end,
+        report_headers=REPORT_HEADERS)
+
+
+@session_route("/search")
+def search():
+    query = request.args.get("q", "").encode("utf-8")
+    page = max(request.args.get("page", 1, type=int), 1)
+    results, total = [], 0
+    if query.strip():
+        log.debug("Searching for %r, page %d", query, page)
+        g.cli._search.catch_up(g.cli.state.date)
+        g.cli._search.sync(g.cli.state)
+        results, total = g.cli._search.search(query, page)
+
+    prev_page, pages, next_page = get_pages(requested_page=page, 
+        items_per_page=RESULTS_PER_PAGE, num_items=total, num_options=5)
+    return render_template("search.html", query=query.decode("utf-8"), 
+        results=results, total=total, prev_page=prev_page, pages=pages, 
+        current_page=page, next_page=next_page, today=g.cli.state.date,
+        search_headers=SEARCH_HEADERS)
+
+@session_route("/tasks/")
+def tasks():
+    cli_name = request.args.get("cli_name")
+    task_name = request.args.get("task_name")
+    before = request.args.get("before", type=int)
+    # Show the current cli by default but allow historical views
+    if cli_name is not None and cli_name != "None":
+        version = get_stored_version(cli_name, g.cli._directory)
+        if version is None:
+            return render_template("empty.html", text="Day does not exist.")
+        # An archived day only changes if it is stored again.
+        key = ("tasks", g.session, cli_name, task_name, before, version)
+        page = renders.get(key)
+        if page is None:
+            task_cli = g.snapshots.get(cli_name).state
+            log.debug("Snapshot cache: %(hits)s hits, %(misses)s misses",
+                      g.snapshots.stats())
+            page = render_tasks(task_cli, cli_name, task_name, before)
+            renders.put(key, page, persist=True)
+        return page
+
+    # The state last published by the CLI thread, which won't change 
+    # while the page is rendered.
+    task_cli = g.cli.state
+    if task_cli.current is not None:
+        # Running timers change the page as time goes by.
+        return render_tasks(task_cli, cli_name, task_name, before)
+    key = ("tasks", g.session, task_cli.date, task_name, before, API_EPOCH, 
+           task_cli.version)
+    page = renders.get(key)
+    if page is None:
+        page = render_tasks(task_cli, cli_name, task_name, before)
+        renders.put(key, page)
+    return page
+
+def render_tasks(task_cli, cli_name, task_name, before):
+    """render_tasks
+
+    Renders the /tasks page.
+
+    Params:  task_cli  - The DayState of the day to show.
+             cli_name  - The day's cli_name argument, None for the live day.
+             task_name - The top level task to show, None for the first.
+             before    - The cursor for the page of messages.
+
+    Returns: The page, UTF-8 encoded.
+    """
+    log.debug("Loading /tasks") 
+    tasks = task_cli.get_tasks(parent="None")
+    if not tasks:
+        return render_template("empty.html", 
+            text="No tasks to display.").encode("utf-8")
+
+    if task_name:
+        task = task_cli.get_task(task_name)
+        if task is None or task.parent is not None:
+            return render_template("empty.html", 
+                text="Task does not exist.").encode("utf-8")
+    else:
+        # If not specified default to first task in list.
+        task = tasks[0]
+    log.debug("Displaying task: %s", task.name)
+
+    # Get associated sub tasks.
+    sub_tasks = get_sub_tasks(task_cli, task)
+    log.debug("Found subtasks: %s", ", ".join([t.name for t in sub_tasks]))
+    sub_tasks.append(task)
+    sub_tasks.sort(key=lambda task: task.name)
+
+    entries = []
+    for sub_task in sub_tasks:
+        for timer in sub_task.timers:
+
+            date, start = timer.start_time()
+            dummy, stop = timer.stop_time()
+            time_secs   = timer.total_time().total_seconds()
+            time_str    = format_seconds(time_secs)
+            status      = timer.status
+
+            entries.append(Entry(Task=sub_task.name.lstrip(
+                                                    task.name).lstrip("-"),
+                                 Date=date,
+                                 Start=start,
+                                 Stop=stop,
+                                 Total=time_str,
+                                 Status=status))
+
+    # Add a summary to the end.
+    entries.append(Entry(Task="Summary",
+                         Date="",
+                         Start="",
+                         Stop="",
+                         Total=format_seconds(task.own_seconds()),
+                         Status=task.status))
+
+    log.debug("%s entry(s) for task", len(entries))
+
+    messages, cursor = task_cli.messages.page(before=before, 
+        limit=MESSAGES_PER_PAGE, tasks=[sub_task.name for sub_task in sub_tasks])
+
+    return render_template("tasks.html",
+                           current_task=task,
+                           tasks=tasks,
+                           messages=messages,
+                           entries=entries,
+                           task_headers=TASK_HEADERS,
+                           message_headers=MESSAGE_HEADERS,
+                           cli_name=cli_name,
+                           **get_message_pager("tasks", before, cursor,
+                                               cli_name=cli_name,
+                                               task_name=task.name)
+                           ).encode("utf-8")
+
+@session_route("/api/days")
+def api_days():
+    page = request.args.get("page", 1, type=int)
+    g.catalog.refresh()
+    etag = "days-%r-%s-%s" % (g.catalog.version, page, ITEMS_PER_PAGE)
+    return api_response(etag, lambda: {
+        "page": page,
+        "pages": int(math.ceil(len(g.catalog) / float(ITEMS_PER_PAGE))),
+        "days": [{"day": date, "timers": entries, "seconds": seconds} for 
+                 date, entries, seconds in 
+                 g.catalog.page(page, ITEMS_PER_PAGE)]})
+
+@session_route("/api/tasks")
+def api_tasks():
+    def build(state):
+        return {"day": state.date,
+                "current": state.current,
+                "tasks": [task_json(task) for task in 
+                          sorted(state.get_tasks(), key=lambda t: t.name)]}
+    return api_day_response(build)
+
+@session_route("/api/tasks/<task_name>/timers")
+def api_timers(task_name):
+    def build(state):
+        task = state.get_task(task_name)
+        if task is None:
+            return None
+        timers = [{"task": sub_task.name, "start": start, "stop": stop} for 
+                  sub_task in [task] + get_sub_tasks(state, task) for 
+                  start, stop in sub_task.intervals()]
+        timers.sort(key=lambda timer: timer["start"])
+        return {"day": state.date, "task": task.name, "timers": timers}
+    return api_day_response(build)
+
+@session_route("/api/running")
+def api_running():
+    """The timers running at "at", or at any point between "at" and "to", 
+    given in seconds since the epoch."""
+    start = request.args.get("at", type=float)
+    stop = request.args.get("to", type=float)
+    if start is None or (stop is not None and stop < start):
+        return api_error(400, "Give the time as at=<seconds>, and the end "
+                         "of a range as to=<seconds>.")
+    def build(state):
+        return {"day": state.date,
+                "at": start,
+                "to": stop,
+                "timers": [{"task": name, "start": timer_start, 
+                            "stop": timer_stop} for 
+                           name, timer_start, timer_stop in 
+                           find_timers(state, start, stop)]}
+    return api_day_response(build)
+
+@session_route("/api/messages")
+def api_messages():
+    before = request.args.get("before", type=int)
+    limit = min(request.args.get("limit", MESSAGES_PER_PAGE, type=int), 
+                MESSAGES_PER_PAGE)
+    task_name = request.args.get("task")
+    def build(state):
+        names = None
+        if task_name:
+            task = state.get_task(task_name)
+            if task is None:
+                return None
+            names = [task.name] + [t.name for t in get_sub_tasks(state, task)]
+        messages, cursor = state.messages.page(before=before, limit=limit, 
+                                               tasks=names)
+        return {"day": state.date,
+                "cursor": cursor,
+                "messages": [{"time": time_, "task": task, "message": text}
+                             for time_, task, text in messages]}
+    return api_day_response(build)
+
+@session_route("/api/heatmap")
+def api_heatmap():
+    """The time spent in each hour of each day of the week between "from" 
+    and "to", for tasks starting with "task" if given. A "bucket" of hour, 
+    day or week also gives the totals for each of those."""
+    today = datetime.date.today()
+    bucket = request.args.get("bucket")
+    prefix = request.args.get("task")
+    try:
+        start = normalise_date(request.args.get("from") or (
+            today - datetime.timedelta(days=REPORT_DAYS)).strftime("%d-%m-%Y"))
+        end = normalise_date(request.args.get("to") or 
+                             today.strftime("%d-%m-%Y"))
+    except ValueError:
+        return api_error(400, "Dates must be given as DD-MM-YYYY.")
+    if bucket and bucket not in BUCKETS:
+        return api_error(400, "The bucket must be one of %s." % 
+                         ", ".join(BUCKETS))
+
+    live = g.cli.state
+    directory = g.cli._directory
+    g.catalog.refresh()
+    etag = "heatmap-%r-%s-%s" % (g.catalog.version, API_EPOCH, live.version)
+    if live.current:
+        # The running task's time goes up without a new version.
+        etag += "-%d" % (time.time() // TICK_SECONDS)
+    def build():
+        result = {"from": start,
+                  "to": end,
+                  "task": prefix,
+                  "weekdays": WEEKDAYS,
+                  "hours": heatmap(start, end, prefix, live, directory)}
+        if bucket:
+            result["bucket"] = bucket
+            result["buckets"] = [{"start": label, "seconds": seconds} for 
+                                 label, seconds in 
+                                 rollup(start, end, bucket, prefix, live, 
+                                        directory)]
+        return result
+    return api_response(etag, build)
+
+@app.route("/api/sessions", methods=["GET", "POST"])
+def api_sessions():
+    """Lists the named sessions or, POSTed a "name", creates one."""
+    if request.method == "POST":
+        denied = check_access()
+        if denied:
+            return denied
+        try:
+            session, created = sessions.create(request.values.get("name"))
+        except ValueError as e:
+            return api_error(400, str(e))
+        response = jsonify({"session": session.name, 
+                            "url": url_for("tasks", session=session.name)})
+        response.status_code = 201 if created else 200
+        return response
+    return jsonify({"sessions": sessions.names()})
+
+# The default session has its own prompt to type commands at.
+@app.route("/s/<session>/api/commands", methods=["POST"])
+def api_commands():
+    """Runs a "command" in the session, one of addtask, starttask, 
+    stoptask or M with its argument, e.g. "starttask a"."""
+    denied = check_access()
+    if denied:
+        return denied
+    command = request.values.get("command", "").encode("utf-8")
+    try:
+        state = sessions.get(g.session).run(command)
+    except ValueError as e:
+        return api_error(400, str(e))
+    return jsonify({"session": g.session,
+                    "day": state.date,
+                    "version": state.version,
+                    "current": state.current})
+
+@session_route("/events")
+def events():
+    """Streams what happens in the live day as server-sent events. Each 
+    command sends "started", "stopped" and "message" events as they 
+    apply, a "day" event when a new day starts, and every TICK_SECONDS a 
+    "tick" event gives the running totals."""
+    # The stream outlives the request, and g with it.
+    cli = g.cli
+    def stream():
+        state = cli.state
+        yield "retry: %d\n\n" % (TICK_SECONDS * 1000)
+        yield sse_event("tick", tick_json(state), state.version)
+        next_tick = time.time() + TICK_SECONDS
+        while True:
+            latest = cli.wait_for_state(state.version, 
+                                        max(next_tick - time.time(), 0))
+            for event, data in changes(state, latest):
+                yield sse_event(event, data, latest.version)
+            state = latest
+            if time.time() >= next_tick:
+                yield sse_event("tick", tick_json(state), state.version)
+                next_tick = time.time() + TICK_SECONDS
+
+    return Response(stream(), mimetype="text/event-stream", 
+                    headers={"Cache-Control": "no-cache"})
+
+def sse_event(event, data, version):
+    return "id: %s\nevent: %s\ndata: %s\n\n" % (version, event, 
+                                                  json.dumps(data))
+
+def tick_json(state):
+    """Gets the current totals of the running tasks in a DayState."""
+    now = time.time()
+    return {"day": state.date,
+            "current": state.current,
+            "running": dict((task.name, task.own_seconds(now)) for task in 
+                            state.get_tasks(status="Running"))}
+
+def task_json(task):
+    """Gets the JSON for a TaskState. Running time isn't included, so that 
+    it only changes with the version, but can be worked out from 
+    running_since."""
+    return {"name": task.name,
+            "parent": task.parent_name,
+            "status": task.status,
+            "timers": len(task.timers),
+            "stopped_seconds": task.stopped_seconds,
+            "running_since": task.running_since}
+
+def api_day_response(build):
+    """api_day_response
+
+    Responds to an API request for the live day or, if a "day" argument
+    is given, an archived one. The live day's ETag is its state's version
+    while an archived day's is the version of its stored copy, so either
+    can be answered with a 304 without being loaded.
+
+    Params:  build - Function taking the day's DayState and returning the
+                     result, or None if what was asked for doesn't exist.
+
+    Returns: The response.
+    """
+    day = request.args.get("day")
+    live = g.cli.state
+    if not day or day == live.date:
+        etag = "%s-%s-%s" % (live.date, API_EPOCH, live.version)
+        return api_response(etag, lambda: build(live))
+
+    version = get_stored_version(day, g.cli._directory)
+    if version is None:
+        return api_error(404, "Day does not exist.")
+    etag = "%s-%r" % (day, version)
+    return api_response(etag, lambda: build(g.snapshots.get(day).state), 
+                        max_age=API_CACHE_SECONDS)
+
+def api_response(etag, build, max_age=None):
+    """api_response
+
+    Responds with JSON, or a 304 if the client already has the same ETag.
+
+    Params:  etag    - The ETag of the result.
+             build   - Function returning the result, only called if it's 
+                       needed. None if what was asked for doesn't exist.
+             max_age - How long the result may be cached for without 
+                       checking back. By default it must always be checked.
+
+    Returns: The response.
+    """
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        # The ETag covers everything the result depends on, so it can be
+        # cached along with the request's arguments.
+        key = ("api", request.full_path, etag)
+        body = renders.get(key)
+        if body is None:
+            result = build()
+            if result is None:
+                return api_error(404, "Not found.")
+            body = jsonify(result).get_data()
+            renders.put(key, body, persist=bool(max_age))
+        response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    if max_age:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+def get_stored_version(day, directory=""):
+    """Returns the version of an archived day's stored copy, without loading
+    it, or None if the day isn't stored."""
+    if not r_file.match(day + ".p"):
+        return None
+    day_storage = storage.open_storage(day, directory)
+    try:
+        return day_storage.stat()[0]
+    except (IOError, OSError):
+        return None
+    finally:
+        day_storage.close()
+
+def check_access():
+    """check_access
+
+    Checks a request that changes a session may be made. Requests from 
+    another site's pages are refused, as are those from another machine 
+    unless they give the access_token.
+
+    Returns: The error response if it may not, otherwise None.
+    """
+    origin = request.headers.get("Origin")
+    if origin and origin.rstrip("/") != request.host_url.rstrip("/"):
+        return api_error(403, "Requests from other sites aren't allowed.")
+    if access_token:
+        token = request.headers.get("X-TaskCLI-Token", "")
+        if isinstance(token, unicode):
+            token = token.encode("utf-8")
+        if not hmac.compare_digest(token, access_token):
+            return api_error(403, "A valid X-TaskCLI-Token is needed.")
+    elif request.remote_addr not in LOCAL_ADDRESSES:
+        return api_error(403, "Only allowed from this machine without a "
+                         "--token.")
+    return None
+
+def api_error(status, text):
+    response = jsonify({"error": text})
+    response.status_code = status
+    return response
+
+def get_urls():
+    links = []
+    for rule in app.url_map.iter_rules():
+        # Each session's are the same links, see session_route().
+        if "session" in rule.arguments:
+            continue
+        try: 
+            links.append((rule.endpoint, url_for(rule.endpoint)))
+        except Exception:
+            log.debug(traceback.format_exc())
+
+    return links
+
+def get_message_pager(endpoint, before, cursor, **args):
+    """get_message_pager
+
+    Gets the links for paging through messages by cursor.
+
+    Params:  endpoint - The endpoint the messages are shown on.
+             before   - The cursor the current page was requested with.
+             cursor   - The cursor for the next, older, page.
+             args     - Any other arguments for the endpoint.
+
+    Returns: A dict of the "newest_url" and "older_url", either may be None.
+    """
+    newest_url = url_for(endpoint, **args) if before is not None else None
+    older_url = (url_for(endpoint, before=cursor, **args) if cursor is not None
+                 else None)
+    return {"newest_url": newest_url, "older_url": older_url}
+
+def get_pages(requested_page, items_per_page, num_items, num_options):
+    first_page = requested_page - (num_options/2)
+    total_pages =  int(math.ceil(num_items / float(items_per_page))) 
+    
+    if first_page < 1:
+        first_page = 1
+    if first_page == requested_page:
+        prev = requested_page
+    else:
+        prev = requested_page - 1 
+
+    last_page = first_page + num_options
+
+    if last_page > total_pages:
+        first_page += total_pages - last_page
+        if first_page < 1:
+            first_page = 1
+        last_page = total_pages
+    if last_page == requested_page:
+        next = requested_page
+    else:
+        next = requested_page + 1
+
+    return prev, range(first_page, last_page + 1), next
+
+def get_args():
+    parser = argparse.ArgumentParser(description="TaskCLI WebServer")
+    parser.add_argument('mode', metavar='<mode>', type=str, 
+        help="Either - 'DEV' (to run as a development server), 'LIVE' (to run "
+             "the Live server), 'UNIT' (to run unit tests).")
+    parser.add_argument('--noreload', action='store_true',
+        help="stop the development server from autoreloading")
+    parser.add_argument('--storage', choices=storage.BACKENDS,
+        default=storage.BACKEND, help="where to keep the tasks")
+    parser.add_argument('--render-cache', metavar='<dir>',
+        help="also keep rendered pages for archived days in this directory")
+    parser.add_argument('--host', default="127.0.0.1",
+        help="the address to listen on, defaults to only this machine")
+    parser.add_argument('--token', 
+        help="allow sessions to be created, and sent commands, from other "
+             "machines by requests with this X-TaskCLI-Token header")
+    add_resume_args(parser)
+    add_session_args(parser)
+    add_checkpoint_args(parser)
+    add_metrics_args(parser)
+    
+    args = parser.parse_args()
+
+    if args.mode in ["UNIT", "DEV", "LIVE"]:
+        pass
+    else:
+        parser.print_usage()
+        quit()
+
+    return args
+
+def start_unit_tests(cli):
+    print "Setting Up Unit Test Enviroment"
+    thread.start_new_thread(cli.cmdloop, ("UNIT TEST",))
+    run_unit_tests(cli)
+    time.sleep(5)
+
+    tc = app.test_client()
+    print " Unit Test Enviroment setup complete. Running Tests."
+
+    print "Test Get '/'"
+    tc.get("/")
+
+    print "Test Get '/messages'"
+    tc.get("/messages")
+
+    print "Test Get '/tasks'"
+    tc.get("/tasks")
+
+    print "Test Get '/search'"
+    tc.get("/search?q=message")
+
+    print "Test Get '/api/tasks'"
+    response = tc.get("/api/tasks")
+    assert response.status_code == 200 and response.headers["ETag"]
+    response = tc.get("/api/tasks", 
+                      headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+    print "Test Get '/api/heatmap'"
+    response = tc.get("/api/heatmap?bucket=week")
+    assert (response.status_code == 200 and 
+            len(json.loads(response.data)["hours"]) == 7)
+    assert tc.get("/api/heatmap?bucket=year").status_code == 400
+
+    print "Test Get '/api/running'"
+    response = tc.get("/api/running?at=%f" % time.time())
+    assert response.status_code == 200
+    assert tc.get("/api/running").status_code == 400
+
+    print "Test Get '/metrics'"
+    response = tc.get("/metrics")
+    assert 'taskcli_http_request_seconds_count{route="/api/tasks"} 2' in \
+        response.data
+
+    print "Test '/s/<session>'"
+    response = tc.post("/api/sessions", data={"name": "unit_test"})
+    assert response.status_code in (200, 201)
+    assert "unit_test" in json.loads(tc.get("/api/sessions").data)["sessions"]
+    assert tc.post("/api/sessions", data={"name": "../x"}).status_code == 400
+    for command in ["addtask unit_test_session", 
+                    "starttask unit_test_session"]:
+        response = tc.post("/s/unit_test/api/commands", 
+                           data={"command": command})
+        assert response.status_code == 200
+    assert json.loads(response.data)["current"] == "unit_test_session"
+    assert tc.post("/s/unit_test/api/commands", 
+                   data={"command": "exit"}).status_code == 400
+    response = tc.get("/s/unit_test/api/tasks")
+    assert json.loads(response.data)["current"] == "unit_test_session"
+    response = tc.get("/api/tasks")
+    assert "unit_test_session" not in [task["name"] for task in 
+                                       json.loads(response.data)["tasks"]]
+    assert tc.get("/s/unit_test_missing/api/tasks").status_code == 404
+    # Changes must come from this machine, or give the token, and never
+    # from another site's page.
+    global access_token
+    remote = {"REMOTE_ADDR": "10.0.0.1"}
+    command = {"command": "M unit test"}
+    assert tc.post("/s/unit_test/api/commands", data=command, 
+                   headers={"Origin": "http://example.com"}
+                   ).status_code == 403
+    assert tc.post("/api/sessions", data={"name": "unit_test"}, 
+                   environ_base=remote).status_code == 403
+    access_token = "unit_test_token"
+    assert tc.post("/s/unit_test/api/commands", data=command, 
+                   environ_base=remote).status_code == 403
+    assert tc.post("/s/unit_test/api/commands", data=command, 
+                   environ_base=remote, 
+                   headers={"X-TaskCLI-Token": access_token}
+                   ).status_code == 200
+    access_token = None
+    # Stop the session and throw its days away.
+    sessions.get("unit_test").cli.do_exit("")
+    directory = session_directory("unit_test")
+    shutil.rmtree(directory)
+    if not os.listdir(os.path.dirname(directory)):
+        os.rmdir(os.path.dirname(directory))
+
+    print "Tests Passed."
+    quit()
+
+def start_live_server(cli, msg, checkpoint, host="127.0.0.1"):
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    thread.start_new_thread(start_cli, (cli, msg, checkpoint))
+    app.run(host=host)
+
+def start_dev_server(cli, checkpoint, use_reloader=True, host="127.0.0.1"):
+    # If we're not careful here the Werkzeug reloader will created multiple
+    # instances of the TaskCLI object resulting in some funky behaviour. More
+    # details here: http://stackoverflow.com/questions/11571656
+    if use_reloader and not os.environ.get("WERKZEUG_RUN_MAIN"):
+        log.info('startup: pid %d is the werkzeug reloader', os.getpid())
+    else:
+        log.info('startup: pid %d is the active werkzeug', os.getpid())
+        thread.start_new_thread(start_cli,
+                                (cli, msg + " DEVELOPMENT", checkpoint))
+
+    app.run(host=host, debug=True, use_reloader=use_reloader)
+
+
+if __name__ == "__main__":
+
+    args = get_args()
+    storage.BACKEND = args.storage
+    metrics.ENABLED = args.metrics
+    if args.render_cache:
+        renders = RenderCache(directory=args.render_cache)
+    sessions = SessionRegistry(checkpoint=args.checkpoint)
+    access_token = args.token
+    directory = ""
+    if args.session:
+        try:
+            directory = session_directory(args.session)
+        except ValueError as e:
+            print e
+            quit()
+        catalog = Catalog(directory=directory)
+        snapshots = SnapshotCache(directory=directory)
+    cli, msg = get_cli(resume=args.resume, directory=directory)
+    if args.session:
+        # Served under /s/<session> too, rather than opened again.
+        sessions.add(args.session, cli)
+    log_startup(cli)
+
+    if args.mode == "UNIT":
+        start_unit_tests(cli)
+    elif args.mode == "DEV":
+        start_dev_server(cli, args.checkpoint,
+                         use_reloader=(not args.noreload), host=args.host)
+    elif args.mode == "LIVE":
+        start_live_server(cli, msg, args.checkpoint, host=args.host)
+    else:
+        AssertionError("Webserver failed to start.")
@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from TaskCLI import TaskCLI, simulate_cmd, get_sub_tasks
+from storage import PickleStorage
+
+
+def generate_day(cli, tasks=200, depth=3, timers=5, messages=1000):
+    """generate_day
+
+    Fills a TaskCLI with a synthetic day through simulate_cmd, the same way
+    a user would.
+
+    Tasks are made in chains of depth tasks, each the child of the one
+    before. Each chain is then worked through timers times, starting each
+    task down the chain in turn, logging its share of the messages against
+    the deepest one and stopping them all again.
+
+    Params:  cli      - The TaskCLI to fill, expected to be empty.
+             tasks    - The number of tasks.
+             depth    - How deeply tasks are nested, 1 for no sub tasks.
+             timers   - The number of timers each task gets.
+             messages - The number of messages to log.
+
+    Returns: The number of commands run.
+    """
+    chains = []
+    for first in xrange(0, tasks, depth):
+        chain = []
+        for number in xrange(first, min(first + depth, tasks)):
+            simulate_cmd(cli, "addtask t%d" % number)
+            chain.append("-".join(chain[-1:] + ["t%d" % number]))
+            simulate_cmd(cli, "starttask %s" % chain[-1])
+        for ii in xrange(len(chain)):
+            simulate_cmd(cli, "stoptask")
+        chains.append(chain)
+    commands = tasks * 3
+
+    steps = len(chains) * max(timers - 1, 1)
+    logged = 0
+    for step in xrange(steps):
+        chain = chains[step % len(chains)]
+        run = timers > 1
+        if run:
+            for name in chain:
+                simulate_cmd(cli, "starttask %s" % name)
+        # Spread the messages evenly over the steps.
+        while logged < messages * (step + 1) / steps:
+            simulate_cmd(cli, "M Synthetic message number %d." % logged)
+            logged += 1
+        if run:
+            for name in chain:
+                simulate_cmd(cli, "stoptask")
+        commands += len(chain) * 2 * run
+    return commands + logged
+
+def archive_days(cli, days):
+    """Saves copies of a TaskCLI as the days before it, as if it had been
+    run on each of them. Returns the dates, oldest first."""
+    today = cli.date
+    day, month, year = [int(part) for part in today.split("-")]
+    first = time.mktime((year, month, day, 12, 0, 0, 0, 0, -1))
+    dates = [time.strftime("%d-%m-%Y", time.localtime(first - 86400 * ii))
+             for ii in xrange(days, 0, -1)]
+    live_storage = cli._storage
+    try:
+        for date in dates:
+            cli.date = date
+            cli._storage = PickleStorage(date)
+            cli._save()
+            cli._storage.close()
+    finally:
+        cli.date = today
+        cli._storage = live_storage
+    return dates
+
+def timed(func, repeat):
+    """Runs func repeat times, returning a dict of the timings in seconds."""
+    times = []
+    for ii in xrange(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    times.sort()
+    return {"runs":   repeat,
+            "min":    times[0],
+            "median": times[len(times) / 2],
+            "mean":   sum(times) / len(times)}
+
+def run_benchmarks(tasks, depth, timers, messages, days, repeat):
+    """run_benchmarks
+
+    Generates a day, and some archived days, and times each of the hot
+    paths against them. Commands are run through simulate_cmd, as typed at
+    the prompt, while the helpers the web pages use to walk the tasks are
+    called directly as that's how those pages call them. Web pages that
+    don't respond with 200 are left out rather than timed. Must be run in
+    an empty directory.
+
+    Params:  tasks, depth, timers, messages - See generate_day().
+             days   - The number of archived days.
+             repeat - How many times to time each path.
+
+    Returns: A dict of benchmark name to timings, see timed().
+    """
+    results = {}
+
+    cli = TaskCLI()
+    start = time.time()
+    commands = generate_day(cli, tasks, depth, timers, messages)
+    seconds = time.time() - start
+    results["generate_day"] = {"runs": 1, "commands": commands,
+                               "seconds": seconds,
+                               "per_command": seconds / commands}
+    results["archive_days"] = timed(lambda: archive_days(cli, days), 1)
+
+    roots = cli.get_tasks(parent="None")
+    results["do_times"] = timed(lambda: simulate_cmd(cli, "times"), repeat)
+    results["do_times_totals"] = timed(
+        lambda: simulate_cmd(cli, "times totals"), repeat)
+    deepest = max(cli.get_tasks(), key=lambda task: task.name.count("-"))
+    def start_stop():
+        simulate_cmd(cli, "starttask %s" % deepest.name)
+        simulate_cmd(cli, "M Benchmark message.")
+        simulate_cmd(cli, "stoptask")
+    results["do_starttask_M_stoptask"] = timed(start_stop, repeat)
+    results["get_sub_tasks"] = timed(
+        lambda: [get_sub_tasks(cli, root) for root in roots], repeat)
+    results["get_tasks_running"] = timed(
+        lambda: cli.get_tasks(status="Running"), repeat)
+
+    day = PickleStorage(cli.date)
+    results["pickle_save"] = timed(lambda: day.save(cli), repeat)
+    results["pickle_load"] = timed(day.load, repeat)
+    # Loading leaves timers packed, so time using them as well.
+    results["pickle_load_hydrate"] = timed(
+        lambda: [len(task.timers) for task in day.load()._tasks.values()],
+        repeat)
+    day.close()
+    results["snapshot_bytes"] = {"runs": 1,
+                                 "bytes": os.path.getsize(cli.date + ".p")}
+
+    try:
+        import TaskCLIApp
+    except ImportError:
+        # Flask isn't installed, leave out the web benchmarks.
+        return results
+
+    TaskCLIApp.cli = cli
+    client = TaskCLIApp.app.test_client()
+    archived = archive_days(cli, 1)[0]
+    for name, url in [
+            ("web_tasks", "/tasks/?task_name=t0"),
+            ("web_tasks_archived",
+             "/tasks/?task_name=t0&cli_name=%s" % archived),
+            ("web_historical_tasks", "/historical_tasks"),
+            ("web_messages", "/messages"),
+            ("web_api_tasks", "/api/tasks")]:
+        status = client.get(url).status_code
+        if status != 200:
+            # Timing an error page would say nothing about the real one.
+            sys.stderr.write("Skipped %s, %s responded with %d\n" %
+                             (name, url, status))
+            results[name] = {"runs": 0, "skipped": True, "status": status}
+            continue
+        statuses = set()
+        def get():
+            statuses.add(client.get(url).status_code)
+        results[name] = timed(get, repeat)
+        if statuses != set([200]):
+            raise RuntimeError("%s responded with %s while being timed" %
+                               (url, sorted(statuses)))
+    cli._storage.close()
+    return results
+
+def get_args():
+    parser = argparse.ArgumentParser(description="TaskCLI benchmarks")
+    parser.add_argument('--tasks', type=int, default=200,
+        help="number of tasks in the day")
+    parser.add_argument('--depth', type=int, default=3,
+        help="how deeply tasks are nested")
+    parser.add_argument('--timers', type=int, default=5,
+        help="number of timers for each task")
+    parser.add_argument('--messages', type=int, default=1000,
+        help="number of messages in the day")
+    parser.add_argument('--days', type=int, default=30,
+        help="number of archived days")
+    parser.add_argument('--repeat', type=int, default=5,
+        help="number of times to time each path")
+    parser.add_argument('--output', metavar='<file>',
+        help="file to write the JSON results to, default stdout")
+    return parser.parse_args()
+
+def main():
+    args = get_args()
+    params = dict((name, getattr(args, name)) for name in
+                  ["tasks", "depth", "timers", "messages", "days", "repeat"])
+
+    # Run somewhere empty so that nothing real is loaded or overwritten.
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="taskcli-bench-")
+    stdout = sys.stdout
+    os.chdir(workdir)
+    try:
+        # The commands print as they go.
+        sys.stdout = open(os.devnull, "w")
+        results = run_benchmarks(**params)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps({"params":  params,
+                         "python":  platform.python_version(),
+                         "time":    time.time(),
+                         "results": results}, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print output
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import utils
+from storage import open_storage
+
+# Roughly how much memory the snapshot cache may use, measured by the size
+# of the days it has loaded as reported by their storage.
+SNAPSHOT_CACHE_BYTES = 64 * 1024 * 1024
+# How much memory the render cache may use, by the length of the pages.
+RENDER_CACHE_BYTES = 16 * 1024 * 1024
+
+
+class SnapshotCache():
+    """Least recently used cache of TaskCLIs loaded from storage.
+
+    Entries are keyed on the day and invalidated when the stored day's
+    version (the snapshot file's mtime for pickles) changes. The cache is
+    bounded by the total stored size of the days it holds, the least
+    recently used being dropped first.
+    """
+    def __init__(self, max_bytes=SNAPSHOT_CACHE_BYTES, directory=""):
+        self._max_bytes = max_bytes
+        self._directory = directory
+        self._bytes     = 0
+        # date -> (mtime, size, TaskCLI), least recently used first.
+        self._entries   = OrderedDict()
+        self._lock      = threading.Lock()
+        self.hits       = 0
+        self.misses     = 0
+
+    def get(self, date):
+        """get
+
+        Purpose: Gets the TaskCLI archived for a day, loading it from
+                 storage if it isn't cached or the stored day has changed.
+
+        Params:  date - The day, as DD-MM-YYYY.
+
+        Returns: The TaskCLI, raises IOError/OSError if the day isn't stored.
+        """
+        day = open_storage(date, self._directory)
+        try:
+            version, size = day.stat()
+
+            with self._lock:
+                entry = self._entries.pop(date, None)
+                if entry and entry[0] == version:
+                    self._entries[date] = entry
+                    self.hits += 1
+                    return entry[2]
+                if entry:
+                    self._bytes -= entry[1]
+                self.misses += 1
+
+            cli = day.load()
+        finally:
+            day.close()
+
+        with self._lock:
+            if date not in self._entries:
+                self._entries[date] = (version, size, cli)
+                self._bytes += size
+            # Always keep the entry just loaded.
+            while self._bytes > self._max_bytes and len(self._entries) > 1:
+                dummy, (mtime, size, old) = self._entries.popitem(last=False)
+                self._bytes -= size
+
+        return cli
+
+    def stats(self):
+        """Returns a dict of the hit/miss counters and current usage."""
+        return {"hits":    self.hits,
+                "misses":  self.misses,
+                "entries": len(self._entries),
+                "bytes":   self._bytes}
+
+
+class RenderCache():
+    """Least recently used cache of rendered pages.
+
+    Keys must include whatever version the page was rendered from (the
+    stored day's version, or the DayState version for the live day) so a
+    changed day is never served from the cache, its old pages just age
+    out. Pages can also be persisted to a directory, so that pages for
+    archived days, which never change, survive a restart.
+    """
+    def __init__(self, max_bytes=RENDER_CACHE_BYTES, directory=None):
+        self._max_bytes = max_bytes
+        self._bytes     = 0
+        self._directory = directory
+        # key -> page, least recently used first.
+        self._entries   = OrderedDict()
+        self._lock      = threading.Lock()
+        self.hits       = 0
+        self.misses     = 0
+
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get(self, key):
+        """Returns the page cached for a key, or None."""
+        with self._lock:
+            page = self._entries.pop(key, None)
+            if page is not None:
+                self._entries[key] = page
+                self.hits += 1
+                return page
+
+        page = self._read(key)
+        with self._lock:
+            if page is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._add(key, page)
+        return page
+
+    def put(self, key, page, persist=False):
+        """put
+
+        Purpose: Caches a rendered page.
+
+        Params:  key     - A tuple identifying the page and its version.
+                 page    - The rendered page, as a string.
+                 persist - True to also write it to the cache directory,
+                           if there is one. Only for pages that will never
+                           change.
+
+        Returns: Nothing.
+        """
+        with self._lock:
+            self._add(key, page)
+        if persist and self._directory:
+            utils.write_atomic(self._filename(key), page)
+
+    def stats(self):
+        """Returns a dict of the hit/miss counters and current usage."""
+        return {"hits":    self.hits,
+                "misses":  self.misses,
+                "entries": len(self._entries),
+                "bytes":   self._bytes}
+
+    def _add(self, key, page):
+        """Adds a page, must be called holding the lock."""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = page
+        self._bytes += len(page)
+        while self._bytes > self._max_bytes and len(self._entries) > 1:
+            dummy, old = self._entries.popitem(last=False)
+            self._bytes -= len(old)
+
+    def _read(self, key):
+        if not self._directory:
+            return None
+        try:
+            with open(self._filename(key), "rb") as cached:
+                return cached.read()
+        except IOError:
+            return None
+
+    def _filename(self, key):
+        return os.path.join(self._directory,
+                            hashlib.sha1(repr(key)).hexdigest())
@@ -0,0 +1,167 @@
+import json
+import os
+import pickle
+import re
+from bisect import bisect_left, bisect_right, insort
+
+import utils
+from summary import read_summary, summary_totals
+
+CATALOG_FILENAME = "catalog.json"
+
+r_file = re.compile("(?P<day>[0-3][0-9])-(?P<month>[0-1][0-9])-"
+                    "(?P<year>[1-2][0-9]{3})\.p$")
+
+
+class Catalog():
+    """Date-indexed record of the days that have been archived.
+
+    Each day's snapshot (DD-MM-YYYY.p) gets an entry with the number of
+    timers it holds and the total time they add up to, so listings don't
+    need to open the snapshots themselves. The catalog is kept as JSON in
+    catalog.json and is reloaded whenever that file changes on disk.
+    """
+    def __init__(self, filename=CATALOG_FILENAME, directory=""):
+        # The directory the days are kept in, the catalog going with them.
+        self._directory = directory
+        self._filename  = os.path.join(directory, filename)
+        self._mtime     = None
+        # date -> (entries, seconds)
+        self._days      = {}
+        # (year, month, day, date) tuples, oldest first.
+        self._order     = []
+        self.refresh()
+
+    def refresh(self):
+        """Reloads the catalog if it has changed since it was last read."""
+        try:
+            mtime = os.path.getmtime(self._filename)
+        except OSError:
+            if self._mtime is None:
+                # No catalog yet, build one from any existing snapshots.
+                self.rebuild()
+            return
+
+        if mtime == self._mtime:
+            return
+
+        with open(self._filename, "r") as catalog:
+            days = json.load(catalog)
+        self._mtime = mtime
+        self._days  = dict((str(date), tuple(details))
+                           for date, details in days.items())
+        self._order = sorted(_sort_key(date) for date in self._days)
+
+    def update(self, date, entries, seconds):
+        """update
+
+        Purpose: Adds or updates the entry for a day and saves the catalog.
+
+        Params:  date    - The day, as DD-MM-YYYY.
+                 entries - The number of timers recorded that day.
+                 seconds - The total time of those timers.
+
+        Returns: Nothing.
+        """
+        self.refresh()
+        if date not in self._days:
+            insort(self._order, _sort_key(date))
+        self._days[date] = (entries, seconds)
+        self._save()
+
+    def rebuild(self):
+        """Builds the catalog from scratch from the days on disk, using their
+        summary sidecars where they have one."""
+        self._days = {}
+        for filename in os.listdir(self._directory or "."):
+            if not r_file.match(filename):
+                continue
+            summary = read_summary(filename[:-2], self._directory)
+            if summary is not None:
+                self._days[filename[:-2]] = summary_totals(summary)
+                continue
+            try:
+                with open(os.path.join(self._directory, filename),
+                          "rb") as snapshot:
+                    cli = pickle.load(snapshot)
+            except Exception:
+                # Leave out anything that can't be loaded.
+                continue
+            self._days[filename[:-2]] = day_totals(cli)
+        self._order = sorted(_sort_key(date) for date in self._days)
+        if self._days:
+            self._save()
+        else:
+            # Nothing to save, but don't rebuild again on every refresh.
+            self._mtime = 0
+
+    def page(self, page, items_per_page):
+        """page
+
+        Purpose: Gets one page of days, most recent first.
+
+        Params:  page           - The page number, starting from 1.
+                 items_per_page - The number of days on each page.
+
+        Returns: A list of (date, entries, seconds) tuples, empty for
+                 pages before the first or past the last.
+        """
+        if page < 1:
+            return []
+        end   = len(self._order) - (page - 1) * items_per_page
+        start = max(end - items_per_page, 0)
+        days  = []
+        for ii in xrange(end - 1, start - 1, -1):
+            date = self._order[ii][3]
+            entries, seconds = self._days[date]
+            days.append((date, entries, seconds))
+        return days
+
+    def between(self, start, end):
+        """between
+
+        Purpose: Gets the days archived between two dates.
+
+        Params:  start - The first day to include, as DD-MM-YYYY.
+                 end   - The last day to include, as DD-MM-YYYY.
+
+        Returns: A list of dates (DD-MM-YYYY), oldest first.
+        """
+        first = bisect_left(self._order, _sort_key(start))
+        last  = bisect_right(self._order, _sort_key(end))
+        return [key[3] for key in self._order[first:last]]
+
+    @property
+    def version(self):
+        """Changes whenever the catalog does, the mtime of its file."""
+        return self._mtime
+
+    def get(self, date):
+        """Returns the (entries, seconds) of a day, or None."""
+        return self._days.get(date)
+
+    def __len__(self):
+        return len(self._order)
+
+    def _save(self):
+        utils.write_atomic(self._filename,
+                           json.dumps(self._days, sort_keys=True))
+        self._mtime = os.path.getmtime(self._filename)
+
+
+def _sort_key(date):
+    day, month, year = date.split("-")
+    return int(year), int(month), int(day), date
+
+def day_totals(cli):
+    """day_totals
+
+    Works out the catalog entry for a day.
+
+    Params:  cli - The TaskCLI holding the day's tasks.
+
+    Returns: A tuple of (number of timers, total seconds).
+    """
+    tasks = cli._tasks.values()
+    return (sum(len(task._timers) for task in tasks),
+            sum(task.own_seconds() for task in tasks))
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from utils import get_logger
+
+# How often the day is checkpointed by default, 0 to never.
+CHECKPOINT_SECONDS = 60
+
+log = get_logger(name=__name__)
+
+
+class Checkpointer(threading.Thread):
+    """Checkpoints a TaskCLI's day from a background thread.
+
+    Every interval seconds the latest published DayState is compared with
+    the one last checkpointed, and just the tasks and messages that have
+    changed since are handed to storage as a checkpoint, chained on to the
+    one before. The first checkpoint after the day is saved in full is
+    relative to the saved state instead. States are copy-on-write, so a
+    task that hasn't changed is the very same TaskState and spotting what
+    has is cheap. Only published states are read, so the CLI's thread is
+    never held up or locked out.
+    """
+    def __init__(self, cli, interval=CHECKPOINT_SECONDS):
+        threading.Thread.__init__(self, name="Checkpointer")
+        self.daemon     = True
+        self._cli       = cli
+        self._interval  = interval
+        self._stopping  = threading.Event()
+        # The saved state the current chain of checkpoints started from,
+        # and the last state checkpointed since.
+        self._base      = None
+        self._last      = None
+        self.written    = 0
+
+    def run(self):
+        while not self._stopping.wait(self._interval):
+            try:
+                self.checkpoint()
+            except Exception:
+                log.exception("Checkpoint failed")
+
+    def stop(self):
+        """Stops checkpointing, waiting for one in progress to finish."""
+        self._stopping.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+
+    def checkpoint(self):
+        """checkpoint
+
+        Purpose: Writes whatever has changed since the last checkpoint, or
+                 since the day was last saved in full if that was more
+                 recent.
+
+        Returns: True if a checkpoint was written.
+        """
+        cli = self._cli
+        # Read once, as the CLI's thread may replace any of them.
+        storage = cli._storage
+        base    = cli._saved_state
+        state   = cli.state
+        if base is None or state.date != base.date:
+            return False
+        if base is not self._base:
+            # Saved in full since, which replaces any earlier checkpoints.
+            self._base = self._last = base
+        last = self._last
+        if state.seq == last.seq:
+            return False
+
+        tasks = [(task.name, task.parent_name, task.status, task._timers)
+                 for name, task in state._tasks.items()
+                 if task is not last._tasks.get(name)]
+        messages = state.messages.between(len(last.messages),
+                                          len(state.messages))
+        start = time.time()
+        storage.checkpoint({"day":           state.date,
+                            "seq":           state.seq,
+                            "base_seq":      last.seq,
+                            "current":       state.current,
+                            "tasks":         tasks,
+                            "messages_from": len(last.messages),
+                            "messages":      messages})
+        self._last = state
+        self.written += 1
+        log.debug("checkpoint: %d tasks and %d messages to seq %d in %.3f "
+                  "seconds", len(tasks), len(messages), state.seq,
+                  time.time() - start)
+        return True
@@ -0,0 +1,196 @@
+import csv
+import json
+
+from catalog import Catalog, _sort_key
+from reports import normalise_date
+from storage import open_storage
+
+FORMATS = ("csv", "jsonl")
+CSV_FIELDS = ("type", "day", "task", "start", "stop", "time", "message")
+
+
+def export_records(start=None, end=None, prefix=None, live=None,
+                   directory=""):
+    """export_records
+
+    Yields every timer and message across the archived days, loading one
+    day at a time so memory use doesn't grow with the number of days.
+
+    Params:  start     - The first day to include, as DD-MM-YYYY, or None.
+             end       - The last day to include, as DD-MM-YYYY, or None.
+             prefix    - Only include tasks whose names start with this.
+             live      - The running TaskCLI, used in place of what's
+                         stored for its day.
+             directory - The directory the days are kept in, defaults to
+                         the working directory.
+
+    Returns: A generator of record dicts. Timers are {"type": "timer",
+             "day", "task", "start", "stop"}, stop being None if it's
+             running, and messages are {"type": "message", "day", "time",
+             "task", "message"}. Records are in day order.
+    """
+    catalog = Catalog(directory=directory)
+    dates = catalog.between(start or "01-01-1000", end or "31-12-9999")
+    if live and live.date not in dates and _in_range(live.date, start, end):
+        dates.append(live.date)
+
+    for date in dates:
+        if live and date == live.date:
+            cli = live
+        else:
+            cli = _load_day(date, directory)
+            if cli is None:
+                continue
+        for record in _day_records(cli, prefix):
+            yield record
+
+def import_records(records, live=None, directory=""):
+    """import_records
+
+    Merges timers and messages into the days they belong to, creating the
+    days and tasks as needed. Timers and messages already stored are
+    skipped, so importing the same records twice is harmless. Records are
+    buffered a day at a time, so should be grouped by day to avoid days
+    being loaded and saved more than once.
+
+    Params:  records   - Record dicts, see export_records().
+             live      - The running TaskCLI, merged into directly for its
+                         day rather than through storage.
+             directory - The directory the days are kept in, defaults to
+                         the working directory.
+
+    Returns: A tuple of (timers added, messages added). Raises ValueError
+             at the first record whose day isn't a DD-MM-YYYY date, having
+             imported those before it.
+    """
+    added = [0, 0]
+    date, timers, messages = None, [], []
+    for number, record in enumerate(records, 1):
+        try:
+            # The day names the files it's stored in, so must be checked.
+            day = normalise_date(record["day"])
+        except (TypeError, ValueError):
+            _import_day(date, timers, messages, live, added, directory)
+            raise ValueError("Record %d has a bad day: %r" %
+                             (number, record["day"]))
+        if day != date:
+            _import_day(date, timers, messages, live, added, directory)
+            date, timers, messages = day, [], []
+        if record["type"] == "timer":
+            timers.append((record["task"], record["start"], record["stop"]))
+        elif record["type"] == "message":
+            messages.append((record["time"], record["task"],
+                             record["message"]))
+    _import_day(date, timers, messages, live, added, directory)
+    return tuple(added)
+
+def write_records(records, output, format):
+    """Writes records to a file as CSV or JSON lines, returns how many."""
+    count = 0
+    if format == "csv":
+        writer = csv.DictWriter(output, CSV_FIELDS)
+        writer.writeheader()
+        for record in records:
+            if record["type"] == "timer":
+                # str() would round the times to the nearest 10ms or so.
+                record = dict(record, start=repr(record["start"]),
+                              stop=repr(record["stop"]) if record["stop"]
+                              is not None else "")
+            writer.writerow(record)
+            count += 1
+    else:
+        for record in records:
+            output.write(json.dumps(record, sort_keys=True) + "\n")
+            count += 1
+    return count
+
+def read_records(source, format):
+    """Yields the records from a file written by write_records()."""
+    if format == "csv":
+        for row in csv.DictReader(source):
+            record = dict((key, value) for key, value in row.items()
+                          if key in _FIELDS[row["type"]])
+            if record["type"] == "timer":
+                record["start"] = float(record["start"])
+                record["stop"]  = float(record["stop"]) if record["stop"] \
+                                  else None
+            yield record
+    else:
+        for line in source:
+            if line.strip():
+                yield _encode(json.loads(line))
+
+def format_from_filename(filename):
+    """Returns the format for a file from its extension, or None."""
+    extension = filename.rsplit(".", 1)[-1].lower()
+    return extension if extension in FORMATS else None
+
+
+_FIELDS = {"timer":   ("type", "day", "task", "start", "stop"),
+           "message": ("type", "day", "time", "task", "message")}
+
+def _in_range(date, start, end):
+    key = _sort_key(date)
+    return ((start is None or _sort_key(start) <= key) and
+            (end is None or key <= _sort_key(end)))
+
+def _load_day(date, directory):
+    day = open_storage(date, directory)
+    try:
+        cli = day.load()
+        if cli is not None:
+            # Include anything left in the journal.
+            cli.replay(day.pending(cli._seq))
+            cli._storage.close()
+        return cli
+    finally:
+        day.close()
+
+def _day_records(cli, prefix):
+    for name in sorted(cli._tasks):
+        if prefix and not name.startswith(prefix):
+            continue
+        task = cli._tasks[name]
+        for index in xrange(len(task._timers)):
+            start, stop = task._timers.interval(index)
+            yield {"type": "timer", "day": cli.date, "task": name,
+                   "start": start, "stop": stop}
+    for time, task, message in cli.messages:
+        if prefix and not task.startswith(prefix):
+            continue
+        yield {"type": "message", "day": cli.date, "time": time,
+               "task": task, "message": message}
+
+def _import_day(date, timers, messages, live, added, directory):
+    if date is None or not (timers or messages):
+        return
+    # Imported here as TaskCLI imports this module.
+    from TaskCLI import restore_cli
+
+    if live and date == live.date:
+        cli = live
+    else:
+        cli = (_load_day(date, directory) or
+               restore_cli(date, [], [], [], directory=directory))
+
+    timers_added = cli.merge_timers(timers)
+    messages_added = 0
+    existing = set(cli.messages)
+    for message in messages:
+        if message not in existing:
+            existing.add(message)
+            cli.messages.append(message)
+            messages_added += 1
+
+    if timers_added or messages_added:
+        cli._save()
+        cli._publish()
+    if cli is not live:
+        cli._storage.close()
+        cli._close_logfile()
+    added[0] += timers_added
+    added[1] += messages_added
+
+def _encode(record):
+    return dict((str(key), value.encode("utf-8") if isinstance(value, unicode)
+                 else value) for key, value in record.items())
@@ -0,0 +1,170 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class IntervalIndex(object):
+    """Index of a day's stopped timers, for finding which were running at a
+    given time or overlapped a range of times.
+
+    Timers are kept sorted by start alongside a max tree of their stops,
+    each node holding the latest stop of the timers beneath it. The timers
+    that started before a time are a prefix of the sorted list, and the
+    tree finds those in it still running without looking at the rest, so
+    a query takes O(log n) per timer found.
+
+    Timers are inserted in order as they're stopped, updating only the
+    part of the tree above them. They're usually stopped in the order they
+    were started, so that's an append and O(log n). Only the sorted timers
+    are pickled, the tree being rebuilt on first use.
+    """
+    def __init__(self):
+        self._starts  = array("d")
+        self._stops   = array("d")
+        self._names   = []
+        # The max tree over _stops, None until it's needed.
+        self._tree    = None
+        # The copy made by frozen(), until another timer is added.
+        self._frozen  = None
+        self._lock    = threading.Lock()
+
+    def __getstate__(self):
+        with self._lock:
+            return {"starts": self._starts.tostring(),
+                    "stops":  self._stops.tostring(),
+                    "names":  self._names}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self._starts.fromstring(state["starts"])
+        self._stops.fromstring(state["stops"])
+        self._names = state["names"]
+
+    def add(self, name, start, stop):
+        """Adds a stopped timer of a task."""
+        with self._lock:
+            index = bisect_right(self._starts, start)
+            self._starts.insert(index, start)
+            self._stops.insert(index, stop)
+            self._names.insert(index, name)
+            if self._tree is not None:
+                self._update(index)
+            self._frozen = None
+
+    def at(self, time):
+        """Returns the (task name, start, stop) of each timer running at a
+        time, in the order they were started."""
+        with self._lock:
+            return self._find(bisect_right(self._starts, time), time)
+
+    def overlapping(self, start, stop):
+        """Returns the (task name, start, stop) of each timer running at any
+        point between two times, in the order they were started."""
+        with self._lock:
+            return self._find(bisect_left(self._starts, stop), start)
+
+    def frozen(self):
+        """Returns a copy of the index that timers added later won't show
+        up in, for a DayState. A new copy is only made once a timer has
+        been added since the last."""
+        with self._lock:
+            if self._frozen is None:
+                if self._tree is None:
+                    self._build()
+                copy = IntervalIndex()
+                copy._starts = self._starts[:]
+                copy._stops  = self._stops[:]
+                copy._names  = self._names[:]
+                copy._tree   = self._tree[:]
+                self._frozen = copy
+            return self._frozen
+
+    def __len__(self):
+        return len(self._starts)
+
+    def _find(self, count, after):
+        """Gets the timers among the first count that stopped after a time.
+        Must be called holding the lock."""
+        if self._tree is None:
+            self._build()
+        found = []
+        size = len(self._tree) / 2
+        # (node, first timer under it, number of timers under it) of the
+        # subtrees left to look in, leftmost last.
+        to_visit = [(1, 0, size)]
+        while to_visit:
+            node, first, width = to_visit.pop()
+            if first >= count or self._tree[node] <= after:
+                continue
+            if width == 1:
+                found.append(first)
+                continue
+            width /= 2
+            to_visit.append((node * 2 + 1, first + width, width))
+            to_visit.append((node * 2, first, width))
+        return [(self._names[ii], self._starts[ii], self._stops[ii])
+                for ii in found]
+
+    def _update(self, first):
+        """Updates the tree for the timers from first on having been
+        inserted or moved along, must be called holding the lock."""
+        size = len(self._tree) / 2
+        count = len(self._stops)
+        if count > size:
+            # Out of leaves, so double them.
+            self._build()
+            return
+        tree = self._tree
+        tree[size + first:size + count] = self._stops[first:]
+        # The parents of the changed leaves, a level at a time.
+        low, high = (size + first) / 2, (size + count - 1) / 2
+        while low:
+            for node in xrange(low, high + 1):
+                tree[node] = max(tree[node * 2], tree[node * 2 + 1])
+            low, high = low / 2, high / 2
+
+    def _build(self):
+        size = 1
+        while size < len(self._stops):
+            size *= 2
+        tree = array("d", [float("-inf")]) * (size * 2)
+        tree[size:size + len(self._stops)] = self._stops
+        for node in xrange(size - 1, 0, -1):
+            tree[node] = max(tree[node * 2], tree[node * 2 + 1])
+        self._tree = tree
+
+
+def find_timers(state, start, stop=None):
+    """find_timers
+
+    Finds the timers, running ones included, that were running at a time
+    or at any point between two times.
+
+    Params:  state - The day's DayState.
+             start - The time, in seconds since the epoch.
+             stop  - The end of the range, None for just the time.
+
+    Returns: A list of (task name, start, stop) tuples in the order they
+             were started, stop being None for timers still running.
+    """
+    if stop is None:
+        timers = state.intervals.at(start)
+    else:
+        timers = state.intervals.overlapping(start, stop)
+    for task in state.get_tasks(status="Running"):
+        since = task.running_since
+        if since <= start or (stop is not None and since < stop):
+            timers.append((task.name, since, None))
+    timers.sort(key=lambda timer: timer[1])
+    return timers
+
+def to_timestamp(date, clock):
+    """Converts a DD-MM-YYYY date and HH:MM or HH:MM:SS time to seconds
+    since the epoch, raises ValueError if either is bad."""
+    for format in ("%d-%m-%Y %H:%M:%S", "%d-%m-%Y %H:%M"):
+        try:
+            return time.mktime(time.strptime("%s %s" % (date, clock), format))
+        except ValueError:
+            pass
+    raise ValueError("Times must be given as HH:MM or HH:MM:SS.")
@@ -0,0 +1,142 @@
+import json
+import os
+import time
+
+import utils
+
+
+class Journal():
+    """Append-only record of the commands that change a TaskCLI's state.
+
+    Each record is written as a JSON list on its own line:
+
+        [seq, timestamp, command, argument]
+
+    Lines are flushed as soon as they are appended but the (comparatively
+    expensive) fsync is only done once every FSYNC_BATCH records or when
+    FSYNC_INTERVAL seconds have passed since the last one. The file isn't
+    opened until the first record is written, so loading an old day's
+    snapshot doesn't touch its journal.
+    """
+    FSYNC_BATCH    = 32
+    FSYNC_INTERVAL = 1.0
+
+    def __init__(self, date, directory=""):
+        self._date      = date
+        self._directory = directory
+        self._filename  = journal_filename(date, directory)
+        self._file      = None
+        self._pending   = 0
+        self._last_sync = time.time()
+        # Number of records in the file, used to decide when to compact.
+        self._length    = None
+
+    def append(self, seq, timestamp, command, argument):
+        """append
+
+        Purpose: Writes a single record to the end of the journal.
+
+        Params:  seq       - The sequence number of the record.
+                 timestamp - The time (seconds since the epoch) the command
+                             was run.
+                 command   - The name of the command, e.g. "addtask".
+                 argument  - The argument the command was run with.
+
+        Returns: Nothing.
+        """
+        record = json.dumps([seq, timestamp, command, argument],
+                            separators=(",", ":"))
+        self._open().write(record + "\n")
+        self._file.flush()
+        self._length  += 1
+        self._pending += 1
+
+        if (self._pending >= self.FSYNC_BATCH or
+                time.time() - self._last_sync >= self.FSYNC_INTERVAL):
+            self.sync()
+
+    def sync(self):
+        """Forces any records written so far onto disk."""
+        if self._pending:
+            os.fsync(self._file.fileno())
+            self._pending = 0
+        self._last_sync = time.time()
+
+    def truncate(self):
+        """Throws away all records, called once they've been snapshotted."""
+        if self._file:
+            self._file.close()
+        self._file    = open(self._filename, "w")
+        self._length  = 0
+        self._pending = 0
+
+    def trim(self, seq):
+        """Throws away the records up to and including seq, called once
+        they've been checkpointed."""
+        kept = [json.dumps(list(record), separators=(",", ":")) + "\n"
+                for record in read_journal(self._date, self._directory)
+                if record[0] > seq]
+        if self._file:
+            self._file.close()
+            self._file = None
+        utils.write_atomic(self._filename, "".join(kept))
+        self._length  = len(kept)
+        self._pending = 0
+
+    def close(self):
+        if self._file:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def _open(self):
+        if not self._file:
+            self._length = len(self)
+            self._file = open(self._filename, "a")
+            # Make sure a torn record left by a crash doesn't swallow the
+            # next one.
+            if (os.path.getsize(self._filename) and
+                    not _ends_with_newline(self._filename)):
+                self._file.write("\n")
+        return self._file
+
+    def __len__(self):
+        if self._length is None:
+            self._length = len(list(read_journal(self._date,
+                                                 self._directory)))
+        return self._length
+
+
+def journal_filename(date, directory=""):
+    return os.path.join(directory, "%s.journal" % date)
+
+def _ends_with_newline(filename):
+    with open(filename, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == "\n"
+
+def read_journal(date, directory=""):
+    """read_journal
+
+    Reads the records back out of a journal.
+
+    Params:  date      - The date (DD-MM-YYYY) of the journal to read.
+             directory - The directory it's in, defaults to the working
+                         directory.
+
+    Returns: A generator of (seq, timestamp, command, argument) tuples.
+    """
+    filename = journal_filename(date, directory)
+    if not os.path.isfile(filename):
+        return
+
+    with open(filename, "r") as journal:
+        for line in journal:
+            try:
+                seq, timestamp, command, argument = json.loads(line)
+            except ValueError:
+                # A record torn by a crash, skip it.
+                continue
+            if isinstance(argument, unicode):
+                argument = argument.encode("utf-8")
+            yield seq, timestamp, str(command), argument
@@ -0,0 +1,229 @@
+import json
+import os
+import pickle
+import threading
+from array import array
+from bisect import bisect_left
+
+
+class MessageLog(object):
+    """The messages logged with the M command over a day.
+
+    Messages are (time, task name, message) tuples, numbered from 0 in the
+    order they were logged. Only the most recent TAIL_SIZE are held in
+    memory, older ones are spilled to DD-MM-YYYY.messages with their file
+    offsets kept so that any one can be read back directly. Each task's
+    message numbers are indexed so a task's, or a subtree's, messages can
+    be paged through without looking at anyone else's.
+
+    When unpickled the tail and the index are left packed until they are
+    first used, so loading a day doesn't pay for messages nobody reads.
+    """
+    TAIL_SIZE = 1000
+
+    def __init__(self, date, directory=""):
+        self._date      = date
+        self._directory = directory
+        self._count     = 0
+        # Offsets in the spill file of messages 0 to len(_offsets) - 1.
+        self._offsets   = array("l")
+        # The rest of the messages.
+        self._tail      = []
+        # Task name -> message numbers.
+        self._by_task   = {}
+        self._lock      = threading.Lock()
+        # The pickled (tail, index) until they're first used.
+        self._packed    = None
+
+    def __getstate__(self):
+        packed = self._packed
+        if packed is None:
+            packed = (pickle.dumps(self._tail, pickle.HIGHEST_PROTOCOL),
+                      dict((name, seqs.tostring()) for name, seqs in
+                           self._by_task.items()))
+        return {"date":      self._date,
+                "directory": self._directory,
+                "count":     self._count,
+                "offsets":   self._offsets.tostring(),
+                "tail":      packed[0],
+                "by_task":   packed[1]}
+
+    def __setstate__(self, state):
+        self._date    = state["date"]
+        # Pickled before days could be kept outside the working directory.
+        self._directory = state.get("directory", "")
+        self._count   = state["count"]
+        self._offsets = array("l")
+        self._offsets.fromstring(state["offsets"])
+        tail = state["tail"]
+        if isinstance(tail, list):
+            # Pickled before the tail was packed.
+            tail = pickle.dumps(tail, pickle.HIGHEST_PROTOCOL)
+        self._packed  = (tail, state["by_task"])
+        self._lock    = threading.Lock()
+
+    def __getattr__(self, name):
+        # Only called for attributes that aren't set, i.e. still packed.
+        if name in ("_tail", "_by_task"):
+            packed = self.__dict__.get("_packed")
+            if packed is not None:
+                self._unpack(packed)
+            # Another thread may have unpacked them in the meantime.
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def _unpack(self, packed):
+        by_task = {}
+        for name, seqs in packed[1].items():
+            by_task[name] = array("l")
+            by_task[name].fromstring(seqs)
+        self._tail    = pickle.loads(packed[0])
+        self._by_task = by_task
+        self._packed  = None
+
+    def append(self, message):
+        """Adds a (time, task name, message) tuple."""
+        with self._lock:
+            self._add(message)
+            if len(self._tail) > self.TAIL_SIZE:
+                self._spill()
+
+    def extend(self, messages):
+        """Adds the messages of a day being loaded from storage. They're
+        all kept in the tail, however many, as loading a day must never
+        write to its spill file. The next append() spills any excess."""
+        with self._lock:
+            for message in messages:
+                self._add(message)
+
+    def _add(self, message):
+        """Adds a message to the tail, must be called holding the lock."""
+        seq = self._count
+        self._tail.append(tuple(message))
+        self._count += 1
+        self._by_task.setdefault(message[1], array("l")).append(seq)
+
+    def page(self, before=None, limit=50, tasks=None):
+        """page
+
+        Purpose: Gets a page of messages, most recent first.
+
+        Params:  before - Cursor from the previous page, only messages
+                          logged before it are returned. None for the most
+                          recent page.
+                 limit  - The most messages to return.
+                 tasks  - Names of the tasks to include messages from,
+                          or None for every task.
+
+        Returns: A tuple of (list of messages, cursor for the next page).
+                 The cursor is None if there are no older messages.
+        """
+        with self._lock:
+            count = self._count if before is None else min(before, self._count)
+            if tasks is None:
+                seqs = range(count - 1, max(count - limit, 0) - 1, -1)
+                more = count > limit
+            else:
+                # The latest `limit` messages of each task before the
+                # cursor, of which the latest `limit` overall are wanted.
+                seqs = []
+                for name in set(tasks):
+                    task_seqs = self._by_task.get(name)
+                    if not task_seqs:
+                        continue
+                    end = bisect_left(task_seqs, count)
+                    seqs.extend(task_seqs[max(end - limit - 1, 0):end])
+                seqs.sort(reverse=True)
+                more = len(seqs) > limit
+                seqs = seqs[:limit]
+            located = self._locate(seqs)
+
+        # Read outside the lock so that append() isn't held up meanwhile.
+        messages = self._load(located)
+        cursor = seqs[-1] if more and seqs else None
+        return messages, cursor
+
+    def between(self, start, stop):
+        """Returns the messages numbered start up to stop, in order, reading
+        any spilled ones in a single pass."""
+        with self._lock:
+            located = self._locate(range(max(start, 0),
+                                         min(stop, self._count)))
+        return self._load(located)
+
+    def count(self, task):
+        """Returns the number of messages logged against a task."""
+        return len(self._by_task.get(task, ()))
+
+    def __len__(self):
+        return self._count
+
+    def __nonzero__(self):
+        return self._count > 0
+
+    def __getitem__(self, seq):
+        if seq < 0:
+            seq += self._count
+        if not 0 <= seq < self._count:
+            raise IndexError("message index out of range")
+        with self._lock:
+            located = self._locate([seq])
+        return self._load(located)[0]
+
+    def __iter__(self):
+        with self._lock:
+            offsets = self._offsets[:]
+            tail = list(self._tail)
+        if offsets:
+            with open(self._filename(), "rb") as spill:
+                for offset in offsets:
+                    spill.seek(offset)
+                    yield _decode(spill.readline())
+        for message in tail:
+            yield message
+
+    def _locate(self, seqs):
+        """Finds messages by number, must be called holding the lock. Those
+        in the tail are returned as they are, spilled ones as their offsets
+        in the spill file for _load() to read."""
+        spilled = len(self._offsets)
+        return [self._tail[seq - spilled] if seq >= spilled else
+                self._offsets[seq] for seq in seqs]
+
+    def _load(self, located):
+        """Reads the spilled messages found by _locate(). Spilled messages
+        are never rewritten, so this needn't hold the lock."""
+        messages = []
+        spill = None
+        try:
+            for message in located:
+                if isinstance(message, tuple):
+                    messages.append(message)
+                    continue
+                if spill is None:
+                    spill = open(self._filename(), "rb")
+                spill.seek(message)
+                messages.append(_decode(spill.readline()))
+        finally:
+            if spill:
+                spill.close()
+        return messages
+
+    def _spill(self):
+        """Moves the older half of the tail out to the spill file."""
+        moving = len(self._tail) - self.TAIL_SIZE / 2
+        with open(self._filename(), "ab") as spill:
+            # An earlier session of the day may have spilled here too.
+            spill.seek(0, os.SEEK_END)
+            for message in self._tail[:moving]:
+                self._offsets.append(spill.tell())
+                spill.write(json.dumps(message) + "\n")
+        self._tail = self._tail[moving:]
+
+    def _filename(self):
+        return os.path.join(self._directory, "%s.messages" % self._date)
+
+
+def _decode(line):
+    return tuple(field.encode("utf-8") if isinstance(field, unicode) else
+                 field for field in json.loads(line))
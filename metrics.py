@@ -0,0 +1,116 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+# Set to False to stop recording, leaving just a check of this flag.
+ENABLED = True
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS   = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram():
+    """Counts observations into buckets, separately for each label value,
+    as a Prometheus histogram does."""
+    def __init__(self, name, description, label, buckets=SECONDS_BUCKETS):
+        self.name        = name
+        self.description = description
+        self.label       = label
+        self.buckets     = buckets
+        # label value -> [bucket counts, count, sum, max]
+        self._series     = {}
+        self._lock       = threading.Lock()
+
+    def observe(self, value, label):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = [[0] * len(self.buckets), 0, 0, 0]
+                self._series[label] = series
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+            series[3] = max(series[3], value)
+
+    def series(self):
+        """Returns a sorted list of (label value, cumulative bucket counts,
+        count, sum, max) tuples."""
+        with self._lock:
+            items = sorted(self._series.items())
+            rows = []
+            for label, (counts, count, total, peak) in items:
+                cumulative, running = [], 0
+                for bucket_count in counts:
+                    running += bucket_count
+                    cumulative.append(running)
+                rows.append((label, cumulative, count, total, peak))
+        return rows
+
+
+command_seconds = Histogram("taskcli_command_seconds",
+                            "Time taken to run each CLI command.", "command")
+request_seconds = Histogram("taskcli_http_request_seconds",
+                            "Time taken to handle each web route.", "route")
+response_bytes  = Histogram("taskcli_http_response_bytes",
+                            "Size of the responses from each web route.",
+                            "route", buckets=BYTES_BUCKETS)
+storage_seconds = Histogram("taskcli_storage_seconds",
+                            "Time taken by each storage operation.",
+                            "operation")
+HISTOGRAMS = [command_seconds, request_seconds, response_bytes,
+              storage_seconds]
+
+
+def timed(histogram, label):
+    """Decorator that records how long each call takes in a histogram."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.time() - start, label)
+        return wrapper
+    return decorator
+
+def render():
+    """Returns every histogram in the Prometheus text exposition format."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.append("# HELP %s %s" % (histogram.name, histogram.description))
+        lines.append("# TYPE %s histogram" % histogram.name)
+        for label, cumulative, count, total, peak in histogram.series():
+            label = _escape(label)
+            for bound, bucket_count in zip(histogram.buckets, cumulative):
+                lines.append('%s_bucket{%s="%s",le="%s"} %d' %
+                             (histogram.name, histogram.label, label,
+                              _number(bound), bucket_count))
+            lines.append('%s_bucket{%s="%s",le="+Inf"} %d' %
+                         (histogram.name, histogram.label, label, count))
+            lines.append('%s_sum{%s="%s"} %s' %
+                         (histogram.name, histogram.label, label,
+                          _number(total)))
+            lines.append('%s_count{%s="%s"} %d' %
+                         (histogram.name, histogram.label, label, count))
+    return "\n".join(lines) + "\n"
+
+def summary():
+    """Returns a list of (metric name, label value, count, mean, max) tuples
+    for everything recorded."""
+    return [(histogram.name, label, count, total / count, peak)
+            for histogram in HISTOGRAMS
+            for label, cumulative, count, total, peak in histogram.series()]
+
+def _escape(value):
+    return (str(value).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"))
+
+def _number(value):
+    return repr(float(value))
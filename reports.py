@@ -0,0 +1,140 @@
+import datetime
+import os
+import pickle
+
+import storage
+from catalog import Catalog
+from journal import read_journal
+from storage import PickleStorage, SQLiteStorage
+from summary import read_summary
+
+# Below this many days it's quicker to load them here than start a pool.
+POOL_THRESHOLD = 4
+
+
+def summarize_day(date, directory=""):
+    """summarize_day
+
+    Loads a day's snapshot and totals up the time spent on each task. This
+    runs in the pool's worker processes so must stay a module level function.
+
+    Only the snapshot's tasks and their timers are wanted, so it's loaded
+    without setting up a TaskCLI, see _DayUnpickler. Should the day have
+    a checkpoint or journalled commands since the snapshot, it's loaded
+    in full instead and the commands replayed, as resuming the day would.
+
+    Params:  date      - The day, as DD-MM-YYYY.
+             directory - The directory the day is kept in.
+
+    Returns: A tuple of (date, {task name: seconds}).
+    """
+    with open(os.path.join(directory, "%s.p" % date), "rb") as snapshot:
+        day = _DayUnpickler(snapshot).load()
+    seq = getattr(day, "_seq", 0)
+    if (os.path.isfile(os.path.join(directory, "%s.checkpoint" % date)) or
+            [task for task in day._tasks.values()
+             if not hasattr(task, "_own_total")] or
+            [record for record in read_journal(date, directory)
+             if record[0] > seq]):
+        day = _load_day(date, directory)
+    return date, dict((task.name, task.own_seconds())
+                      for task in day._tasks.values())
+
+def build_report(start, end, processes=None, directory=""):
+    """build_report
+
+    Totals the time spent on each task over a range of archived days. With
+    pickle storage the days' summary sidecars are used, any days without
+    one are loaded and summarized in parallel across a process pool. With
+    SQLite they are summarized by the database.
+
+    Params:  start     - The first day to include, as DD-MM-YYYY.
+             end       - The last day to include, as DD-MM-YYYY.
+             processes - The number of worker processes, defaults to the
+                         number of CPUs.
+             directory - The directory the days are kept in, defaults to
+                         the working directory.
+
+    Returns: A list of (task name, seconds, number of days) tuples, most
+             time first.
+    """
+    start, end = normalise_date(start), normalise_date(end)
+    if storage.BACKEND == "sqlite":
+        database = SQLiteStorage(None, directory=directory)
+        try:
+            return _merge(database.summaries(start, end))
+        finally:
+            database.close()
+
+    # Days with a summary sidecar are quick to read here, only those
+    # without need their snapshots loading.
+    summaries = []
+    dates = []
+    for date in Catalog(directory=directory).between(start, end):
+        summary = read_summary(date, directory)
+        if summary is None:
+            dates.append(date)
+        else:
+            summaries.append((date, dict((name, task["own"]) for name, task
+                                         in summary["tasks"].items())))
+    # Only imported when it's needed as it's slow to import.
+    import multiprocessing
+    processes = processes or multiprocessing.cpu_count()
+
+    if processes == 1 or len(dates) < POOL_THRESHOLD:
+        summaries.extend(summarize_day(date, directory) for date in dates)
+        return _merge(summaries)
+
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        chunksize = max(1, len(dates) / (processes * 4))
+        summaries.extend(pool.imap_unordered(
+            _summarize_day, [(date, directory) for date in dates], chunksize))
+        return _merge(summaries)
+    finally:
+        pool.close()
+        pool.join()
+
+def normalise_date(date):
+    """Checks a DD-MM-YYYY date and zero pads it, raises ValueError if bad."""
+    return datetime.datetime.strptime(date, "%d-%m-%Y").strftime("%d-%m-%Y")
+
+def _summarize_day(args):
+    # imap_unordered() passes a single argument.
+    return summarize_day(*args)
+
+def _load_day(date, directory):
+    day = PickleStorage(date, directory)
+    try:
+        cli = day.load()
+        # Include anything left in the journal.
+        cli.replay(day.pending(cli._seq))
+        cli._storage.close()
+        cli._close_logfile()
+    finally:
+        day.close()
+    return cli
+
+
+class _SnapshotData():
+    """Stands in for a pickled TaskCLI, just keeping its attributes rather
+    than opening its storage, search index and so on."""
+    def __setstate__(self, state):
+        self.__dict__ = state
+
+
+class _DayUnpickler(pickle.Unpickler):
+    """Unpickles a day's snapshot as _SnapshotData."""
+    def find_class(self, module, name):
+        if (module, name) == ("TaskCLI", "TaskCLI"):
+            return _SnapshotData
+        return pickle.Unpickler.find_class(self, module, name)
+
+def _merge(summaries):
+    totals = {}
+    for date, tasks in summaries:
+        for name, seconds in tasks.items():
+            total, days = totals.get(name, (0, 0))
+            totals[name] = (total + seconds, days + 1)
+    return sorted([(name, total, days) for name, (total, days) in
+                   totals.items()], key=lambda x: (-x[1], x[0]))
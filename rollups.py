@@ -0,0 +1,235 @@
+import datetime
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+
+from catalog import Catalog
+from storage import open_storage
+from summary import summary_filename, read_summary
+
+BUCKETS  = ("hour", "day", "week")
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+# Below this many timers splitting them in Python beats starting up NumPy.
+NUMPY_THRESHOLD = 64
+# How many archived days' hours are kept in memory, a few years' worth.
+ROLLUP_CACHE_DAYS = 1500
+
+# The numpy module once imported, False if it isn't installed.
+_numpy = None
+# (directory, date) -> (sidecar mtime, {task name: hours}) for the archived
+# days, least recently used first.
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def hour_edges(date):
+    """Returns the 25 times (seconds since the epoch) at which a day's hours
+    start, the last being the following midnight. Daylight saving means
+    they aren't always an hour apart."""
+    day, month, year = [int(part) for part in date.split("-")]
+    # mktime() rolls hour 24 over into the next day.
+    return [time.mktime((year, month, day, hour, 0, 0, 0, 0, -1))
+            for hour in xrange(25)]
+
+def split_hours(intervals, edges, now=None):
+    """split_hours
+
+    Splits timer intervals across the hours of a day. Uses NumPy, if it's
+    installed, to do every interval at once when there are many of them.
+
+    Params:  intervals - (start, stop) tuples, stop being None if running.
+             edges     - The day's hour_edges().
+             now       - The time running timers are taken to, defaults
+                         to now.
+
+    Returns: A list of the seconds spent in each of the 24 hours. Time
+             outside the day is left out.
+    """
+    now = now or time.time()
+    intervals = [(start, now if stop is None else stop)
+                 for start, stop in intervals]
+    numpy = _get_numpy()
+    if numpy and len(intervals) >= NUMPY_THRESHOLD:
+        bounds = numpy.array(intervals, dtype=float)
+        edges = numpy.array(edges, dtype=float)
+        # An interval by hour matrix of how much of each hour it covers.
+        overlap = (numpy.minimum(bounds[:, 1:], edges[1:]) -
+                   numpy.maximum(bounds[:, :1], edges[:-1]))
+        return numpy.clip(overlap, 0, None).sum(axis=0).tolist()
+
+    seconds = [0.0] * 24
+    for start, stop in intervals:
+        hour = max(bisect_right(edges, start) - 1, 0)
+        while hour < 24 and edges[hour] < stop:
+            seconds[hour] += max(min(stop, edges[hour + 1]) -
+                                 max(start, edges[hour]), 0)
+            hour += 1
+    return seconds
+
+def task_hours(date, tasks, now=None):
+    """task_hours
+
+    Rolls up the time spent on each task into the hours of the day.
+
+    Params:  date  - The day, as DD-MM-YYYY.
+             tasks - The day's Tasks or TaskStates.
+             now   - The time running timers are taken to.
+
+    Returns: A dict of task name to the seconds spent in each of the 24
+             hours, leaving out tasks with no time.
+    """
+    edges = hour_edges(date)
+    hours = {}
+    for task in tasks:
+        timers = task._timers
+        if not len(timers):
+            continue
+        seconds = split_hours([timers.interval(ii) for ii in
+                               xrange(len(timers))], edges, now)
+        if any(seconds):
+            hours[task.name] = [round(second, 3) for second in seconds]
+    return hours
+
+def day_hours(start, end, prefix=None, live=None, directory=""):
+    """day_hours
+
+    Gets the hourly rollup of each day in a range. Archived days' come from
+    their summary sidecars, so the days' snapshots needn't be loaded. Days
+    summarized before rollups were kept are loaded and rolled up in memory
+    instead, their sidecars being left to be rewritten when they're next
+    saved.
+
+    Params:  start     - The first day to include, as DD-MM-YYYY.
+             end       - The last day to include, as DD-MM-YYYY.
+             prefix    - Only include tasks whose names start with this.
+             live      - The DayState of the running TaskCLI, used in place
+                         of what's stored for its day.
+             directory - The directory the days are kept in, defaults to
+                         the working directory.
+
+    Returns: A list of (date, list of seconds in each of the 24 hours)
+             tuples, oldest first, for the days with time on them.
+    """
+    days = []
+    dates = Catalog(directory=directory).between(start, end)
+    if live and live.date not in dates and _in_range(live.date, start, end):
+        dates.append(live.date)
+
+    for date in dates:
+        if live and date == live.date:
+            tasks = task_hours(date, live.get_tasks())
+        else:
+            tasks = _archived_hours(date, directory)
+        seconds = [0.0] * 24
+        for name, hours in tasks.items():
+            if not prefix or name.startswith(prefix):
+                seconds = [a + b for a, b in zip(seconds, hours)]
+        if any(seconds):
+            days.append((date, seconds))
+    return days
+
+def rollup(start, end, bucket="day", prefix=None, live=None, directory=""):
+    """rollup
+
+    Totals the time spent in each hour, day or week of a range of days.
+
+    Params:  start, end, prefix, live, directory - See day_hours().
+             bucket - One of BUCKETS.
+
+    Returns: A list of (bucket, seconds) tuples, oldest first, leaving out
+             buckets with no time. Hours are labelled "DD-MM-YYYY HH:00",
+             days "DD-MM-YYYY" and weeks by their Monday, "DD-MM-YYYY".
+    """
+    if bucket not in BUCKETS:
+        raise ValueError("Unknown bucket: %s" % bucket)
+    totals = []
+    for date, seconds in day_hours(start, end, prefix, live, directory):
+        if bucket == "hour":
+            totals.extend(("%s %02d:00" % (date, hour), second) for
+                          hour, second in enumerate(seconds) if second)
+            continue
+        label = date
+        if bucket == "week":
+            day = _to_date(date)
+            label = (day - datetime.timedelta(days=day.weekday())).strftime(
+                "%d-%m-%Y")
+        if totals and totals[-1][0] == label:
+            totals[-1] = (label, totals[-1][1] + sum(seconds))
+        else:
+            totals.append((label, sum(seconds)))
+    return totals
+
+def heatmap(start, end, prefix=None, live=None, directory=""):
+    """heatmap
+
+    Totals the time spent in each hour of each day of the week over a
+    range of days.
+
+    Params:  start, end, prefix, live, directory - See day_hours().
+
+    Returns: A list of 7 lists, Monday first, of the seconds spent in each
+             of the 24 hours.
+    """
+    grid = [[0.0] * 24 for ii in xrange(7)]
+    for date, seconds in day_hours(start, end, prefix, live, directory):
+        row = grid[_to_date(date).weekday()]
+        for hour, second in enumerate(seconds):
+            row[hour] += second
+    return grid
+
+
+def _archived_hours(date, directory):
+    try:
+        mtime = os.path.getmtime(summary_filename(date, directory))
+    except OSError:
+        mtime = None
+    # Keyed on the sidecar's mtime, None if there isn't one, as saving the
+    # day again rewrites it.
+    with _cache_lock:
+        cached = _cache.pop((directory, date), None)
+        if cached and cached[0] == mtime:
+            _cache[(directory, date)] = cached
+            return cached[1]
+
+    summary = read_summary(date, directory) if mtime is not None else None
+    if summary is not None and "hours" in summary:
+        hours = summary["hours"]
+    else:
+        # Only read here, so nothing is written for a request to race on.
+        day = open_storage(date, directory)
+        try:
+            cli = day.load()
+            if cli is None:
+                return {}
+            # Include anything left in the journal.
+            cli.replay(day.pending(cli._seq))
+            cli._storage.close()
+            cli._close_logfile()
+        finally:
+            day.close()
+        hours = task_hours(date, cli._tasks.values())
+    with _cache_lock:
+        _cache[(directory, date)] = (mtime, hours)
+        while len(_cache) > ROLLUP_CACHE_DAYS:
+            _cache.popitem(last=False)
+    return hours
+
+def _get_numpy():
+    global _numpy
+    if _numpy is None:
+        # Only imported when it's needed as it's slow to import.
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy
+
+def _to_date(date):
+    return datetime.datetime.strptime(date, "%d-%m-%Y").date()
+
+def _in_range(date, start, end):
+    key = _to_date(date)
+    return _to_date(start) <= key <= _to_date(end)
@@ -0,0 +1,316 @@
+import heapq
+import math
+import os
+import re
+import threading
+from array import array
+# Several times quicker than pickle at loading years of segments.
+import cPickle as pickle
+
+import utils
+from catalog import Catalog, _sort_key
+from storage import open_storage
+
+# The directory the archived days' segments are kept in.
+SEARCH_FILENAME = "search.index"
+RESULTS_PER_PAGE = 20
+
+# BM25's term frequency saturation and length normalisation.
+BM25_K1 = 1.2
+BM25_B  = 0.75
+
+r_term = re.compile(r"\w+", re.UNICODE)
+r_segment = re.compile(r"^(\d{2}-\d{2}-\d{4})\.segment$")
+
+
+def terms(text):
+    """Splits text into lower case search terms."""
+    if isinstance(text, str):
+        text = text.decode("utf-8", "replace")
+    return [term.encode("utf-8") for term in r_term.findall(text.lower())]
+
+
+class Segment(object):
+    """The inverted index of a single day's messages and task names.
+
+    Each document (a message or a task) is numbered in the order it was
+    added, and each term maps to an array of the documents it appears in,
+    a document appearing once for every time the term does. Documents are
+    only ever added, so the arrays stay in order.
+    """
+    def __init__(self, date):
+        self.date      = date
+        # (time, task name, message) tuples, time and message being None
+        # for a task.
+        self.docs      = []
+        self.lengths   = array("l")
+        # The total of the lengths.
+        self.length    = 0
+        self.postings  = {}
+        # How many of the day's messages, and which of its tasks, have
+        # been added.
+        self.messages  = 0
+        self.tasks     = set()
+
+    def __getstate__(self):
+        return {"date":     self.date,
+                "docs":     self.docs,
+                "lengths":  self.lengths.tostring(),
+                "length":   self.length,
+                "postings": dict((term, docs.tostring()) for term, docs in
+                                 self.postings.items()),
+                "messages": self.messages,
+                "tasks":    self.tasks}
+
+    def __setstate__(self, state):
+        self.__init__(state["date"])
+        self.docs = state["docs"]
+        self.lengths.fromstring(state["lengths"])
+        self.length = state["length"]
+        for term, docs in state["postings"].items():
+            self.postings[term] = array("l")
+            self.postings[term].fromstring(docs)
+        self.messages = state["messages"]
+        self.tasks = state["tasks"]
+
+    def add(self, time, task, message):
+        number = len(self.docs)
+        words = terms(task) + (terms(message) if message else [])
+        self.docs.append((time, task, message))
+        self.lengths.append(len(words))
+        self.length += len(words)
+        for word in words:
+            docs = self.postings.get(word)
+            if docs is None:
+                docs = self.postings[word] = array("l")
+            docs.append(number)
+
+    def sync(self, state):
+        """Adds the tasks and messages of a DayState that haven't been."""
+        for name in sorted(state._tasks):
+            if name not in self.tasks:
+                self.tasks.add(name)
+                self.add(None, name, None)
+        for seq in xrange(self.messages, len(state.messages)):
+            self.add(*state.messages[seq])
+        self.messages = max(self.messages, len(state.messages))
+
+    def matches(self, words, limit):
+        """Returns a dict of document number to a dict of term frequencies
+        for the documents containing every word, and a dict of each word's
+        document frequency in the segment. Only the first limit documents
+        are looked at, so that those added meanwhile are ignored."""
+        found = {}
+        frequencies = {}
+        for word in words:
+            counts = {}
+            for number in self.postings.get(word, ()):
+                if number >= limit:
+                    break
+                counts[number] = counts.get(number, 0) + 1
+            found[word] = counts
+            frequencies[word] = len(counts)
+        if not all(found.values()):
+            return {}, frequencies
+        rarest = min(found.values(), key=len)
+        return (dict((number, dict((word, found[word][number]) for word in
+                                   words))
+                     for number in rarest
+                     if all(number in found[word] for word in words)),
+                frequencies)
+
+
+class SearchIndex():
+    """Full-text index of the messages and task names of every day.
+
+    Each archived day has its own Segment, kept in its own file in the
+    search.index directory so that archiving a day only writes that day,
+    and reloaded whenever that file changes on disk. The live day's
+    Segment is brought up to date before each search, see sync(), and
+    added to the archived ones when the day rolls over. Days archived
+    without being indexed (from before the index existed, or imported)
+    are indexed on the next search.
+    """
+    def __init__(self, filename=SEARCH_FILENAME, directory=""):
+        # The directory the days are kept in, the index going with them.
+        self._directory = directory
+        self._filename  = os.path.join(directory, filename)
+        # The modification times of the directory and of each day's file
+        # when last loaded.
+        self._mtime     = None
+        self._mtimes    = {}
+        # date -> (catalog entry when indexed, Segment)
+        self._days      = {}
+        self._live      = None
+        self._lock      = threading.RLock()
+
+    def sync(self, state):
+        """Brings the live day's Segment up to date with a DayState."""
+        with self._lock:
+            if self._live is None or self._live.date != state.date:
+                self._live = Segment(state.date)
+            self._live.sync(state)
+
+    def archive(self, state):
+        """archive
+
+        Purpose: Adds the live day to the archived days, called once it's
+                 been saved for the last time.
+
+        Params:  state - The live day's final DayState.
+
+        Returns: Nothing.
+        """
+        with self._lock:
+            self.sync(state)
+            self.refresh()
+            self._days[state.date] = (
+                Catalog(directory=self._directory).get(state.date), self._live)
+            self._live = None
+            self._save([state.date])
+
+    def catch_up(self, live_date=None):
+        """Indexes any archived days that are missing or have changed since
+        they were indexed, going by the catalog. Returns how many."""
+        catalog = Catalog(directory=self._directory)
+        with self._lock:
+            self.refresh()
+            missing = [(date, catalog.get(date)) for date in
+                       catalog.between("01-01-1000", "31-12-9999")
+                       if date != live_date and
+                       self._days.get(date, (None,))[0] != catalog.get(date)]
+
+        # Indexed without the lock so that sync() isn't held up meanwhile.
+        segments = [(date, entry, _index_day(date, self._directory))
+                    for date, entry in missing]
+        segments = [segment for segment in segments if segment[2]]
+        if segments:
+            with self._lock:
+                self.refresh()
+                for date, entry, segment in segments:
+                    self._days[date] = (entry, segment)
+                self._save([date for date, entry, segment in segments])
+        return len(segments)
+
+    def search(self, query, page=1, per_page=RESULTS_PER_PAGE):
+        """search
+
+        Purpose: Finds the messages and tasks containing every word of a
+                 query, across the archived days and the live day.
+
+        Params:  query    - The words to search for.
+                 page     - The page of results, from 1.
+                 per_page - The number of results on a page.
+
+        Returns: A tuple of (the results on the page, the total number of
+                 results). Results are (day, time, task name, message)
+                 tuples, best first, time and message being None for a
+                 task. Ties go to the most recent.
+        """
+        words = sorted(set(terms(query)))
+        if not words:
+            return [], 0
+
+        with self._lock:
+            self.refresh()
+            live = self._live
+            segments = [segment for date, (entry, segment) in
+                        self._days.items() if not live or date != live.date]
+            if live:
+                segments.append(live)
+            # Archived segments are never changed, only replaced, but
+            # sync() may add to the live one while it's being scored.
+            segments = [(segment, len(segment.docs), segment.length)
+                        for segment in segments]
+
+        # Scored without the lock so that sync() isn't held up meanwhile.
+        documents = 0
+        length = 0
+        frequencies = dict((word, 0) for word in words)
+        found = []
+        for segment, count, segment_length in segments:
+            documents += count
+            length += segment_length
+            matches, counts = segment.matches(words, count)
+            for word in words:
+                frequencies[word] += counts[word]
+            if matches:
+                found.append((segment, matches))
+
+        average = float(length) / max(documents, 1)
+        idf = dict((word, math.log(1 + (documents - count + 0.5) /
+                                   (count + 0.5)))
+                   for word, count in frequencies.items())
+        scored = []
+        for segment, matches in found:
+            day = _sort_key(segment.date)
+            for number, counts in matches.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B *
+                                  segment.lengths[number] / average)
+                score = sum(idf[word] * count * (BM25_K1 + 1) /
+                            (count + norm)
+                            for word, count in counts.items())
+                scored.append((score, day, number, segment))
+
+        total = len(scored)
+        best = heapq.nlargest(page * per_page, scored, key=lambda x: x[:3])
+        return ([(segment.date,) + segment.docs[number] for
+                 score, day, number, segment in
+                 best[(page - 1) * per_page:]], total)
+
+    def refresh(self):
+        """Reloads any archived days whose files have changed on disk."""
+        with self._lock:
+            if os.path.isfile(self._filename):
+                # An index from when every day was kept in the one file,
+                # its days are indexed again by catch_up().
+                os.remove(self._filename)
+            try:
+                mtime = os.path.getmtime(self._filename)
+            except OSError:
+                return
+            if mtime == self._mtime:
+                return
+            days = {}
+            for name in os.listdir(self._filename):
+                match = r_segment.match(name)
+                if not match:
+                    continue
+                date = match.group(1)
+                filename = os.path.join(self._filename, name)
+                day_mtime = os.path.getmtime(filename)
+                if date in self._days and day_mtime == self._mtimes[date]:
+                    days[date] = self._days[date]
+                    continue
+                with open(filename, "rb") as segment:
+                    days[date] = pickle.load(segment)
+                self._mtimes[date] = day_mtime
+            self._days = days
+            self._mtime = mtime
+
+    def _save(self, dates):
+        """Writes the files of the given archived days."""
+        if not os.path.isdir(self._filename):
+            os.makedirs(self._filename)
+        for date in dates:
+            filename = os.path.join(self._filename, "%s.segment" % date)
+            utils.write_atomic(filename, pickle.dumps(
+                self._days[date], pickle.HIGHEST_PROTOCOL))
+            self._mtimes[date] = os.path.getmtime(filename)
+        self._mtime = os.path.getmtime(self._filename)
+
+
+def _index_day(date, directory):
+    day = open_storage(date, directory)
+    try:
+        cli = day.load()
+        if cli is None:
+            return None
+        # Include anything left in the journal.
+        cli.replay(day.pending(cli._seq))
+        cli._storage.close()
+    finally:
+        day.close()
+    segment = Segment(date)
+    segment.sync(cli.state)
+    return segment
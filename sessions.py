@@ -0,0 +1,144 @@
+import os
+import re
+import threading
+
+from cache import SnapshotCache
+from catalog import Catalog
+from checkpoint import CHECKPOINT_SECONDS
+
+# Where named sessions keep their days, a directory each.
+SESSIONS_DIRECTORY = "sessions"
+# The commands that may be run in a session from outside its own prompt.
+REMOTE_COMMANDS = ("addtask", "starttask", "stoptask", "M")
+
+# Kept to a single path component so a name can't reach outside
+# SESSIONS_DIRECTORY.
+r_name = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def session_directory(name):
+    """Returns the directory a named session keeps its days in, raises
+    ValueError if the name isn't allowed."""
+    if not r_name.match(name or ""):
+        raise ValueError("Session names may only use letters, digits, _ and "
+                         "-, up to 64 of them.")
+    return os.path.join(SESSIONS_DIRECTORY, name)
+
+
+class Session():
+    """A named TaskCLI along with the caches of its archived days."""
+    def __init__(self, name, cli):
+        self.name      = name
+        self.cli       = cli
+        self.catalog   = Catalog(directory=cli._directory)
+        self.snapshots = SnapshotCache(directory=cli._directory)
+
+    def run(self, line):
+        """run
+
+        Purpose: Runs one of the REMOTE_COMMANDS as if it had been typed at
+                 the session's prompt.
+
+        Params:  line - The command and its argument, e.g. "starttask a".
+
+        Returns: The DayState once the command has run. Raises ValueError
+                 for any other command.
+        """
+        # Imported here as TaskCLI imports this module.
+        from TaskCLI import simulate_cmd
+
+        command = self.cli.parseline(line)[0]
+        if command not in REMOTE_COMMANDS:
+            raise ValueError("Commands must be one of %s." %
+                             ", ".join(REMOTE_COMMANDS))
+        # Held across precmd() and postcmd() too, so that commands sent at
+        # the same time are timed separately.
+        with self.cli._command_lock:
+            simulate_cmd(self.cli, line)
+            return self.cli.state
+
+
+class SessionRegistry():
+    """The named sessions served by one process.
+
+    Each session is a TaskCLI keeping its days in its own directory under
+    SESSIONS_DIRECTORY, so sessions share nothing but the process. A
+    session is opened the first time it's asked for, carrying on from
+    anything stored for today, and is then kept running, restarting at
+    midnight and checkpointing its day just like the CLI's own TaskCLI.
+    """
+    def __init__(self, checkpoint=CHECKPOINT_SECONDS):
+        self._checkpoint = checkpoint
+        # name -> Session
+        self._sessions   = {}
+        self._lock       = threading.Lock()
+
+    def add(self, name, cli):
+        """Adds a TaskCLI that's already running, i.e. the process's own if
+        it was started in a session, so the session isn't opened twice."""
+        with self._lock:
+            self._sessions[name] = Session(name, cli)
+            return self._sessions[name]
+
+    def get(self, name):
+        """get
+
+        Purpose: Gets a session, opening it if it exists but isn't open yet.
+
+        Params:  name - The session's name.
+
+        Returns: The Session, or None if there isn't one by that name.
+        """
+        with self._lock:
+            session = self._sessions.get(name)
+            if session is not None:
+                return session
+            try:
+                directory = session_directory(name)
+            except ValueError:
+                return None
+            if not os.path.isdir(directory):
+                return None
+            return self._open(name, directory)
+
+    def create(self, name):
+        """create
+
+        Purpose: Creates a session, opening it straight away.
+
+        Params:  name - The session's name, see session_directory().
+
+        Returns: A tuple of (Session, True if it didn't already exist).
+                 Raises ValueError if the name isn't allowed.
+        """
+        directory = session_directory(name)
+        with self._lock:
+            session = self._sessions.get(name)
+            if session is not None:
+                return session, False
+            created = not os.path.isdir(directory)
+            if created:
+                os.makedirs(directory)
+            return self._open(name, directory), created
+
+    def names(self):
+        """Returns the names of the sessions, open or not, sorted."""
+        names = set()
+        if os.path.isdir(SESSIONS_DIRECTORY):
+            names.update(name for name in os.listdir(SESSIONS_DIRECTORY)
+                         if r_name.match(name) and
+                         os.path.isdir(session_directory(name)))
+        with self._lock:
+            names.update(self._sessions)
+        return sorted(names)
+
+    def _open(self, name, directory):
+        """Opens a session, must be called holding the lock."""
+        # Imported here as TaskCLI imports this module.
+        from TaskCLI import get_cli, host_cli
+
+        cli, msg = get_cli(resume=True, directory=directory)
+        cli._log("Opened session %s" % name)
+        host_cli(cli, self._checkpoint)
+        self._sessions[name] = Session(name, cli)
+        return self._sessions[name]
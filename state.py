@@ -0,0 +1,220 @@
+class DayState(object):
+    """An immutable, versioned view of a TaskCLI's day for other threads.
+
+    The CLI thread publishes a new DayState after every command that changes
+    anything, and readers (the web server's request threads) just pick up
+    whichever was published last, so they never need a lock and never see
+    a command half applied. States are copy-on-write: each one shares the
+    TaskStates of every task the command didn't touch with the one before.
+
+    It offers the same read methods as TaskCLI (get_tasks, get_task and
+    messages) so it can be used in its place.
+    """
+    __slots__ = ("version", "seq", "date", "current", "messages", "_tasks",
+                 "_children", "_roots", "intervals")
+
+    def __init__(self, version, seq, date, current, messages, tasks,
+                 children, roots, intervals=None):
+        self.version   = version
+        # The sequence number of the last command included.
+        self.seq       = seq
+        self.date      = date
+        # The name of the current task, or None.
+        self.current   = current
+        self.messages  = messages
+        # Task name -> TaskState.
+        self._tasks    = tasks
+        # Parent task name -> tuple of child task names.
+        self._children = children
+        # Tuple of the top level task names.
+        self._roots    = roots
+        # The day's stopped timers as an IntervalIndex frozen when the state
+        # was published.
+        self.intervals = intervals
+
+    @classmethod
+    def build(cls, cli, version):
+        """Builds the state of a TaskCLI from scratch."""
+        tasks = dict((name, TaskState(task)) for name, task in
+                     cli._tasks.items())
+        children = dict((name, tuple(child.name for child in kids)) for
+                        name, kids in cli._children.items())
+        roots = tuple(task.name for task in cli._roots)
+        return cls(version, cli._seq, cli.date, _name(cli._current_task),
+                   MessageState(cli.messages), tasks, children, roots,
+                   cli._intervals.frozen())
+
+    def update(self, cli, version, changed):
+        """update
+
+        Purpose: Gets the state following a command, copying only what the
+                 command changed.
+
+        Params:  cli     - The TaskCLI, after the command has been run.
+                 version - The version of the new state.
+                 changed - The Tasks the command changed.
+
+        Returns: The new DayState.
+        """
+        tasks    = self._tasks
+        children = self._children
+        roots    = self._roots
+        if changed:
+            tasks = dict(tasks)
+            for task in changed:
+                if task.name not in tasks:
+                    # A new task, so its parent's children have changed.
+                    if task.parent:
+                        children = dict(children)
+                        children[task.parent.name] = tuple(
+                            child.name for child in
+                            cli._children[task.parent.name])
+                    else:
+                        roots = roots + (task.name,)
+                tasks[task.name] = TaskState(task)
+        return DayState(version, cli._seq, cli.date,
+                        _name(cli._current_task), MessageState(cli.messages),
+                        tasks, children, roots, cli._intervals.frozen())
+
+    def get_tasks(self, status=None, parent=None):
+        if parent:
+            if parent == "None":
+                names = self._roots
+            else:
+                names = self._children.get(parent.name, ())
+            tasks = [self._tasks[name] for name in names]
+        else:
+            tasks = self._tasks.values()
+
+        if status:
+            return [task for task in tasks if task.status == status]
+        return list(tasks)
+
+    def get_task(self, name):
+        """Returns the TaskState of the given name, or None."""
+        return self._tasks.get(name)
+
+
+class TaskState(object):
+    """A Task as it was when its DayState was published."""
+    __slots__ = ("name", "parent_name", "status", "_timers", "_own_total")
+
+    def __init__(self, task):
+        self.name        = task.name
+        self.parent_name = _name(task.parent)
+        self.status      = task.status
+        self._timers     = task._timers.copy()
+        self._own_total  = task._own_total
+
+    @property
+    def parent(self):
+        """The parent's name, so that it can be tested like Task.parent."""
+        return self.parent_name
+
+    @property
+    def timers(self):
+        return list(self._timers)
+
+    @property
+    def stopped_seconds(self):
+        """The seconds spent on this task's stopped timers."""
+        return self._own_total
+
+    @property
+    def running_since(self):
+        """When the running timer was started, or None if not running."""
+        if not self._timers.running:
+            return None
+        return self._timers.interval(len(self._timers) - 1)[0]
+
+    def intervals(self):
+        """Returns the (start, stop) of each timer, stop is None if running."""
+        return [self._timers.interval(ii) for ii in xrange(len(self._timers))]
+
+    def own_seconds(self, now=None):
+        """Returns the seconds spent on this task, excluding sub tasks."""
+        return self._own_total + self._timers.running_seconds(now)
+
+
+class MessageState(object):
+    """The messages logged up to when a DayState was published.
+
+    A MessageLog is only ever appended to, so rather than copying it this
+    remembers how long it was and hides anything logged since.
+    """
+    __slots__ = ("_log", "_count")
+
+    def __init__(self, log):
+        self._log   = log
+        self._count = len(log)
+
+    def page(self, before=None, limit=50, tasks=None):
+        """Same as MessageLog.page()."""
+        if before is None or before > self._count:
+            before = self._count
+        return self._log.page(before=before, limit=limit, tasks=tasks)
+
+    def between(self, start, stop):
+        """Same as MessageLog.between()."""
+        return self._log.between(start, min(stop, self._count))
+
+    def __len__(self):
+        return self._count
+
+    def __nonzero__(self):
+        return self._count > 0
+
+    def __getitem__(self, seq):
+        if seq < 0:
+            seq += self._count
+        if not 0 <= seq < self._count:
+            raise IndexError("message index out of range")
+        return self._log[seq]
+
+
+def changes(old, new):
+    """changes
+
+    Works out what happened between two DayStates.
+
+    Params:  old - The earlier DayState.
+             new - The later DayState.
+
+    Returns: A list of (event, data) tuples, the event being "day" when a
+             new day has been started, "started" or "stopped" for a task
+             and "message" for a message logged. Tasks started and stopped
+             in between are included even if the states don't show them
+             running.
+    """
+    events = []
+    if new.date != old.date:
+        events.append(("day", {"day": new.date}))
+        old = DayState(0, 0, new.date, None, MessageState([]), {}, {}, ())
+
+    timers = []
+    for name, task in new._tasks.items():
+        before = old._tasks.get(name)
+        # Copy-on-write, so an unchanged task is the very same TaskState.
+        if task is before:
+            continue
+        running = before.running_since if before else None
+        seen = len(before._timers) if before else 0
+        if running is not None:
+            # The timer that was running then has only stopped since.
+            seen -= 1
+        for start, stop in task.intervals()[seen:]:
+            if start != running:
+                timers.append((start, "started", {"task": name, "at": start}))
+            if stop is not None:
+                timers.append((stop, "stopped", {"task": name, "at": stop,
+                                                 "seconds": stop - start}))
+    events.extend((event, data) for at, event, data in sorted(timers))
+
+    for seq in xrange(len(old.messages), len(new.messages)):
+        time, task, message = new.messages[seq]
+        events.append(("message", {"time": time, "task": task,
+                                   "message": message}))
+    return events
+
+def _name(task):
+    return task.name if task else None
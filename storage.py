@@ -0,0 +1,463 @@
+import os
+import pickle
+import threading
+
+import utils
+from catalog import r_file
+from metrics import timed, storage_seconds
+from journal import Journal, read_journal
+
+# Which backend open_storage() uses, either "pickle" or "sqlite".
+BACKEND = "pickle"
+BACKENDS = ("pickle", "sqlite")
+
+SQLITE_FILENAME = "taskcli.db"
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS days (
+    day     TEXT PRIMARY KEY,
+    seq     INTEGER NOT NULL DEFAULT 0,
+    current TEXT,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    day    TEXT NOT NULL,
+    name   TEXT NOT NULL,
+    parent TEXT,
+    PRIMARY KEY (day, name)
+);
+CREATE INDEX IF NOT EXISTS tasks_parent ON tasks (day, parent);
+CREATE TABLE IF NOT EXISTS timers (
+    id    INTEGER PRIMARY KEY,
+    day   TEXT NOT NULL,
+    task  TEXT NOT NULL,
+    start REAL NOT NULL,
+    stop  REAL
+);
+CREATE INDEX IF NOT EXISTS timers_day_task ON timers (day, task);
+CREATE INDEX IF NOT EXISTS timers_task_day ON timers (task, day);
+CREATE TABLE IF NOT EXISTS messages (
+    id      INTEGER PRIMARY KEY,
+    day     TEXT NOT NULL,
+    time    TEXT NOT NULL,
+    task    TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_day_task ON messages (day, task);
+"""
+
+
+class PickleStorage():
+    """Keeps a day as a DD-MM-YYYY.p snapshot plus a journal of commands.
+
+    Every command is appended to the journal, and once COMPACT_EVERY
+    records have built up the whole day is snapshotted again so that
+    replaying the journal stays quick. When the day is being checkpointed
+    the changes since the snapshot are appended to DD-MM-YYYY.checkpoint
+    instead, each checkpoint relative to the one before, and the journal is
+    just trimmed of what they cover.
+    """
+    # Number of journal records after which a fresh snapshot is due.
+    COMPACT_EVERY = 1000
+
+    def __init__(self, date, directory=""):
+        self._date      = date
+        self._directory = directory
+        self._filename  = os.path.join(directory, "%s.p" % date)
+        self._checkpoint_filename = os.path.join(directory,
+                                                 "%s.checkpoint" % date)
+        self._journal   = Journal(date, directory)
+        # The seq of the last checkpoint written, and of the last the
+        # journal was trimmed to.
+        self._checkpointed = 0
+        self._trimmed      = 0
+
+    def exists(self):
+        """Returns True if anything has been stored for the day."""
+        return (os.path.isfile(self._filename) or
+                os.path.isfile(self._checkpoint_filename) or
+                len(self._journal) > 0)
+
+    @timed(storage_seconds, "pickle_load")
+    def load(self):
+        """Returns the day's snapshotted TaskCLI, with its checkpoint
+        applied, or None if there isn't one. Commands journalled since are
+        returned by pending()."""
+        cli = None
+        if os.path.isfile(self._filename):
+            with open(self._filename, "rb") as snapshot:
+                cli = pickle.load(snapshot)
+
+        for data in self._read_checkpoints():
+            # Skips any left from before the snapshot, chained on to an
+            # older one.
+            if data["base_seq"] != (cli._seq if cli else 0):
+                continue
+            if cli is None:
+                # Imported here as TaskCLI imports this module.
+                from TaskCLI import restore_cli
+                cli = restore_cli(self._date, [], [], [],
+                                  directory=self._directory)
+            cli.apply_checkpoint(data)
+        return cli
+
+    def pending(self, seq):
+        """Returns the journal records after the given sequence number."""
+        return (record for record in read_journal(self._date,
+                                                  self._directory)
+                if record[0] > seq)
+
+    @timed(storage_seconds, "pickle_record")
+    def record(self, cli, seq, timestamp, command, argument, task):
+        """record
+
+        Purpose: Stores the effect of a single command.
+
+        Params:  cli       - The TaskCLI, after the command has been run.
+                 seq       - The sequence number of the command.
+                 timestamp - When the command was run.
+                 command   - The name of the command, e.g. "addtask".
+                 argument  - The argument it was run with.
+                 task      - The Task the command acted on, if any.
+
+        Returns: Nothing.
+        """
+        self._journal.append(seq, timestamp, command, argument)
+
+    def compaction_due(self):
+        """Returns True once the day should be saved in full again."""
+        return len(self._journal) >= self.COMPACT_EVERY
+
+    @timed(storage_seconds, "pickle_checkpoint")
+    def checkpoint(self, data):
+        """checkpoint
+
+        Purpose: Stores the changes made since the last checkpoint, or since
+                 the day was last saved in full. Called from the
+                 checkpointing thread, see checkpoint.py.
+
+        Params:  data - A dict of the "day", the "seq" of the last command
+                        included, the "base_seq" of the checkpoint or saved
+                        day it's relative to, the "current" task name, the
+                        changed "tasks" as (name, parent name, status,
+                        TimerStore) tuples, and the "messages" logged since,
+                        numbered from "messages_from".
+
+        Returns: Nothing.
+        """
+        if data["day"] != self._date:
+            return
+        record = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        if data["base_seq"] != self._checkpointed:
+            # Relative to the saved day, so it replaces any checkpoints
+            # written before.
+            utils.write_atomic(self._checkpoint_filename, record)
+        else:
+            with open(self._checkpoint_filename, "ab") as checkpoints:
+                checkpoints.write(record)
+                checkpoints.flush()
+                os.fsync(checkpoints.fileno())
+        self._checkpointed = data["seq"]
+
+    def trim(self):
+        """Drops the journal records covered by the last checkpoint, in
+        place of saving the whole day."""
+        seq = self._checkpointed
+        if seq > self._trimmed:
+            self._journal.trim(seq)
+            self._trimmed = seq
+
+    @timed(storage_seconds, "pickle_save")
+    def save(self, cli):
+        """Saves the whole day, replacing anything stored before."""
+        utils.write_atomic(self._filename,
+                           pickle.dumps(cli, pickle.HIGHEST_PROTOCOL))
+        self._remove_checkpoint()
+        self._journal.truncate()
+
+    def discard(self):
+        """Throws away everything stored for the day, the snapshot included,
+        so that a fresh start's journal isn't replayed onto the old day."""
+        if os.path.isfile(self._filename):
+            os.remove(self._filename)
+        self._remove_checkpoint()
+        self._journal.truncate()
+
+    def stat(self):
+        """Returns a (version, size in bytes) tuple for the saved day, raises
+        OSError if it hasn't been saved."""
+        stat = os.stat(self._filename)
+        return stat.st_mtime, stat.st_size
+
+    def close(self):
+        self._journal.close()
+
+    def _read_checkpoints(self):
+        """Yields the checkpoints written since the snapshot, oldest first,
+        stopping at one left partly written."""
+        if not os.path.isfile(self._checkpoint_filename):
+            return
+        with open(self._checkpoint_filename, "rb") as checkpoints:
+            while True:
+                try:
+                    data = pickle.load(checkpoints)
+                except Exception:
+                    # The end of the file, or a checkpoint torn by a crash.
+                    return
+                yield data
+
+    def _remove_checkpoint(self):
+        if os.path.isfile(self._checkpoint_filename):
+            os.remove(self._checkpoint_filename)
+        self._checkpointed = 0
+        self._trimmed      = 0
+
+
+class SQLiteStorage():
+    """Keeps days in an SQLite database, in WAL mode.
+
+    Tasks, timers and messages each have a table keyed on the day, and each
+    command is written as it happens so there is nothing to replay. Days
+    are stored as YYYY-MM-DD so that ranges of days can use the indexes.
+    """
+    # Rough in-memory size of a row, used to estimate the size of a day.
+    ROW_BYTES = 100
+
+    def __init__(self, date, filename=SQLITE_FILENAME, directory=""):
+        self._date      = date
+        self._day       = to_iso(date) if date else None
+        self._directory = directory
+        self._filename  = os.path.join(directory, filename)
+        self._db        = None
+        self._lock      = threading.Lock()
+
+    def exists(self):
+        with self._lock:
+            return self._day_row() is not None
+
+    @timed(storage_seconds, "sqlite_load")
+    def load(self):
+        """Returns the day's TaskCLI, or None if nothing has been stored."""
+        # Imported here as TaskCLI imports this module.
+        from TaskCLI import restore_cli
+
+        with self._lock:
+            row = self._day_row()
+            if row is None:
+                return None
+            seq, current = row
+            db = self._connect()
+            tasks = db.execute("SELECT name, parent FROM tasks WHERE day = ? "
+                               "ORDER BY rowid", (self._day,)).fetchall()
+            timers = db.execute("SELECT task, start, stop FROM timers "
+                                "WHERE day = ? ORDER BY id",
+                                (self._day,)).fetchall()
+            messages = db.execute("SELECT time, task, message FROM messages "
+                                  "WHERE day = ? ORDER BY id",
+                                  (self._day,)).fetchall()
+
+        return restore_cli(date=self._date,
+                           tasks=tasks,
+                           timers=timers,
+                           messages=[tuple(m) for m in messages],
+                           seq=seq,
+                           current=current,
+                           directory=self._directory)
+
+    def pending(self, seq):
+        # Every command is written as it happens.
+        return iter([])
+
+    @timed(storage_seconds, "sqlite_record")
+    def record(self, cli, seq, timestamp, command, argument, task):
+        with self._lock:
+            db = self._connect()
+            with db:
+                if command == "addtask":
+                    db.execute("INSERT INTO tasks (day, name, parent) "
+                               "VALUES (?, ?, ?)",
+                               (self._day, task.name,
+                                task.parent.name if task.parent else None))
+                elif command == "starttask":
+                    db.execute("INSERT INTO timers (day, task, start) "
+                               "VALUES (?, ?, ?)",
+                               (self._day, task.name, timestamp))
+                elif command == "stoptask":
+                    db.execute("UPDATE timers SET stop = ? WHERE day = ? AND "
+                               "task = ? AND stop IS NULL",
+                               (timestamp, self._day, task.name))
+                elif command == "M":
+                    db.execute("INSERT INTO messages (day, time, task, "
+                               "message) VALUES (?, ?, ?, ?)",
+                               (self._day,) + tuple(cli.messages[-1]))
+                self._touch(db, seq, cli._current_task)
+
+    def compaction_due(self):
+        return False
+
+    def checkpoint(self, data):
+        # Every command is written as it happens.
+        pass
+
+    def trim(self):
+        pass
+
+    @timed(storage_seconds, "sqlite_save")
+    def save(self, cli):
+        with self._lock:
+            db = self._connect()
+            with db:
+                self._delete(db)
+                db.executemany("INSERT INTO tasks (day, name, parent) "
+                               "VALUES (?, ?, ?)",
+                               [(self._day, task.name,
+                                 task.parent.name if task.parent else None)
+                                for task in _parents_first(cli._tasks)])
+                db.executemany("INSERT INTO timers (day, task, start, stop) "
+                               "VALUES (?, ?, ?, ?)",
+                               [(self._day, task.name) +
+                                task._timers.interval(ii)
+                                for task in cli._tasks.values()
+                                for ii in xrange(len(task._timers))])
+                db.executemany("INSERT INTO messages (day, time, task, "
+                               "message) VALUES (?, ?, ?, ?)",
+                               [(self._day,) + tuple(message)
+                                for message in cli.messages])
+                self._touch(db, cli._seq, cli._current_task)
+
+    def discard(self):
+        """Throws away everything stored for the day, as PickleStorage
+        does."""
+        with self._lock:
+            db = self._connect()
+            with db:
+                self._delete(db)
+                db.execute("DELETE FROM days WHERE day = ?", (self._day,))
+
+    def stat(self):
+        with self._lock:
+            db = self._connect()
+            row = db.execute("SELECT version FROM days WHERE day = ?",
+                             (self._day,)).fetchone()
+            if row is None:
+                raise IOError("Nothing stored for %s" % self._date)
+            rows = 0
+            for table in ("tasks", "timers", "messages"):
+                rows += db.execute("SELECT COUNT(*) FROM %s WHERE day = ?" %
+                                   table, (self._day,)).fetchone()[0]
+        return row[0], rows * self.ROW_BYTES
+
+    def summaries(self, start, end):
+        """summaries
+
+        Purpose: Totals the time spent on each task for each day in a range
+                 with a single indexed query.
+
+        Params:  start - The first day, as DD-MM-YYYY.
+                 end   - The last day, as DD-MM-YYYY.
+
+        Returns: A generator of (date, {task name: seconds}) tuples.
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT day, task, SUM(stop - start) FROM timers "
+                "WHERE day >= ? AND day <= ? AND stop IS NOT NULL "
+                "GROUP BY day, task ORDER BY day",
+                (to_iso(start), to_iso(end))).fetchall()
+
+        day, tasks = None, {}
+        for row_day, task, seconds in rows:
+            if row_day != day and tasks:
+                yield from_iso(day), tasks
+                tasks = {}
+            day = row_day
+            tasks[task] = seconds
+        if tasks:
+            yield from_iso(day), tasks
+
+    def close(self):
+        with self._lock:
+            if self._db:
+                self._db.close()
+                self._db = None
+
+    def _connect(self):
+        if not self._db:
+            # Only imported when it's needed as it's slow to import.
+            import sqlite3
+            self._db = sqlite3.connect(self._filename,
+                                       check_same_thread=False)
+            self._db.text_factory = str
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SQLITE_SCHEMA)
+        return self._db
+
+    def _day_row(self):
+        return self._connect().execute(
+            "SELECT seq, current FROM days WHERE day = ?",
+            (self._day,)).fetchone()
+
+    def _touch(self, db, seq, current_task):
+        db.execute("INSERT OR IGNORE INTO days (day) VALUES (?)",
+                   (self._day,))
+        db.execute("UPDATE days SET seq = ?, current = ?, "
+                   "version = version + 1 WHERE day = ?",
+                   (seq, current_task.name if current_task else None,
+                    self._day))
+
+    def _delete(self, db):
+        for table in ("tasks", "timers", "messages"):
+            db.execute("DELETE FROM %s WHERE day = ?" % table, (self._day,))
+
+
+def open_storage(date, directory=""):
+    """Returns the storage for a day using the configured BACKEND, kept in
+    a directory which defaults to the working directory."""
+    if BACKEND == "sqlite":
+        return SQLiteStorage(date, directory=directory)
+    return PickleStorage(date, directory)
+
+def migrate_pickles(directory=""):
+    """migrate_pickles
+
+    Imports every DD-MM-YYYY.p snapshot in a directory into that
+    directory's SQLite database, replacing whatever it held for those days.
+
+    Params:  directory - The directory, defaults to the working directory.
+
+    Returns: The number of days imported.
+    """
+    imported = 0
+    for filename in sorted(os.listdir(directory or ".")):
+        if not r_file.match(filename):
+            continue
+        date = filename[:-2]
+        pickled = PickleStorage(date, directory)
+        try:
+            cli = pickled.load()
+            # Include anything left in the journal.
+            cli.replay(pickled.pending(cli._seq))
+            cli._storage.close()
+            cli._close_logfile()
+        finally:
+            pickled.close()
+        storage = SQLiteStorage(date, directory=directory)
+        storage.save(cli)
+        storage.close()
+        imported += 1
+    return imported
+
+def to_iso(date):
+    """Converts DD-MM-YYYY to YYYY-MM-DD."""
+    day, month, year = date.split("-")
+    return "%s-%s-%s" % (year, month, day)
+
+def from_iso(day):
+    """Converts YYYY-MM-DD to DD-MM-YYYY."""
+    year, month, date = day.split("-")
+    return "%s-%s-%s" % (date, month, year)
+
+def _parents_first(tasks):
+    # Task names include their parents' so sorting puts parents first.
+    return [tasks[name] for name in sorted(tasks, key=lambda x: x.count("-"))]
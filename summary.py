@@ -0,0 +1,60 @@
+import json
+import os
+
+import utils
+
+
+def summary_filename(date, directory=""):
+    return os.path.join(directory, "%s.summary.json" % date)
+
+def summarize(cli):
+    """summarize
+
+    Works out the summary of a day, small enough to be read back for
+    listings and reports instead of the full snapshot.
+
+    Params:  cli - The TaskCLI holding the day.
+
+    Returns: A dict of the "day", the "seq" of the last command included,
+             the number of "messages", the "roots" (names of the top level
+             tasks) and the "tasks", a dict of task name to the task's
+             "parent", "own" and "subtree" seconds, number of "timers" and
+             number of "messages", and the "hours", a dict of task name to
+             the seconds spent in each hour of the day, see
+             rollups.task_hours().
+    """
+    # Imported here as rollups imports this module.
+    from rollups import task_hours
+
+    tasks = {}
+    for name, task in cli._tasks.items():
+        tasks[name] = {"parent":   task.parent.name if task.parent else None,
+                       "own":      task.own_seconds(),
+                       "subtree":  task.subtree_seconds(),
+                       "timers":   len(task._timers),
+                       "messages": cli.messages.count(name)}
+    return {"day":      cli.date,
+            "seq":      cli._seq,
+            "messages": len(cli.messages),
+            "roots":    [task.name for task in cli._roots],
+            "tasks":    tasks,
+            "hours":    task_hours(cli.date, cli._tasks.values())}
+
+def write_summary(summary, directory=""):
+    """Writes a day's summary to its sidecar file, atomically."""
+    utils.write_atomic(summary_filename(summary["day"], directory),
+                       json.dumps(summary, sort_keys=True))
+
+def read_summary(date, directory=""):
+    """Returns a day's summary, or None if it doesn't have one."""
+    try:
+        with open(summary_filename(date, directory), "rb") as sidecar:
+            return json.load(sidecar)
+    except (IOError, ValueError):
+        return None
+
+def summary_totals(summary):
+    """Returns a (number of timers, total seconds) tuple for a summary."""
+    tasks = summary["tasks"].values()
+    return (sum(task["timers"] for task in tasks),
+            sum(task["own"] for task in tasks))
@@ -1,20 +1,169 @@
-import logging
-
-def get_logger(name):
-    log = logging.getLogger(name=name)
-    log.setLevel(logging.DEBUG)
-    formatter = logging.Formatter('%(levelname).05s:%(name)s:%(message)s')
-
-    handler_stream = logging.StreamHandler()
-    handler_stream.setFormatter(formatter)
-    handler_stream.setLevel(logging.WARNING)
-
-    handler_file = logging.FileHandler('main.log')
-    handler_file.setFormatter(formatter)
-
-    log.addHandler(handler_stream)
-    log.addHandler(handler_file)
-
-    return log
-
-
+import atexit
+import logging
+import os
+import Queue
+import tempfile
+import threading
+import time
+import weakref
+
+# Every LogWriter that hasn't been closed, so they can be flushed on exit.
+_writers = weakref.WeakSet()
+# The handler for main.log, shared by every logger from get_logger.
+_handler_file = None
+
+def get_logger(name):
+    global _handler_file
+    log = logging.getLogger(name=name)
+    if log.handlers:
+        # Already set up.
+        return log
+    log.setLevel(logging.DEBUG)
+    formatter = logging.Formatter('%(levelname).05s:%(name)s:%(message)s')
+
+    handler_stream = logging.StreamHandler()
+    handler_stream.setFormatter(formatter)
+    handler_stream.setLevel(logging.WARNING)
+
+    if _handler_file is None:
+        _handler_file = LogWriterHandler(LogWriter('main.log'))
+        _handler_file.setFormatter(formatter)
+
+    log.addHandler(handler_stream)
+    log.addHandler(_handler_file)
+
+    return log
+
+
+class LogWriter(object):
+    """Writes to a log file from a background thread.
+
+    Text passed to write() is queued and the writer thread writes it out
+    in batches, once BATCH_SIZE writes have built up or FLUSH_INTERVAL
+    seconds have passed since the first. When the file grows past
+    max_bytes it is rotated to <filename>.1, <filename>.2 and so on.
+    """
+    BATCH_SIZE     = 64
+    FLUSH_INTERVAL = 0.5
+
+    # Put on the queue to tell the writer thread to finish.
+    _STOP = object()
+
+    def __init__(self, filename, max_bytes=5 * 1024 * 1024, backups=3):
+        self._filename  = filename
+        self._max_bytes = max_bytes
+        self._backups   = backups
+        self._queue     = Queue.Queue()
+        self._thread    = threading.Thread(target=self._run,
+                                           name="LogWriter-%s" % filename)
+        self._thread.daemon = True
+        self._thread.start()
+        _writers.add(self)
+
+    def write(self, text):
+        """Queues text to be written, returns without waiting for disk."""
+        self._queue.put(text)
+
+    def close(self):
+        """Writes out anything queued and stops the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        _writers.discard(self)
+
+    def _run(self):
+        logfile = open(self._filename, "a")
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.time() + self.FLUSH_INTERVAL
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(
+                        timeout=max(deadline - time.time(), 0)))
+                except Queue.Empty:
+                    break
+            if self._STOP in batch:
+                batch = batch[:batch.index(self._STOP)]
+                stopping = True
+
+            logfile.write("".join(batch))
+            logfile.flush()
+            if logfile.tell() > self._max_bytes:
+                logfile.close()
+                self._rotate()
+                logfile = open(self._filename, "a")
+        logfile.close()
+
+    def _rotate(self):
+        for ii in range(self._backups - 1, 0, -1):
+            older = "%s.%d" % (self._filename, ii)
+            if os.path.isfile(older):
+                replace_file(older, "%s.%d" % (self._filename, ii + 1))
+        replace_file(self._filename, self._filename + ".1")
+
+
+class LogWriterHandler(logging.Handler):
+    """Logging handler that writes records through a LogWriter."""
+    def __init__(self, writer):
+        logging.Handler.__init__(self)
+        self._writer = writer
+
+    def emit(self, record):
+        try:
+            self._writer.write(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self._writer.close()
+        logging.Handler.close(self)
+
+
+@atexit.register
+def _close_writers():
+    for writer in list(_writers):
+        writer.close()
+
+
+
+def write_atomic(filename, data):
+    """write_atomic
+
+    Writes data to a file such that readers see either the old contents or
+    the new, never a partial write.
+
+    Params:  filename - The file to write.
+             data     - The string to write to it.
+
+    Returns: Nothing.
+    """
+    # Named uniquely so that writers of the same file can't share it.
+    fd, temp = tempfile.mkstemp(prefix=os.path.basename(filename) + ".",
+                                suffix=".tmp",
+                                dir=os.path.dirname(filename) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp() only lets the owner read it.
+        try:
+            mode = os.stat(filename).st_mode & 0777
+        except OSError:
+            mode = 0644
+        os.chmod(temp, mode)
+        replace_file(temp, filename)
+    except:
+        if os.path.isfile(temp):
+            os.remove(temp)
+        raise
+
+def replace_file(source, destination):
+    """Renames source to destination, replacing destination if it exists."""
+    try:
+        os.rename(source, destination)
+    except OSError:
+        # Windows won't rename over an existing file.
+        os.remove(destination)
+        os.rename(source, destination)